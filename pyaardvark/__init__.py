@@ -19,5 +19,12 @@ try:
 except ImportError:
     __version__ = 'dev'
 
-from .aardvark import api_version, find_devices, open, Aardvark
+from .aardvark import api_version, find_devices, enumerate_devices, open, \
+        Aardvark, ThreadSafeAardvark, DeviceInfo
+from .batch import I2CBatch, I2CBatchResult, I2CWriteReadResult
+from .profile import Profile, ProfileResult
+from .pool import DevicePool, DeviceResult, PoolResult
+from .registry import DeviceEvent, DeviceRegistry, DeviceWatcher
+from .resilient import ReconnectPolicy, ResilientAardvark
 from .constants import *
+from .errors import *
@@ -17,48 +17,145 @@
 
 from builtins import bytes
 import array
+import functools
 import logging
+import threading
+import time
 
 from .constants import *
 from .constants import *
+from . import ext
+from .batch import I2CBatch, I2CWriteReadResult, _write_read
+from .errors import error_from_code
+from .metrics import DEFAULT_BUCKETS, Metrics, _instrument, _uninstrument
+from .profile import Profile
 from .ext import api
 
 log = logging.getLogger(__name__)
 
 def _raise_error_if_negative(val):
-    """Raises an :class:`IOError` if `val` is negative."""
+    """Raises an :class:`AardvarkError` if `val` is negative.
+
+    The message is the name of the error code, so it doesn't depend on the
+    binding of the device.
+    """
     if val < 0:
-        raise IOError(val, api.py_aa_status_string(val))
+        raise error_from_code(val)
 
 def status_string(code):
-    for k, v in globals().items():
-        if k.startswith('I2C_STATUS_') and v == code:
-            return k
-    return 'I2C_STATUS_UNKNOWN_STATUS'
+    return I2C_STATUS_NAMES.get(code, 'I2C_STATUS_UNKNOWN_STATUS')
 
 
 def _raise_i2c_status_code_error_if_failure(code):
-    """Raises an :class:`IOError` if `code` is not :data:`I2C_STATUS_OK`."""
+    """Raises an :class:`AardvarkError` if `code` is not
+    :data:`I2C_STATUS_OK`."""
     if code != I2C_STATUS_OK:
-        raise IOError(code, status_string(code))
+        _raise_error_if_negative(code)
+        raise error_from_code(code)
+
+_BYTE_FORMATS = ('B', 'b', 'c')
+
+def _to_buffer(data):
+    """Return `data` in a form which can be passed to the binding.
+
+    The binding expects writable buffers, even for the data which is only
+    transmitted. Therefore, writable byte buffers (eg. :class:`bytearray`,
+    :class:`memoryview`, :class:`mmap.mmap` or numpy arrays of bytes) are
+    passed as is, all other objects are copied into an
+    :class:`array.array`. Buffers of larger items are converted item by
+    item, like any other sequence of byte values.
+    """
+    if type(data) is bytearray or (type(data) is array.array
+            and data.itemsize == 1):
+        return data
+    try:
+        view = memoryview(data)
+    except TypeError:
+        return array.array('B', data)
+    if view.format not in _BYTE_FORMATS:
+        return array.array('B', data)
+    if view.readonly or not view.c_contiguous:
+        buf = array.array('B')
+        buf.frombytes(view.tobytes())
+        return buf
+    if view.format != 'B' or view.ndim != 1:
+        view = view.cast('B')
+    return view
+
+def _writable_buffer(buf):
+    """Return the writable byte buffer `buf` in a form which can be passed
+    to the binding to receive data.
+
+    Raises a :class:`TypeError` if `buf` isn't a writable buffer of bytes,
+    because the received data would be lost in a copy.
+    """
+    if type(buf) is bytearray:
+        return buf
+    try:
+        view = memoryview(buf)
+    except TypeError:
+        raise TypeError('a writable bytes-like object is required, not %r'
+                % type(buf).__name__)
+    if view.readonly:
+        raise TypeError('buffer of %r object is read-only'
+                % type(buf).__name__)
+    if view.format not in _BYTE_FORMATS or not view.c_contiguous:
+        raise TypeError('buffer of %r object is no contiguous buffer of '
+                'bytes' % type(buf).__name__)
+    if view.format != 'B' or view.ndim != 1:
+        view = view.cast('B')
+    return view
 
 def _unique_id_str(unique_id):
-    id1 = unique_id / 1000000
-    id2 = unique_id % 1000000
-    return '%04d-%06d' % (id1, id2)
+    return '%04d-%06d' % divmod(unique_id, 1000000)
+
+def _unique_id_from_str(serial_number):
+    try:
+        id1, id2 = serial_number.split('-')
+        return int(id1) * 1000000 + int(id2)
+    except (AttributeError, ValueError):
+        return None
 
 def _to_version_str(v):
     return '%d.%02d' % (v >> 8, v & 0xff)
 
-def api_version():
+def _get_api(backend):
+    if backend is None:
+        return api
+    elif isinstance(backend, str):
+        return ext.load_backend(backend)
+    return backend
+
+def api_version(backend=None):
     """Returns the underlying C module (aardvark.so, aardvark.pyd) as a string.
 
     It returns the same value as :attr:`Aardvark.api_version` but you don't
     need to open a device.
     """
-    return _to_version_str(api.py_version() & 0xffff)
+    return _to_version_str(_get_api(backend).py_version() & 0xffff)
+
+def _enumerate(api):
+    """Return the arrays of ports and unique IDs of all attached devices."""
+    # first fetch the number of attached devices, so we can create a buffer
+    # with the exact amount of entries. api expects array of u16
+    num_devices = api.py_aa_find_devices(0, array.array('H'))
+    _raise_error_if_negative(num_devices)
+
+    # return empty arrays if no device is connected
+    if num_devices == 0:
+        return (array.array('H'), array.array('I'))
 
-def find_devices():
+    ports = array.array('H', (0,) * num_devices)
+    unique_ids = array.array('I', (0,) * num_devices)
+    num_devices = api.py_aa_find_devices_ext(len(ports), len(unique_ids),
+            ports, unique_ids)
+    _raise_error_if_negative(num_devices)
+
+    del ports[num_devices:]
+    del unique_ids[num_devices:]
+    return (ports, unique_ids)
+
+def find_devices(backend=None):
     """Return a list of dictionaries. Each dictionary represents one device.
 
     The dictionary contains the following keys: port, unique_id and in_use.
@@ -77,40 +174,85 @@ def find_devices():
 
        To open a device by its serial number, you should use the :func:`open`
        with the `serial_number` parameter.
+
+    `backend` selects the binding which is used to enumerate the devices. See
+    :func:`open`.
+
+    See :func:`enumerate_devices` for a more lightweight variant.
     """
+    return [d.to_dict() for d in enumerate_devices(backend)]
 
-    # first fetch the number of attached devices, so we can create a buffer
-    # with the exact amount of entries. api expects array of u16
-    num_devices = api.py_aa_find_devices(0, array.array('H'))
-    _raise_error_if_negative(num_devices)
+def enumerate_devices(backend=None):
+    """Return a list of :class:`DeviceInfo` objects, one for each device.
 
-    # return an empty list if no device is connected
-    if num_devices == 0:
-        return list()
+    Same as :func:`find_devices`, but the records are smaller than
+    dictionaries and the serial number strings are only formatted when they
+    are accessed.
+    """
+    ports, unique_ids = _enumerate(_get_api(backend))
+    return [DeviceInfo(port & ~PORT_NOT_FREE, uid, bool(port & PORT_NOT_FREE))
+            for port, uid in zip(ports, unique_ids)]
 
-    ports = array.array('H', (0,) * num_devices)
-    unique_ids = array.array('I', (0,) * num_devices)
-    num_devices = api.py_aa_find_devices_ext(len(ports), len(unique_ids),
-            ports, unique_ids)
-    _raise_error_if_negative(num_devices)
-    if num_devices == 0:
-        return list()
+class DeviceInfo(object):
+    """A device returned by :func:`enumerate_devices`.
 
-    del ports[num_devices:]
-    del unique_ids[num_devices:]
+    For compatibility with :func:`find_devices`, the attributes can also be
+    accessed as items, eg. ``info['serial_number']``.
+    """
 
-    devices = list()
-    for port, uid in zip(ports, unique_ids):
-        in_use = bool(port & PORT_NOT_FREE)
-        dev = dict(
-                port=port & ~PORT_NOT_FREE,
-                serial_number=_unique_id_str(uid),
-                in_use=in_use)
-        devices.append(dev)
+    __slots__ = ('port', 'unique_id', 'in_use', '_serial_number')
 
-    return devices
+    def __init__(self, port, unique_id, in_use):
+        #: The port which can be used with :func:`open`.
+        self.port = port
+        #: The unique identifier as an integer, see
+        #: :meth:`Aardvark.unique_id`.
+        self.unique_id = unique_id
+        #: Whether the device is opened by someone else.
+        self.in_use = in_use
+        self._serial_number = None
 
-def open(port=None, serial_number=None):
+    @property
+    def serial_number(self):
+        """The serial number as a string in the format NNNN-MMMMMM."""
+        if self._serial_number is None:
+            self._serial_number = _unique_id_str(self.unique_id)
+        return self._serial_number
+
+    def __getitem__(self, key):
+        if key not in ('port', 'serial_number', 'in_use'):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __eq__(self, other):
+        if not isinstance(other, DeviceInfo):
+            return NotImplemented
+        return ((self.port, self.unique_id, self.in_use)
+                == (other.port, other.unique_id, other.in_use))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.port, self.unique_id, self.in_use))
+
+    def __repr__(self):
+        return 'DeviceInfo(port=%r, serial_number=%r, in_use=%r)' % (
+                self.port, self.serial_number, self.in_use)
+
+    def to_dict(self):
+        """Return the dictionary as returned by :func:`find_devices`."""
+        return dict(port=self.port, serial_number=self.serial_number,
+                in_use=self.in_use)
+
+def _find_port(serial_number, backend=None):
+    unique_id = _unique_id_from_str(serial_number)
+    for d in enumerate_devices(backend):
+        if d.unique_id == unique_id:
+            return d.port
+    _raise_error_if_negative(ERR_UNABLE_TO_OPEN)
+
+def open(port=None, serial_number=None, backend=None, thread_safe=False):
     """Open an aardvark device and return an :class:`Aardvark` object. If the
     device cannot be opened an :class:`IOError` is raised.
 
@@ -127,6 +269,16 @@ def open(port=None, serial_number=None):
     Raises an :class:`IOError` if the port (or serial number) does not exist,
     is already connected or an incompatible device is found.
 
+    `backend` selects the binding which is used to access the device. It can
+    either be ``'native'`` for the binary module supplied by Total Phase,
+    ``'sim'`` for the pure-python simulator :mod:`pyaardvark.sim` or any
+    object which provides the same ``py_aa_*`` functions. If omitted, the
+    backend given by the environment variable ``PYAARDVARK_BACKEND`` is used,
+    which defaults to ``'native'``.
+
+    If `thread_safe` is `True` a :class:`ThreadSafeAardvark` object is
+    returned, which can be shared between threads.
+
     .. note::
 
        There is a small chance that this function raises an :class:`IOError`
@@ -139,24 +291,22 @@ def open(port=None, serial_number=None):
 
        As long as nobody comes along with a better idea, this failure case is
        up to the user.
+
+       :meth:`DeviceRegistry.open` caches the enumeration result and
+       rescans if the cached information turns out to be outdated.
     """
+    cls = ThreadSafeAardvark if thread_safe else Aardvark
     if port is None and serial_number is None:
-        dev = Aardvark()
+        dev = cls(backend=backend)
     elif serial_number is not None:
-        for d in find_devices():
-            if d['serial_number'] == serial_number:
-                break
-        else:
-            _raise_error_if_negative(ERR_UNABLE_TO_OPEN)
-
-        dev = Aardvark(d['port'])
+        dev = cls(_find_port(serial_number, backend), backend)
 
         # make sure we opened the correct device
         if dev.unique_id_str() != serial_number:
             dev.close()
             _raise_error_if_negative(ERR_UNABLE_TO_OPEN)
     else:
-        dev = Aardvark(port)
+        dev = cls(port, backend)
 
     return dev
 
@@ -164,8 +314,10 @@ class Aardvark(object):
     """Represents an Aardvark device."""
     BUFFER_SIZE = 65535
 
-    def __init__(self, port=0):
-        ret, ver = api.py_aa_open_ext(port)
+    def __init__(self, port=0, backend=None):
+        self._backend = None if backend is None else _get_api(backend)
+
+        ret, ver = self._api.py_aa_open_ext(port)
         _raise_error_if_negative(ret)
 
         #: A handle which is used as the first paramter for all calls to the
@@ -215,6 +367,37 @@ class Aardvark(object):
         # Initialize shadow variables
         self._i2c_slave_response = None
 
+        # Last known configuration of the adapter, see cache_config
+        self._config_cache = None
+
+        # Receive buffer for the I2C slave mode, allocated on first use
+        self._i2c_slave_buffer_size = self.BUFFER_SIZE
+        self._i2c_slave_buffer = None
+
+        # Same for the SPI slave mode
+        self._spi_slave_response = None
+        self._spi_slave_buffer = None
+
+        # The GPIO configuration can't be queried, these are the last
+        # values set
+        self._gpio_direction = None
+        self._gpio_pullups = None
+        self._gpio_value = None
+        # Pin state of the last gpio_get() or gpio_wait_change() call
+        self._gpio_last = None
+
+        #: The :class:`Metrics` object if metrics are enabled, see
+        #: :meth:`enable_metrics`.
+        self.metrics = None
+
+    @property
+    def _api(self):
+        # Resolve the module wide binding on each access unless a specific
+        # backend was given, so it can be exchanged at runtime.
+        if self._backend is None:
+            return api
+        return self._backend
+
     def __enter__(self):
         return self
 
@@ -225,15 +408,36 @@ class Aardvark(object):
     def close(self):
         """Close the device."""
 
-        api.py_aa_close(self.handle)
+        self._api.py_aa_close(self.handle)
         self.handle = None
 
+    def enable_metrics(self, buckets=DEFAULT_BUCKETS):
+        """Start collecting metrics of the transfer, poll and GPIO methods.
+
+        Counts the calls, failures and transferred bytes of each method, the
+        NACKs, lost arbitrations and bus lock timeouts and keeps a latency
+        histogram per method with the upper bucket bounds `buckets` (in
+        seconds). Without metrics, there is no overhead at all.
+
+        Returns the :class:`Metrics` object, which is also available as
+        :attr:`metrics`. Calling this method again returns the same object.
+        """
+        if self.metrics is None:
+            self.metrics = Metrics(buckets)
+            _instrument(self, self.metrics)
+        return self.metrics
+
+    def disable_metrics(self):
+        """Stop collecting metrics."""
+        _uninstrument(self)
+        self.metrics = None
+
     def unique_id(self):
         """Return the unique identifier of the device. The identifier is the
         serial number you can find on the adapter without the dash. Eg. the
         serial number 0012-345678 would be 12345678.
         """
-        return api.py_aa_unique_id(self.handle)
+        return self._api.py_aa_unique_id(self.handle)
 
     def unique_id_str(self):
         """Return the unique identifier. But unlike :func:`unique_id`, the ID
@@ -241,11 +445,83 @@ class Aardvark(object):
         """
         return _unique_id_str(self.unique_id())
 
-    def _interface_configuration(self, value):
-        ret = api.py_aa_configure(self.handle, value)
+    @property
+    def cache_config(self):
+        """Set this to `True` to cache the configuration of the adapter.
+
+        If enabled, the last known value of the configuration properties
+        (:attr:`enable_i2c`, :attr:`enable_spi`, :attr:`i2c_bitrate`,
+        :attr:`spi_bitrate`, :attr:`i2c_pullups`, :attr:`target_power` and
+        :attr:`i2c_bus_timeout`) is recorded. Reading a property returns the
+        recorded value without asking the adapter and setting a property to
+        its recorded value does nothing.
+
+        The cache is only valid as long as nobody else changes the
+        configuration of the adapter. Use :meth:`invalidate_config` to
+        forget the recorded values or :meth:`sync_config` to read them back
+        from the adapter.
+
+        Disabled by default.
+        """
+        return self._config_cache is not None
+
+    @cache_config.setter
+    def cache_config(self, value):
+        if not value:
+            self._config_cache = None
+        elif self._config_cache is None:
+            self._config_cache = dict()
+
+    def invalidate_config(self):
+        """Forget all recorded configuration values. See
+        :attr:`cache_config`."""
+        if self._config_cache is not None:
+            self._config_cache.clear()
+
+    def sync_config(self):
+        """Read the configuration from the adapter.
+
+        Returns a dictionary with the current configuration. If
+        :attr:`cache_config` is enabled, the recorded values are updated.
+        """
+        if self._config_cache is not None:
+            self._config_cache.clear()
+        config = dict()
+        for name in ('enable_i2c', 'enable_spi', 'i2c_bitrate',
+                'spi_bitrate', 'i2c_pullups', 'target_power',
+                'i2c_bus_timeout'):
+            config[name] = getattr(self, name)
+        return config
+
+    def _query_config(self, key, func, query):
+        cache = self._config_cache
+        if cache is not None and key in cache:
+            return cache[key]
+        ret = func(self.handle, query)
+        _raise_error_if_negative(ret)
+        if cache is not None:
+            cache[key] = ret
+        return ret
+
+    def _update_config(self, key, func, value):
+        cache = self._config_cache
+        if cache is not None:
+            if cache.get(key) == value:
+                return value
+            # the state is unknown in case the call fails
+            cache.pop(key, None)
+        ret = func(self.handle, value)
         _raise_error_if_negative(ret)
+        if cache is not None:
+            cache[key] = ret
         return ret
 
+    def _interface_configuration(self, value):
+        if value == CONFIG_QUERY:
+            return self._query_config('config', self._api.py_aa_configure,
+                    CONFIG_QUERY)
+        return self._update_config('config', self._api.py_aa_configure, value)
+
     @property
     def enable_i2c(self):
         """Set this to `True` to enable the hardware I2C interface. If set to
@@ -301,14 +577,12 @@ class Aardvark(object):
         The power-on default value is 100 kHz.
         """
 
-        ret = api.py_aa_i2c_bitrate(self.handle, 0)
-        _raise_error_if_negative(ret)
-        return ret
+        return self._query_config('i2c_bitrate', self._api.py_aa_i2c_bitrate,
+                0)
 
     @i2c_bitrate.setter
     def i2c_bitrate(self, value):
-        ret = api.py_aa_i2c_bitrate(self.handle, value)
-        _raise_error_if_negative(ret)
+        self._update_config('i2c_bitrate', self._api.py_aa_i2c_bitrate, value)
 
     @property
     def i2c_pullups(self):
@@ -318,9 +592,8 @@ class Aardvark(object):
         Raises an :exc:`IOError` if the hardware adapter does not support
         pullup resistors.
         """
-        ret = api.py_aa_i2c_pullup(self.handle, I2C_PULLUP_QUERY)
-        _raise_error_if_negative(ret)
-        return ret
+        return self._query_config('i2c_pullups', self._api.py_aa_i2c_pullup,
+                I2C_PULLUP_QUERY)
 
     @i2c_pullups.setter
     def i2c_pullups(self, value):
@@ -328,8 +601,7 @@ class Aardvark(object):
             pullup = I2C_PULLUP_BOTH
         else:
             pullup = I2C_PULLUP_NONE
-        ret = api.py_aa_i2c_pullup(self.handle, pullup)
-        _raise_error_if_negative(ret)
+        self._update_config('i2c_pullups', self._api.py_aa_i2c_pullup, pullup)
 
     @property
     def target_power(self):
@@ -339,9 +611,8 @@ class Aardvark(object):
         Raises an :exc:`IOError` if the hardware adapter does not support
         the switchable power pins.
         """
-        ret = api.py_aa_target_power(self.handle, TARGET_POWER_QUERY)
-        _raise_error_if_negative(ret)
-        return ret
+        return self._query_config('target_power',
+                self._api.py_aa_target_power, TARGET_POWER_QUERY)
 
     @target_power.setter
     def target_power(self, value):
@@ -349,8 +620,8 @@ class Aardvark(object):
             power = TARGET_POWER_BOTH
         else:
             power = TARGET_POWER_NONE
-        ret = api.py_aa_target_power(self.handle, power)
-        _raise_error_if_negative(ret)
+        self._update_config('target_power', self._api.py_aa_target_power,
+                power)
 
     @property
     def i2c_bus_timeout(self):
@@ -362,14 +633,13 @@ class Aardvark(object):
 
         The power-on default value is 200 ms.
         """
-        ret = api.py_aa_i2c_bus_timeout(self.handle, 0)
-        _raise_error_if_negative(ret)
-        return ret
+        return self._query_config('i2c_bus_timeout',
+                self._api.py_aa_i2c_bus_timeout, 0)
 
     @i2c_bus_timeout.setter
     def i2c_bus_timeout(self, timeout):
-        ret = api.py_aa_i2c_bus_timeout(self.handle, timeout)
-        _raise_error_if_negative(ret)
+        self._update_config('i2c_bus_timeout',
+                self._api.py_aa_i2c_bus_timeout, timeout)
 
     def i2c_master_write(self, i2c_address, data, flags=I2C_NO_FLAGS):
         """Make an I2C write access.
@@ -379,11 +649,14 @@ class Aardvark(object):
         I2C_NO_STOP is set in the flags.
 
         10 bit addresses are supported if the I2C_10_BIT_ADDR flag is set.
+
+        `data` can be any object supporting the buffer protocol. Writable
+        buffers are passed to the adapter without copying them.
         """
 
-        data = array.array('B', data)
-        status, _ = api.py_aa_i2c_write_ext(self.handle, i2c_address, flags,
-                len(data), data)
+        data = _to_buffer(data)
+        status, _ = self._api.py_aa_i2c_write_ext(self.handle, i2c_address,
+                flags, len(data), data)
         _raise_i2c_status_code_error_if_failure(status)
 
     def i2c_master_read(self, addr, length, flags=I2C_NO_FLAGS):
@@ -397,13 +670,31 @@ class Aardvark(object):
         I2C_NO_STOP flag is set.
         """
 
-        data = array.array('B', (0,) * length)
-        status, rx_len = api.py_aa_i2c_read_ext(self.handle, addr, flags,
+        data = array.array('B', bytes(length))
+        status, rx_len = self._api.py_aa_i2c_read_ext(self.handle, addr, flags,
                 length, data)
         _raise_i2c_status_code_error_if_failure(status)
         del data[rx_len:]
         return bytes(data)
 
+    def i2c_master_read_into(self, addr, buf, flags=I2C_NO_FLAGS):
+        """Make an I2C read access directly into `buf`.
+
+        Same as :meth:`i2c_master_read`, but instead of allocating a new
+        object, the data is read into `buf`, which can be any writable object
+        supporting the buffer protocol, like :class:`bytearray`,
+        :class:`memoryview`, :class:`mmap.mmap` or a numpy array. As many
+        bytes as fit into `buf` are read.
+
+        Returns the number of bytes read.
+        """
+
+        buf = _writable_buffer(buf)
+        status, rx_len = self._api.py_aa_i2c_read_ext(self.handle, addr, flags,
+                len(buf), buf)
+        _raise_i2c_status_code_error_if_failure(status)
+        return rx_len
+
     def i2c_master_write_read(self, i2c_address, data, length):
         """Make an I2C write/read access.
 
@@ -420,12 +711,70 @@ class Aardvark(object):
         self.i2c_master_write(i2c_address, data, I2C_NO_STOP)
         return self.i2c_master_read(i2c_address, length)
 
+    def i2c_master_write_read_into(self, i2c_address, data, buf):
+        """Make an I2C write/read access and read the data into `buf`.
+
+        See :meth:`i2c_master_write_read` and :meth:`i2c_master_read_into`.
+
+        Returns the number of bytes read.
+        """
+
+        self.i2c_master_write(i2c_address, data, I2C_NO_STOP)
+        return self.i2c_master_read_into(i2c_address, buf)
+
+    def i2c_master_write_read_ext(self, i2c_address, data, length,
+            flags=I2C_NO_FLAGS):
+        """Make an I2C write/read access with a single call to the adapter.
+
+        Same as :meth:`i2c_master_write_read`, but the write and the read
+        are issued with one call of the binding if it supports it, which
+        saves one USB round trip. `length` is either the number of bytes to
+        read or a writable buffer to read into.
+
+        Failed transfers don't raise an exception. Instead, an
+        :class:`I2CWriteReadResult` object is returned, which tells which
+        phase failed. Use :meth:`I2CWriteReadResult.raise_for_status` to
+        raise the corresponding exception.
+        """
+        if isinstance(length, int):
+            buf = bytearray(length)
+        else:
+            buf = _writable_buffer(length)
+        write_status, read_status, written, count = _write_read(self._api,
+                self.handle, i2c_address, flags, _to_buffer(data), buf)
+        _raise_error_if_negative(write_status)
+        if read_status is not None:
+            _raise_error_if_negative(read_status)
+        return I2CWriteReadResult(write_status, read_status, written, count,
+                buf)
+
+    def i2c_batch(self, transfers, stop_on_error=True):
+        """Execute a list of I2C master transfers back to back.
+
+        `transfers` is either an :class:`I2CBatch` object or a sequence of
+        tuples, which are passed to :meth:`I2CBatch.add`, eg.
+        ``('write', 0x50, b'\\x00\\x01')`` or ``('write_read', 0x50,
+        b'\\x00', 2)``. Reusing an :class:`I2CBatch` object avoids building
+        the buffers again.
+
+        If `stop_on_error` is `True` no further transfers are issued after a
+        transfer failed. Otherwise all transfers are executed regardless of
+        their outcome.
+
+        Returns an :class:`I2CBatchResult` object. Failed transfers don't
+        raise an exception, instead their status code is recorded in the
+        result.
+        """
+        if not isinstance(transfers, I2CBatch):
+            transfers = I2CBatch(transfers)
+        return transfers.execute(self._api, self.handle, stop_on_error)
+
     def i2c_stop(self, ignore_errors=True):
         """Free the Aardvark I2C subsystem from a held bus condition.
 
         Raises ERR_I2C_BUS_ALREADY_FREE if I2C bus was already free.
         """
-        ret = api.py_aa_i2c_free_bus(self.handle)
+        ret = self._api.py_aa_i2c_free_bus(self.handle)
         if not ignore_errors:
             _raise_error_if_negative(ret)
         return ret
@@ -444,7 +793,7 @@ class Aardvark(object):
         if timeout is None:
             timeout = -1
 
-        ret = api.py_aa_async_poll(self.handle, timeout)
+        ret = self._api.py_aa_async_poll(self.handle, timeout)
         _raise_error_if_negative(ret)
 
         events = list()
@@ -453,22 +802,32 @@ class Aardvark(object):
                 events.append(event)
         return events
 
-    def enable_i2c_slave(self, slave_address):
+    def enable_i2c_slave(self, slave_address, buffer_size=None):
         """Enable I2C slave mode.
 
         The device will respond to the specified slave_address if it is
         addressed.
 
+        `buffer_size` is the maximum number of bytes per transaction the
+        adapter will receive and transmit. It also determines the size of
+        the receive buffer, which is allocated once and reused by all
+        subsequent reads. If omitted, :attr:`BUFFER_SIZE` is used.
+
         You can wait for the data with :func:`poll` and get it with
         `i2c_slave_read`.
         """
-        ret = api.py_aa_i2c_slave_enable(self.handle, slave_address,
-                self.BUFFER_SIZE, self.BUFFER_SIZE)
+        if buffer_size is None:
+            buffer_size = self.BUFFER_SIZE
+        ret = self._api.py_aa_i2c_slave_enable(self.handle, slave_address,
+                buffer_size, buffer_size)
         _raise_error_if_negative(ret)
+        if buffer_size != self._i2c_slave_buffer_size:
+            self._i2c_slave_buffer_size = buffer_size
+            self._i2c_slave_buffer = None
 
     def disable_i2c_slave(self):
         """Disable I2C slave mode."""
-        ret = api.py_aa_i2c_slave_disable(self.handle)
+        ret = self._api.py_aa_i2c_slave_disable(self.handle)
         _raise_error_if_negative(ret)
 
     def i2c_slave_read(self):
@@ -476,16 +835,39 @@ class Aardvark(object):
 
         The bytes are returned as a string object.
         """
-        data = array.array('B', (0,) * self.BUFFER_SIZE)
-        status, addr, rx_len = api.py_aa_i2c_slave_read_ext(self.handle,
-                self.BUFFER_SIZE, data)
+        addr, data = self.i2c_slave_read_view()
+        return (addr, bytes(data))
+
+    def i2c_slave_read_view(self):
+        """Read the bytes from an I2C slave reception without copying them.
+
+        Same as :meth:`i2c_slave_read` but the bytes are returned as a
+        :class:`memoryview` of the internal receive buffer. The view is only
+        valid until the next read.
+        """
+        if self._i2c_slave_buffer is None:
+            self._i2c_slave_buffer = bytearray(self._i2c_slave_buffer_size)
+        buf = self._i2c_slave_buffer
+        addr, rx_len = self.i2c_slave_read_into(buf)
+        return (addr, memoryview(buf)[:rx_len])
+
+    def i2c_slave_read_into(self, buf):
+        """Read the bytes from an I2C slave reception into `buf`.
+
+        `buf` can be any writable object supporting the buffer protocol. A
+        reception which is larger than `buf` is truncated.
+
+        Returns a tuple ``(addr, length)``.
+        """
+        buf = _writable_buffer(buf)
+        status, addr, rx_len = self._api.py_aa_i2c_slave_read_ext(self.handle,
+                len(buf), buf)
         _raise_i2c_status_code_error_if_failure(status)
 
         # In case of general call, actually return the general call address
         if addr == 0x80:
             addr = 0x00
-        del data[rx_len:]
-        return (addr, bytes(data))
+        return (addr, rx_len)
 
     @property
     def i2c_slave_response(self):
@@ -504,14 +886,15 @@ class Aardvark(object):
     @i2c_slave_response.setter
     def i2c_slave_response(self, data):
         data = array.array('B', data)
-        ret = api.py_aa_i2c_slave_set_response(self.handle, len(data), data)
+        ret = self._api.py_aa_i2c_slave_set_response(self.handle, len(data),
+                data)
         _raise_error_if_negative(ret)
         self._i2c_slave_response = data
 
     @property
     def i2c_slave_last_transmit_size(self):
         """Returns the number of bytes transmitted by the slave."""
-        ret = api.py_aa_i2c_slave_write_stats(self.handle)
+        ret = self._api.py_aa_i2c_slave_write_stats(self.handle)
         _raise_error_if_negative(ret)
         return ret
 
@@ -524,22 +907,27 @@ class Aardvark(object):
 
         The power-on default value is 1000 kHz.
         """
-        ret = api.py_aa_spi_bitrate(self.handle, 0)
-        _raise_error_if_negative(ret)
-        return ret
+        return self._query_config('spi_bitrate', self._api.py_aa_spi_bitrate,
+                0)
 
     @spi_bitrate.setter
     def spi_bitrate(self, value):
-        ret = api.py_aa_spi_bitrate(self.handle, value)
-        _raise_error_if_negative(ret)
+        self._update_config('spi_bitrate', self._api.py_aa_spi_bitrate, value)
 
     def spi_configure(self, polarity, phase, bitorder):
         """Configure the SPI interface."""
-        ret = api.py_aa_spi_configure(self.handle, polarity, phase, bitorder)
+        cache = self._config_cache
+        if cache is not None:
+            cache.pop('spi_mode', None)
+        ret = self._api.py_aa_spi_configure(self.handle, polarity, phase,
+                bitorder)
         _raise_error_if_negative(ret)
 
     def spi_configure_mode(self, spi_mode):
         """Configure the SPI interface by the well known SPI modes."""
+        cache = self._config_cache
+        if cache is not None and cache.get('spi_mode') == spi_mode:
+            return
         if spi_mode == SPI_MODE_0:
             self.spi_configure(SPI_POL_RISING_FALLING,
                     SPI_PHASE_SAMPLE_SETUP, SPI_BITORDER_MSB)
@@ -548,20 +936,361 @@ class Aardvark(object):
                     SPI_PHASE_SETUP_SAMPLE, SPI_BITORDER_MSB)
         else:
             raise RuntimeError('SPI Mode not supported')
+        if cache is not None:
+            cache['spi_mode'] = spi_mode
+
+    def apply_profile(self, profile):
+        """Apply a configuration profile.
+
+        `profile` is either a :class:`Profile` object, a dictionary with
+        the settings or the filename of a profile saved with
+        :meth:`Profile.save`.
+
+        Only the settings which differ from the current configuration of the
+        adapter are changed. Interfaces which are disabled by the profile
+        are disabled before, interfaces which are enabled are enabled after
+        all other settings are changed. Switching from one interface to the
+        other is done with a single configuration change. Target power is
+        switched off first and switched on last.
+
+        To determine the current configuration the adapter is queried,
+        unless :attr:`cache_config` is enabled. In the latter case, no calls
+        at all are made for settings which are already applied.
+
+        Returns a :class:`ProfileResult` object.
+        """
+        if isinstance(profile, dict):
+            profile = Profile.from_dict(profile)
+        elif not isinstance(profile, Profile):
+            profile = Profile.load(profile)
+        return profile.apply(self)
 
     def spi_write(self, data):
-        """Write a stream of bytes to a SPI device."""
-        data_out = array.array('B', data)
-        data_in = array.array('B', (0,) * len(data_out))
-        ret = api.py_aa_spi_write(self.handle, len(data_out), data_out,
+        """Write a stream of bytes to a SPI device.
+
+        `data` can be any object supporting the buffer protocol. Writable
+        buffers are passed to the adapter without copying them.
+        """
+        data_out = _to_buffer(data)
+        data_in = bytearray(len(data_out))
+        ret = self._api.py_aa_spi_write(self.handle, len(data_out), data_out,
                 len(data_in), data_in)
         _raise_error_if_negative(ret)
         return bytes(data_in)
 
+    def spi_transfer_into(self, data_out, data_in):
+        """Write a stream of bytes to a SPI device and read the received
+        bytes into `data_in`.
+
+        Both `data_out` and `data_in` can be any object supporting the buffer
+        protocol, `data_in` has to be writable. No intermediate copies are
+        made for writable buffers. If `data_in` is smaller than `data_out`
+        only the first bytes are stored.
+
+        Returns the number of bytes transferred.
+        """
+        data_out = _to_buffer(data_out)
+        data_in = _writable_buffer(data_in)
+        ret = self._api.py_aa_spi_write(self.handle, len(data_out), data_out,
+                len(data_in), data_in)
+        _raise_error_if_negative(ret)
+        return ret
+
     def spi_ss_polarity(self, polarity):
         """Change the ouput polarity on the SS line.
 
         Please note, that this only affects the master functions.
         """
-        ret = api.py_aa_spi_master_ss_polarity(self.handle, polarity)
+        ret = self._api.py_aa_spi_master_ss_polarity(self.handle, polarity)
+        _raise_error_if_negative(ret)
+
+    def enable_spi_slave(self):
+        """Enable SPI slave mode.
+
+        Received frames are signalled by :data:`POLL_SPI` events of
+        :meth:`poll` and read with :meth:`spi_slave_read` or, for a
+        continuous stream, with :meth:`spi_slave_frames`.
+        """
+        ret = self._api.py_aa_spi_slave_enable(self.handle)
+        _raise_error_if_negative(ret)
+
+    def disable_spi_slave(self):
+        """Disable SPI slave mode."""
+        ret = self._api.py_aa_spi_slave_disable(self.handle)
+        _raise_error_if_negative(ret)
+
+    @property
+    def spi_slave_response(self):
+        """Bytes the adapter sends on MISO while it is addressed by the
+        master. The response is repeated if the master clocks more bytes.
+        At most 64 bytes are used by the adapter.
+
+        Like :attr:`i2c_slave_response`, this is the value buffered when
+        the property was set.
+        """
+        return self._spi_slave_response
+
+    @spi_slave_response.setter
+    def spi_slave_response(self, data):
+        data = array.array('B', data)
+        ret = self._api.py_aa_spi_slave_set_response(self.handle, len(data),
+                data)
         _raise_error_if_negative(ret)
+        self._spi_slave_response = data
+
+    def spi_slave_read(self):
+        """Read the bytes of a SPI slave reception.
+
+        Raises an :class:`SPIError` with :data:`ERR_SPI_SLAVE_TIMEOUT` if
+        nothing was received.
+        """
+        if self._spi_slave_buffer is None:
+            self._spi_slave_buffer = bytearray(self.BUFFER_SIZE)
+        buf = self._spi_slave_buffer
+        return bytes(buf[:self.spi_slave_read_into(buf)])
+
+    def spi_slave_read_into(self, buf):
+        """Read the bytes of a SPI slave reception into `buf`, which can be
+        any writable object supporting the buffer protocol.
+
+        The adapter drops the excess bytes of a reception larger than `buf`
+        and an :class:`SPIError` with :data:`ERR_SPI_DROPPED_EXCESS_BYTES`
+        is raised.
+
+        Returns the number of bytes read.
+        """
+        buf = _writable_buffer(buf)
+        ret = self._api.py_aa_spi_slave_read(self.handle, len(buf), buf)
+        _raise_error_if_negative(ret)
+        return ret
+
+    def spi_slave_frames(self, timeout=None, buffer_size=None):
+        """Return a generator which yields the received SPI frames.
+
+        Each frame is a :class:`memoryview` of a receive buffer of
+        `buffer_size` bytes, which is reused for all frames. Thus a frame is
+        only valid until the next one is requested. Pending frames are read
+        back to back, the adapter is only polled when there are none left.
+
+        The default `buffer_size` is :attr:`BUFFER_SIZE`, the largest frame
+        the adapter can return. If a smaller buffer is given and a frame
+        doesn't fit, the adapter drops the excess bytes and an
+        :class:`SPIError` with :data:`ERR_SPI_DROPPED_EXCESS_BYTES` is
+        raised.
+
+        The generator ends if no frame arrived within `timeout`
+        milliseconds or if :meth:`poll` reports an I2C event, which has to
+        be handled by the caller. If `timeout` is omitted, negative or
+        None, the generator waits forever.
+        """
+        if buffer_size is None:
+            buffer_size = self.BUFFER_SIZE
+        buf = bytearray(buffer_size)
+        view = memoryview(buf)
+        if timeout is None:
+            timeout = -1
+        while True:
+            length = self._spi_slave_read_frame(buf)
+            if length == 0:
+                if POLL_SPI not in self.poll(timeout):
+                    return
+                continue
+            yield view[:length]
+
+    def _spi_slave_read_frame(self, buf):
+        """Read the next pending SPI frame into `buf`. Returns its length
+        or 0 if there is none."""
+        ret = self._api.py_aa_spi_slave_read(self.handle, len(buf), buf)
+        if ret == ERR_SPI_SLAVE_TIMEOUT:
+            return 0
+        _raise_error_if_negative(ret)
+        return ret
+
+    def spi_slave_receive(self, callback, timeout=None, buffer_size=None):
+        """Call ``callback(frame)`` for each received SPI frame, see
+        :meth:`spi_slave_frames` for the arguments and when the reception
+        ends.
+
+        If the callback returns anything but `None`, it is set as
+        :attr:`spi_slave_response`.
+
+        Returns the number of frames received.
+        """
+        count = 0
+        for frame in self.spi_slave_frames(timeout, buffer_size):
+            count += 1
+            response = callback(frame)
+            if response is not None:
+                self.spi_slave_response = response
+        return count
+
+    @property
+    def gpio_direction(self):
+        """Bitmask of the GPIO pins which are driven by the adapter, eg.
+        ``GPIO_SS | GPIO_MOSI``. All other pins are inputs.
+
+        The adapter can't be queried, so this is the last value set or
+        `None`. Pins which are used by the I2C or SPI interface are not
+        affected. The power-on default is all inputs.
+        """
+        return self._gpio_direction
+
+    @gpio_direction.setter
+    def gpio_direction(self, value):
+        ret = self._api.py_aa_gpio_direction(self.handle, value)
+        _raise_error_if_negative(ret)
+        self._gpio_direction = value
+
+    @property
+    def gpio_pullups(self):
+        """Bitmask of the input pins whose internal pullup resistor is
+        enabled.
+
+        Like :attr:`gpio_direction`, this is the last value set or `None`.
+        """
+        return self._gpio_pullups
+
+    @gpio_pullups.setter
+    def gpio_pullups(self, value):
+        ret = self._api.py_aa_gpio_pullup(self.handle, value)
+        _raise_error_if_negative(ret)
+        self._gpio_pullups = value
+
+    def gpio_get(self):
+        """Return the state of all GPIO pins as a bitmask."""
+        ret = self._api.py_aa_gpio_get(self.handle)
+        _raise_error_if_negative(ret)
+        self._gpio_last = ret
+        return ret
+
+    def gpio_set(self, value, mask=None):
+        """Set the output pins to the bitmask `value`.
+
+        If `mask` is given, only the pins in `mask` are changed and the
+        other outputs keep the value set last. Values of pins which are
+        configured as inputs are latched by the adapter and driven once the
+        pins become outputs.
+        """
+        if mask is not None:
+            value = ((self._gpio_value or 0) & ~mask) | (value & mask)
+        ret = self._api.py_aa_gpio_set(self.handle, value)
+        _raise_error_if_negative(ret)
+        self._gpio_value = value
+
+    def gpio_wait_change(self, timeout=None):
+        """Wait until one of the input pins changes.
+
+        A change is relative to the pin state returned by the last call of
+        :meth:`gpio_get` or :meth:`gpio_wait_change`. If neither was called
+        before, the state is read first. `timeout` is given in milliseconds.
+        If it is omitted, negative or None, the call blocks until there is a
+        change.
+
+        Returns the new state of all pins as a bitmask or `None` if the
+        timeout expired. The waiting is done by the adapter, so a change is
+        reported with the latency of a single USB transfer.
+
+        Note that a :class:`ThreadSafeAardvark` is locked while waiting.
+        """
+        if timeout is None:
+            timeout = -1
+        if self._gpio_last is None:
+            self.gpio_get()
+        ret = self._api.py_aa_gpio_change(self.handle, timeout)
+        _raise_error_if_negative(ret)
+        last, self._gpio_last = self._gpio_last, ret
+        inputs = ~(self._gpio_direction or 0)
+        if (ret ^ last) & inputs == 0:
+            return None
+        return ret
+
+
+def _locked(func):
+    @functools.wraps(func)
+    def locked(self, *args, **kwargs):
+        with self._lock:
+            return func(self, *args, **kwargs)
+    return locked
+
+class ThreadSafeAardvark(Aardvark):
+    """An :class:`Aardvark` which can be shared between threads.
+
+    Every public method and property access holds a per device lock, so the
+    calls of different threads are serialized. Methods which consist of
+    several transfers, like :meth:`i2c_master_write_read`, are atomic.
+
+    To make a sequence of calls atomic, hold the lock returned by
+    :meth:`bus_lock`::
+
+      with a.bus_lock():
+          a.i2c_master_write(0x50, b'\\x00', I2C_NO_STOP)
+          data = a.i2c_master_read(0x50, 4)
+
+    The lock is reentrant and only costs an uncontended lock acquisition
+    per call if no other thread uses the device.
+    """
+
+    #: Maximum time in milliseconds the lock is held by
+    #: :meth:`spi_slave_frames` while it waits for a frame.
+    poll_interval = 10
+
+    def __init__(self, port=0, backend=None):
+        self._lock = threading.RLock()
+        super(ThreadSafeAardvark, self).__init__(port, backend)
+
+    def bus_lock(self):
+        """Return the lock of this device. While it is held, no other
+        thread can access the device."""
+        return self._lock
+
+    def spi_slave_frames(self, timeout=None, buffer_size=None):
+        """Same as :meth:`Aardvark.spi_slave_frames`, but the lock is only
+        held while a frame is read and while the adapter is polled for at
+        most :attr:`poll_interval` milliseconds, so other threads can use
+        the device while frames are received."""
+        if buffer_size is None:
+            buffer_size = self.BUFFER_SIZE
+        buf = bytearray(buffer_size)
+        view = memoryview(buf)
+        if timeout is None or timeout < 0:
+            deadline = None
+        else:
+            deadline = time.monotonic() + timeout / 1000.0
+        while True:
+            with self._lock:
+                length = self._spi_slave_read_frame(buf)
+                if length == 0:
+                    interval = self.poll_interval
+                    if deadline is not None:
+                        remaining = int((deadline - time.monotonic()) * 1000)
+                        interval = max(0, min(interval, remaining))
+                    events = self.poll(interval)
+            if length:
+                yield view[:length]
+            elif POLL_SPI in events:
+                continue
+            elif events or (deadline is not None
+                    and time.monotonic() >= deadline):
+                return
+
+    def spi_slave_receive(self, callback, timeout=None, buffer_size=None):
+        # not locked as a whole, the frames are read with
+        # spi_slave_frames() above
+        return Aardvark.spi_slave_receive(self, callback, timeout,
+                buffer_size)
+    spi_slave_receive.__doc__ = Aardvark.spi_slave_receive.__doc__
+
+# wrap all public methods and properties of Aardvark, which are not
+# overridden above
+for _name, _attr in list(vars(Aardvark).items()):
+    if _name.startswith('_') or _name in vars(ThreadSafeAardvark):
+        continue
+    if isinstance(_attr, property):
+        _attr = property(_locked(_attr.fget),
+                _attr.fset and _locked(_attr.fset), None, _attr.__doc__)
+    elif callable(_attr):
+        _attr = _locked(_attr)
+    else:
+        continue
+    setattr(ThreadSafeAardvark, _name, _attr)
+del _name, _attr
@@ -0,0 +1,195 @@
+# Copyright (c) 2014-2018  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""asyncio support.
+
+Every :class:`AsyncAardvark` object owns a dedicated worker thread which
+executes all calls to its adapter. Thus, the calls to one adapter are
+serialized while the event loop keeps running and one event loop can drive
+many adapters at once::
+
+  async def main():
+      async with await pyaardvark.aio.open(serial_number='1111-222222') as a:
+          await a.set('enable_i2c', True)
+          data = await a.i2c_master_write_read(0x50, b'\\x00', 4)
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import threading
+import time
+
+from .aardvark import open as _open
+from .constants import *
+
+
+async def open(*args, **kwargs):
+    """Open an adapter without blocking the event loop and return an
+    :class:`AsyncAardvark` object. Takes the same arguments as
+    :func:`pyaardvark.open`."""
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1,
+            thread_name_prefix='aardvark')
+    loop = asyncio.get_running_loop()
+    try:
+        dev = await loop.run_in_executor(executor,
+                functools.partial(_open, *args, **kwargs))
+    except BaseException:
+        executor.shutdown(wait=False)
+        raise
+    return AsyncAardvark(dev, executor)
+
+
+class AsyncAardvark(object):
+    """Awaitable wrapper around an :class:`Aardvark` object.
+
+    All methods are coroutines which run the corresponding method of the
+    wrapped device in the worker thread of this object. Pass `timeout` (in
+    seconds) to give up waiting; the call which is already running on the
+    adapter can't be aborted though and will finish in the background.
+    Calls which are still queued when they are cancelled are not executed.
+    """
+
+    #: Interval in milliseconds in which :meth:`poll` and
+    #: :meth:`gpio_wait_change` check whether they were cancelled.
+    poll_interval = 50
+
+    def __init__(self, dev, executor=None):
+        #: The wrapped :class:`Aardvark` object.
+        self.device = dev
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=1,
+                    thread_name_prefix='aardvark')
+        self._executor = executor
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, tb):
+        await self.close()
+        return False
+
+    async def run(self, func, *args, timeout=None, **kwargs):
+        """Run `func` with the given arguments in the worker thread and
+        return its result."""
+        loop = asyncio.get_running_loop()
+        fut = loop.run_in_executor(self._executor,
+                functools.partial(func, *args, **kwargs))
+        if timeout is not None:
+            return await asyncio.wait_for(fut, timeout)
+        return await fut
+
+    async def close(self):
+        """Close the device and stop the worker thread."""
+        try:
+            await self.run(self.device.close)
+        finally:
+            self._executor.shutdown(wait=False)
+
+    async def get(self, name, timeout=None):
+        """Read the property `name` of the device, eg. ``'i2c_bitrate'``."""
+        return await self.run(getattr, self.device, name, timeout=timeout)
+
+    async def set(self, name, value, timeout=None):
+        """Set the property `name` of the device to `value`."""
+        await self.run(setattr, self.device, name, value, timeout=timeout)
+
+    async def i2c_master_write(self, i2c_address, data, flags=I2C_NO_FLAGS,
+            timeout=None):
+        return await self.run(self.device.i2c_master_write, i2c_address,
+                data, flags, timeout=timeout)
+
+    async def i2c_master_read(self, addr, length, flags=I2C_NO_FLAGS,
+            timeout=None):
+        return await self.run(self.device.i2c_master_read, addr, length,
+                flags, timeout=timeout)
+
+    async def i2c_master_write_read(self, i2c_address, data, length,
+            timeout=None):
+        return await self.run(self.device.i2c_master_write_read,
+                i2c_address, data, length, timeout=timeout)
+
+    async def i2c_master_write_read_ext(self, i2c_address, data, length,
+            flags=I2C_NO_FLAGS, timeout=None):
+        return await self.run(self.device.i2c_master_write_read_ext,
+                i2c_address, data, length, flags, timeout=timeout)
+
+    async def i2c_batch(self, transfers, stop_on_error=True, timeout=None):
+        return await self.run(self.device.i2c_batch, transfers,
+                stop_on_error, timeout=timeout)
+
+    async def i2c_slave_read(self, timeout=None):
+        return await self.run(self.device.i2c_slave_read, timeout=timeout)
+
+    async def spi_write(self, data, timeout=None):
+        return await self.run(self.device.spi_write, data, timeout=timeout)
+
+    async def spi_slave_read(self, timeout=None):
+        return await self.run(self.device.spi_slave_read, timeout=timeout)
+
+    async def gpio_get(self, timeout=None):
+        return await self.run(self.device.gpio_get, timeout=timeout)
+
+    async def gpio_set(self, value, mask=None, timeout=None):
+        await self.run(self.device.gpio_set, value, mask, timeout=timeout)
+
+    async def _sliced(self, func, timeout, done):
+        # Call func(interval) in slices of poll_interval until done(result)
+        # or the timeout expired, so a cancelled wait releases the worker
+        # thread in a timely manner.
+        cancelled = threading.Event()
+        if timeout is None or timeout < 0:
+            deadline = None
+        else:
+            deadline = time.monotonic() + timeout / 1000.0
+
+        def _wait():
+            while True:
+                interval = self.poll_interval
+                if deadline is not None:
+                    remaining = int((deadline - time.monotonic()) * 1000)
+                    interval = max(0, min(interval, remaining))
+                result = func(interval)
+                if done(result) or cancelled.is_set():
+                    return result
+                if deadline is not None and time.monotonic() >= deadline:
+                    return result
+
+        try:
+            return await self.run(_wait)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def poll(self, timeout=None):
+        """Wait for an event. Same as :meth:`Aardvark.poll`, ie. `timeout`
+        is given in milliseconds and `None` waits forever.
+
+        The adapter is polled in slices of :attr:`poll_interval`, so a
+        cancelled poll releases the worker thread in a timely manner.
+        """
+        return await self._sliced(self.device.poll, timeout, bool)
+
+    async def gpio_wait_change(self, timeout=None):
+        """Wait until one of the GPIO input pins changes. Same as
+        :meth:`Aardvark.gpio_wait_change`, ie. `timeout` is given in
+        milliseconds and `None` waits forever.
+
+        Like :meth:`poll`, the adapter is asked in slices of
+        :attr:`poll_interval`.
+        """
+        return await self._sliced(self.device.gpio_wait_change, timeout,
+                lambda value: value is not None)
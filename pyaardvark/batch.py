@@ -0,0 +1,230 @@
+# Copyright (c) 2014-2018  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+from builtins import bytes
+import array
+
+from .constants import *
+from .errors import error_from_code
+
+_WRITE = 0
+_READ = 1
+_WRITE_READ = 2
+
+
+def _write_read(api, handle, i2c_address, flags, data_out, data_in):
+    """Make an I2C write/read access with a single call to the binding if
+    it provides ``py_aa_i2c_write_read``, with two calls otherwise.
+
+    Returns a tuple ``(write_status, read_status, written, read)``. The
+    read status is `None` if the read phase wasn't executed. Negative error
+    codes are returned as write status.
+    """
+    write_read = getattr(api, 'py_aa_i2c_write_read', None)
+    if write_read is not None:
+        status, written, read = write_read(handle, i2c_address, flags,
+                len(data_out), data_out, len(data_in), data_in)
+        if status < 0:
+            return (status, None, 0, 0)
+        if status & 0xff != I2C_STATUS_OK:
+            return (status & 0xff, None, written, 0)
+        return (I2C_STATUS_OK, status >> 8, written, read)
+
+    status, written = api.py_aa_i2c_write_ext(handle, i2c_address,
+            flags | I2C_NO_STOP, len(data_out), data_out)
+    if status != I2C_STATUS_OK:
+        return (status, None, written, 0)
+    status, read = api.py_aa_i2c_read_ext(handle, i2c_address, flags,
+            len(data_in), data_in)
+    return (I2C_STATUS_OK, status, written, read)
+
+
+class I2CBatch(object):
+    """A list of I2C master transfers which are executed back to back by
+    :meth:`Aardvark.i2c_batch`.
+
+    All transmit and receive buffers are allocated when the transfers are
+    added. A batch can therefore be built once and executed many times
+    without any further allocations, eg::
+
+      batch = I2CBatch()
+      batch.write(0x50, b'\\x00\\x01')
+      idx = batch.write_read(0x50, b'\\x00', 2)
+      result = a.i2c_batch(batch)
+      data = result[idx]
+    """
+
+    def __init__(self, transfers=None):
+        self._ops = list()
+        if transfers is not None:
+            for transfer in transfers:
+                self.add(*transfer)
+
+    def __len__(self):
+        return len(self._ops)
+
+    def add(self, op, i2c_address, *args):
+        """Add a transfer by its name, which is either ``'write'``,
+        ``'read'`` or ``'write_read'``. The remaining arguments are the same
+        as for the corresponding method."""
+        return getattr(self, op)(i2c_address, *args)
+
+    def _append(self, kind, i2c_address, flags, data, length):
+        data_out = array.array('B', data)
+        data_in = array.array('B', bytes(length))
+        self._ops.append((kind, i2c_address, flags, data_out, data_in))
+        return len(self._ops) - 1
+
+    def write(self, i2c_address, data, flags=I2C_NO_FLAGS):
+        """Add a write transfer. Returns the index of the transfer."""
+        return self._append(_WRITE, i2c_address, flags, data, 0)
+
+    def read(self, i2c_address, length, flags=I2C_NO_FLAGS):
+        """Add a read transfer. Returns the index of the transfer."""
+        return self._append(_READ, i2c_address, flags, b'', length)
+
+    def write_read(self, i2c_address, data, length, flags=I2C_NO_FLAGS):
+        """Add a write/read transfer, that is a write without a stop
+        condition followed by a read with a repeated start. Returns the index
+        of the transfer."""
+        return self._append(_WRITE_READ, i2c_address, flags, data, length)
+
+    def execute(self, api, handle, stop_on_error=True):
+        """Execute the batch with the given binding `api` and device
+        `handle`. You probably want to use :meth:`Aardvark.i2c_batch`
+        instead."""
+        write = api.py_aa_i2c_write_ext
+        read = api.py_aa_i2c_read_ext
+        num = len(self._ops)
+        statuses = [None] * num
+        data = [None] * num
+
+        for i, (kind, addr, flags, data_out, data_in) in enumerate(self._ops):
+            if kind == _WRITE:
+                status, _ = write(handle, addr, flags, len(data_out),
+                        data_out)
+            elif kind == _READ:
+                status, rx_len = read(handle, addr, flags, len(data_in),
+                        data_in)
+            else:
+                status, read_status, _, rx_len = _write_read(api, handle,
+                        addr, flags, data_out, data_in)
+                if read_status is not None:
+                    status = read_status
+            if kind != _WRITE and status == I2C_STATUS_OK:
+                data[i] = bytes(data_in[:rx_len])
+            statuses[i] = status
+            if status != I2C_STATUS_OK and stop_on_error:
+                break
+
+        return I2CBatchResult(statuses, data)
+
+
+class I2CBatchResult(object):
+    """The result of an :class:`I2CBatch`.
+
+    Indexing the result returns the data received by the corresponding read
+    or write/read transfer or `None` for write transfers and failed or
+    skipped transfers.
+    """
+
+    def __init__(self, statuses, data):
+        #: A list with the status code of each transfer, which is either an
+        #: I2C status code, a negative error code or `None` if the transfer
+        #: was not executed.
+        self.statuses = statuses
+
+        #: A list with the received bytes of each transfer.
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        return self.data[index]
+
+    @property
+    def ok(self):
+        """`True` if all transfers were executed successfully."""
+        return all(s == I2C_STATUS_OK for s in self.statuses)
+
+    @property
+    def errors(self):
+        """A list of ``(index, status)`` tuples of all failed transfers."""
+        return [(i, s) for i, s in enumerate(self.statuses)
+                if s is not None and s != I2C_STATUS_OK]
+
+    def raise_for_status(self):
+        """Raises an :exc:`AardvarkError` for the first failed transfer."""
+        for _, status in self.errors:
+            raise error_from_code(status)
+
+
+class I2CWriteReadResult(object):
+    """Returned by :meth:`Aardvark.i2c_master_write_read_ext`."""
+
+    __slots__ = ('write_status', 'read_status', 'written', 'count',
+            'buffer')
+
+    def __init__(self, write_status, read_status, written, count, buffer):
+        #: The I2C status code of the write phase.
+        self.write_status = write_status
+        #: The I2C status code of the read phase or `None` if the read
+        #: phase wasn't executed because the write phase failed.
+        self.read_status = read_status
+        #: The number of bytes written.
+        self.written = written
+        #: The number of bytes read.
+        self.count = count
+        #: The receive buffer.
+        self.buffer = buffer
+
+    def __repr__(self):
+        return ('I2CWriteReadResult(write_status=%r, read_status=%r, '
+                'written=%r, count=%r)' % (self.write_status,
+                        self.read_status, self.written, self.count))
+
+    @property
+    def status(self):
+        """The status code of the failed phase or
+        :data:`I2C_STATUS_OK`."""
+        if self.write_status != I2C_STATUS_OK:
+            return self.write_status
+        return self.read_status
+
+    @property
+    def phase(self):
+        """``'write'`` or ``'read'`` depending on which phase failed or
+        `None` if the access was successful."""
+        if self.write_status != I2C_STATUS_OK:
+            return 'write'
+        if self.read_status != I2C_STATUS_OK:
+            return 'read'
+        return None
+
+    @property
+    def ok(self):
+        return self.phase is None
+
+    @property
+    def data(self):
+        """The received bytes."""
+        return bytes(memoryview(self.buffer)[:self.count])
+
+    def raise_for_status(self):
+        """Raises an :exc:`AardvarkError` if one of the phases failed."""
+        if not self.ok:
+            raise error_from_code(self.status)
@@ -30,6 +30,7 @@ values:
 .. data:: ERR_SPI_SLAVE_READ_ERROR
 .. data:: ERR_SPI_SLAVE_TIMEOUT
 .. data:: ERR_SPI_DROPPED_EXCESS_BYTES
+.. data:: ERR_GPIO_NOT_AVAILABLE
 
 The functions :meth:`Aardvark.i2c_slave_read`, :meth:`Aardvark.i2c_master_read`
 and :meth:`Aardvark.i2c_master_write` will throw an :exc:`IOError` with its
@@ -84,6 +85,33 @@ transaction in case of an error.
     also expects that the last byte sent from this buffer is NACK'ed by the
     opposing master device.
 
+The GPIO functions take and return bitmasks of the following pins. The I2C
+pins are only available as GPIOs if :attr:`Aardvark.enable_i2c` is `False`,
+the SPI pins only if :attr:`Aardvark.enable_spi` is `False`.
+
+.. data:: GPIO_SCL
+.. data:: GPIO_SDA
+.. data:: GPIO_MISO
+.. data:: GPIO_SCK
+.. data:: GPIO_MOSI
+.. data:: GPIO_SS
+.. data:: GPIO_ALL
+
+    All of the above.
+
+To get the name of an error or status code, you can use the following
+dictionaries:
+
+.. data:: ERROR_NAMES
+
+    Maps the error codes to their names, eg. `-6` to
+    ``'ERR_COMMUNICATION_ERROR'``.
+
+.. data:: I2C_STATUS_NAMES
+
+    Maps the I2C status codes to their names, eg. `3` to
+    ``'I2C_STATUS_SLA_NACK'``.
+
 """
 
 ERR_UNABLE_TO_LOAD_LIBRARY = -1
@@ -111,6 +139,7 @@ ERR_SPI_WRITE_ERROR = -202
 ERR_SPI_SLAVE_READ_ERROR = -203
 ERR_SPI_SLAVE_TIMEOUT = -204
 ERR_SPI_DROPPED_EXCESS_BYTES = -205
+ERR_GPIO_NOT_AVAILABLE = -400
 
 PORT_NOT_FREE = 0x8000
 
@@ -120,6 +149,14 @@ CONFIG_GPIO_I2C = 0x02
 CONFIG_SPI_I2C = 0x03
 CONFIG_QUERY = 0x80
 
+GPIO_SCL = 0x01
+GPIO_SDA = 0x02
+GPIO_MISO = 0x04
+GPIO_SCK = 0x08
+GPIO_MOSI = 0x10
+GPIO_SS = 0x20
+GPIO_ALL = 0x3f
+
 I2C_NO_FLAGS = 0x00
 I2C_10_BIT_ADDR = 0x01
 I2C_COMBINED_FMT = 0x02
@@ -161,3 +198,8 @@ SPI_MODE_3 = 3
 
 SPI_SS_ACTIVE_LOW = 0
 SPI_SS_ACTIVE_HIGH = 1
+
+ERROR_NAMES = dict((v, k) for k, v in list(globals().items())
+        if k.startswith('ERR_'))
+I2C_STATUS_NAMES = dict((v, k) for k, v in list(globals().items())
+        if k.startswith('I2C_STATUS_'))
@@ -0,0 +1,194 @@
+# Copyright (c) 2014-2018  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Driver for 24Cxx style I2C EEPROMs.
+
+Example::
+
+  a = pyaardvark.open()
+  a.enable_i2c = True
+  eeprom = I2CEeprom(a, 0x50, size=32768, page_size=64, addr_width=2)
+  eeprom.write(0x100, b'hello')
+  data = eeprom.read(0x100, 5)
+"""
+
+import time
+
+from .errors import I2CNackError
+from .image import _is_path, map_image
+
+
+class I2CEeprom(object):
+    """An EEPROM at the I2C address `i2c_address` connected to the
+    :class:`Aardvark` object `dev`.
+
+    `size` and `page_size` are given in bytes, `addr_width` is the number
+    of address bytes sent to the device. Devices with more memory than the
+    address bytes can reach, like the 24C16 with one address byte, are
+    supported; the upper address bits are put into the I2C address.
+
+    After each page is written, the device is polled until it acknowledges
+    its address again. :class:`I2CNackError` is raised if that takes longer
+    than `write_timeout` seconds.
+    """
+
+    def __init__(self, dev, i2c_address=0x50, size=256, page_size=8,
+            addr_width=1, write_timeout=0.1):
+        if size % page_size:
+            raise ValueError('size must be a multiple of the page size')
+        self.dev = dev
+        self.i2c_address = i2c_address
+        self.size = size
+        self.page_size = page_size
+        self.addr_width = addr_width
+        self.write_timeout = write_timeout
+
+        # number of bytes reachable with the address bytes
+        self._span = 1 << (8 * addr_width)
+
+    def __len__(self):
+        return self.size
+
+    def _check_range(self, offset, length):
+        if offset < 0 or length < 0 or offset + length > self.size:
+            raise ValueError('range 0x%x+0x%x exceeds the device size 0x%x'
+                    % (offset, length, self.size))
+
+    def _address(self, offset, buf):
+        """Store the address bytes for `offset` in `buf` and return the
+        I2C address."""
+        block, addr = divmod(offset, self._span)
+        for i in range(self.addr_width):
+            buf[i] = (addr >> (8 * (self.addr_width - i - 1))) & 0xff
+        return self.i2c_address + block
+
+    def wait_ready(self, timeout=None):
+        """Poll the device until it acknowledges its address, ie. until an
+        internal write cycle is finished."""
+        self._wait_ready(self.i2c_address, timeout)
+
+    def _wait_ready(self, i2c_address, timeout=None):
+        if timeout is None:
+            timeout = self.write_timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self.dev.i2c_master_write(i2c_address, b'')
+                return
+            except I2CNackError:
+                if time.monotonic() > deadline:
+                    raise
+
+    def read(self, offset=0, length=None):
+        """Read `length` bytes starting at `offset`. If `length` is omitted,
+        everything up to the end of the device is read."""
+        if length is None:
+            length = self.size - offset
+        buf = bytearray(length)
+        self.read_into(buf, offset)
+        return bytes(buf)
+
+    def read_into(self, buf, offset=0, progress=None):
+        """Read into `buf`, which can be any writable object supporting the
+        buffer protocol, starting at `offset`. As many bytes as fit into
+        `buf` are read, in chunks of at most :attr:`Aardvark.BUFFER_SIZE`
+        bytes.
+
+        If given, ``progress(done, total)`` is called after each chunk.
+
+        Returns the number of bytes read.
+        """
+        view = memoryview(buf).cast('B')
+        length = len(view)
+        self._check_range(offset, length)
+        addr = bytearray(self.addr_width)
+        pos = 0
+        while pos < length:
+            start = offset + pos
+            # sequential reads don't cross the blocks selected by the I2C
+            # address
+            n = min(length - pos, self.dev.BUFFER_SIZE,
+                    self._span - start % self._span)
+            i2c_address = self._address(start, addr)
+            self.dev.i2c_master_write_read_ext(i2c_address, addr,
+                    view[pos:pos + n]).raise_for_status()
+            pos += n
+            if progress is not None:
+                progress(pos, length)
+        return length
+
+    def read_to_file(self, f, offset=0, length=None, chunk_size=None,
+            progress=None):
+        """Read `length` bytes starting at `offset` and write them to `f`.
+
+        If `f` is a file name, the file is mapped into memory and the data
+        is read straight into it, see :func:`pyaardvark.image.map_image`.
+        Otherwise `f` is a file object and the data is read in chunks of
+        `chunk_size` bytes (:attr:`Aardvark.BUFFER_SIZE` by default) into a
+        single reused buffer.
+
+        If given, ``progress(done, total)`` is called after each chunk.
+
+        Returns the number of bytes read.
+        """
+        if length is None:
+            length = self.size - offset
+        self._check_range(offset, length)
+        if _is_path(f):
+            with map_image(f, writable=True, size=length) as view:
+                return self.read_into(view, offset, progress)
+        if chunk_size is None:
+            chunk_size = self.dev.BUFFER_SIZE
+        buf = bytearray(min(chunk_size, length))
+        view = memoryview(buf)
+        pos = 0
+        while pos < length:
+            n = min(length - pos, len(buf))
+            self.read_into(view[:n], offset + pos)
+            f.write(view[:n])
+            pos += n
+            if progress is not None:
+                progress(pos, length)
+        return length
+
+    def write(self, offset, data, progress=None):
+        """Write `data`, which can be any object supporting the buffer
+        protocol or a file name, starting at `offset`.
+
+        The data is split on page boundaries. After each page the device is
+        polled until the write cycle is finished, so the data can be read
+        back as soon as this method returns. If given, ``progress(done,
+        total)`` is called after each page.
+        """
+        with map_image(data) as data:
+            self._write(offset, data, progress)
+
+    def _write(self, offset, data, progress):
+        length = len(data)
+        self._check_range(offset, length)
+        buf = bytearray(self.addr_width + self.page_size)
+        pos = 0
+        while pos < length:
+            start = offset + pos
+            n = min(length - pos, self.page_size - start % self.page_size)
+            i2c_address = self._address(start, buf)
+            buf[self.addr_width:self.addr_width + n] = data[pos:pos + n]
+            self.dev.i2c_master_write(i2c_address,
+                    memoryview(buf)[:self.addr_width + n])
+            self._wait_ready(i2c_address)
+            pos += n
+            if progress is not None:
+                progress(pos, length)
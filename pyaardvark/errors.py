@@ -0,0 +1,107 @@
+# Copyright (c) 2014-2018  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""
+.. currentmodule:: pyaardvark
+
+All exceptions raised by the library are derived from :exc:`AardvarkError`,
+which itself is an :exc:`IOError`. Therefore, code which catches
+:exc:`IOError` and checks the :attr:`errno` attribute keeps working. The
+following hierarchy is used::
+
+  IOError
+   +-- AardvarkError
+        +-- CommunicationError
+        +-- I2CError
+        |    +-- I2CBusError
+        |    +-- I2CNackError
+        |    +-- I2CArbitrationLostError
+        |    +-- I2CBusLockedError
+        +-- SPIError
+"""
+
+from .constants import *
+
+
+class AardvarkError(IOError):
+    """Base class for all errors. :attr:`errno` is either an error code or
+    an I2C status code."""
+
+
+class CommunicationError(AardvarkError):
+    """The communication with the adapter failed, eg. because it was
+    disconnected."""
+
+
+class I2CError(AardvarkError):
+    """An I2C transaction failed."""
+
+
+class I2CBusError(I2CError):
+    """A bus error occured, see :data:`I2C_STATUS_BUS_ERROR`."""
+
+
+class I2CNackError(I2CError):
+    """Either the slave address or a data byte was not acknowledged, see
+    :data:`I2C_STATUS_SLA_NACK` and :data:`I2C_STATUS_DATA_NACK`."""
+
+
+class I2CArbitrationLostError(I2CError):
+    """The bus arbitration was lost, see :data:`I2C_STATUS_ARB_LOST` and
+    :data:`I2C_STATUS_SLA_ACK`."""
+
+
+class I2CBusLockedError(I2CError):
+    """The bus lock timeout expired, see :data:`I2C_STATUS_BUS_LOCKED`."""
+
+
+class SPIError(AardvarkError):
+    """A SPI transaction failed."""
+
+
+_ERROR_CLASSES = dict()
+for _code, _name in ERROR_NAMES.items():
+    if _name.startswith('ERR_I2C_'):
+        _ERROR_CLASSES[_code] = I2CError
+    elif _name.startswith('ERR_SPI_'):
+        _ERROR_CLASSES[_code] = SPIError
+    else:
+        _ERROR_CLASSES[_code] = AardvarkError
+_ERROR_CLASSES[ERR_COMMUNICATION_ERROR] = CommunicationError
+
+_I2C_STATUS_CLASSES = {
+    I2C_STATUS_BUS_ERROR: I2CBusError,
+    I2C_STATUS_SLA_ACK: I2CArbitrationLostError,
+    I2C_STATUS_SLA_NACK: I2CNackError,
+    I2C_STATUS_DATA_NACK: I2CNackError,
+    I2C_STATUS_ARB_LOST: I2CArbitrationLostError,
+    I2C_STATUS_BUS_LOCKED: I2CBusLockedError,
+}
+
+
+def error_from_code(code, message=None):
+    """Return the exception for an error code (if `code` is negative) or an
+    I2C status code. If `message` is omitted, the name of the code is
+    used."""
+    if code < 0:
+        cls = _ERROR_CLASSES.get(code, AardvarkError)
+        if message is None:
+            message = ERROR_NAMES.get(code, 'ERR_UNKNOWN')
+    else:
+        cls = _I2C_STATUS_CLASSES.get(code, I2CError)
+        if message is None:
+            message = I2C_STATUS_NAMES.get(code, 'I2C_STATUS_UNKNOWN_STATUS')
+    return cls(code, message)
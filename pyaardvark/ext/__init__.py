@@ -1,41 +1,57 @@
+import os
 import sys
 
-if sys.platform.startswith('linux'):
-    try:
-        from .linux32 import aardvark as api
-    except ImportError:
+def _load_native():
+    if sys.platform.startswith('linux'):
         try:
-            from .linux64 import aardvark as api
+            from .linux32 import aardvark as api
         except ImportError:
             try:
-                from .linuxarm32 import aardvark as api
+                from .linux64 import aardvark as api
             except ImportError:
                 try:
-                    from .linuxarm64 import aardvark as api
+                    from .linuxarm32 import aardvark as api
                 except ImportError:
-                    api = None
-elif sys.platform.startswith('win32'):
-    try:
-        from .win32 import aardvark as api
-    except ImportError:
+                    try:
+                        from .linuxarm64 import aardvark as api
+                    except ImportError:
+                        api = None
+    elif sys.platform.startswith('win32'):
         try:
-            from .win64 import aardvark as api
+            from .win32 import aardvark as api
         except ImportError:
             try:
-                from .winarm import aardvark as api
+                from .win64 import aardvark as api
             except ImportError:
-                api = None
-elif sys.platform.startswith('darwin'):
-    try:
-        from .osx64 import aardvark as api
-    except ImportError:
+                try:
+                    from .winarm import aardvark as api
+                except ImportError:
+                    api = None
+    elif sys.platform.startswith('darwin'):
         try:
-            from .osxarm import aardvark as api
+            from .osx64 import aardvark as api
         except ImportError:
-            api = None
-else:
-    api = None
+            try:
+                from .osxarm import aardvark as api
+            except ImportError:
+                api = None
+    else:
+        api = None
+
+    if not api:
+        raise RuntimeError('Unable to find suitable binary interface. '
+                'Unsupported platform?')
+    return api
+
+def load_backend(name):
+    """Return the binding module for the backend `name`, which is either
+    ``native`` for the binary module supplied by Total Phase or ``sim`` for
+    the simulator."""
+    if name == 'native':
+        return _load_native()
+    elif name == 'sim':
+        from .. import sim
+        return sim
+    raise ValueError('Unknown backend %r' % (name,))
 
-if not api:
-    raise RuntimeError('Unable to find suitable binary interface. '
-            'Unsupported platform?')
+api = load_backend(os.environ.get('PYAARDVARK_BACKEND', 'native'))
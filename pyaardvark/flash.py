@@ -0,0 +1,337 @@
+# Copyright (c) 2014-2018  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Driver for SPI NOR flashes.
+
+The geometry of the flash is read from its SFDP tables (JESD216). Devices
+without SFDP fall back to the capacity given by the JEDEC ID, 256 byte pages
+and the usual 4k, 32k and 64k erase commands.
+
+Example::
+
+  a = pyaardvark.open()
+  a.enable_spi = True
+  flash = SPIFlash(a)
+  flash.erase(0, 0x10000)
+  flash.program(0, image)
+  data = flash.read(0, len(image))
+"""
+
+import struct
+import time
+
+from .constants import *
+from .errors import AardvarkError
+from .image import _is_path, map_image
+
+CMD_WRITE_ENABLE = 0x06
+CMD_READ_STATUS = 0x05
+CMD_READ_JEDEC_ID = 0x9f
+CMD_READ_SFDP = 0x5a
+CMD_CHIP_ERASE = 0xc7
+
+# 3-byte address commands and their 4-byte address counterparts
+CMD_FAST_READ = (0x0b, 0x0c)
+CMD_PAGE_PROGRAM = (0x02, 0x12)
+CMD_ERASE = {
+    0x20: 0x21,
+    0x52: 0x5c,
+    0xd8: 0xdc,
+}
+
+SR_WIP = 0x01
+
+_DEFAULT_ERASE_TYPES = ((4096, 0x20), (32768, 0x52), (65536, 0xd8))
+
+
+class SPIFlash(object):
+    """A SPI NOR flash connected to the :class:`Aardvark` object `dev`.
+
+    The SPI interface is configured for `spi_mode` and the flash is probed,
+    see :meth:`probe`. The probed geometry can be overridden by passing
+    `size` or `page_size`.
+
+    Program operations raise an :class:`AardvarkError` if the flash is
+    still busy after `program_timeout` seconds, erase operations after
+    `erase_timeout` seconds and a chip erase after `chip_erase_timeout`
+    seconds.
+    """
+
+    program_timeout = 0.1
+    erase_timeout = 5.0
+    chip_erase_timeout = 600.0
+
+    def __init__(self, dev, spi_mode=SPI_MODE_0, size=None, page_size=None):
+        self.dev = dev
+        dev.spi_configure_mode(spi_mode)
+
+        #: The JEDEC ID as bytes (manufacturer, memory type, capacity).
+        self.jedec_id = None
+        #: Size in bytes.
+        self.size = None
+        #: Page size in bytes.
+        self.page_size = 256
+        #: List of tuples ``(size, opcode)`` of the supported erase
+        #: commands, sorted by size.
+        self.erase_types = list(_DEFAULT_ERASE_TYPES)
+        #: Number of address bytes, 3 or 4.
+        self.addr_width = 3
+
+        self.probe()
+        if size is not None:
+            self.size = size
+        if page_size is not None:
+            self.page_size = page_size
+        if self.size is None:
+            raise AardvarkError(ERR_SPI_NOT_AVAILABLE,
+                    'unable to determine the flash size')
+
+    def __len__(self):
+        return self.size
+
+    def _command(self, cmd, addr=None, width=3, dummy=0, length=0):
+        out = bytearray(1 + (width if addr is not None else 0) + dummy
+                + length)
+        out[0] = cmd
+        if addr is not None:
+            out[1:1 + width] = addr.to_bytes(width, 'big')
+        return self.dev.spi_write(out)[len(out) - length:]
+
+    def read_jedec_id(self):
+        """Read the JEDEC ID."""
+        return self._command(CMD_READ_JEDEC_ID, length=3)
+
+    def read_sfdp(self, addr, length):
+        """Read `length` bytes of the SFDP tables starting at `addr`."""
+        return self._command(CMD_READ_SFDP, addr, dummy=1, length=length)
+
+    def probe(self):
+        """Read the JEDEC ID and the SFDP basic flash parameter table to
+        determine the geometry of the flash."""
+        self.jedec_id = self.read_jedec_id()
+        if self.jedec_id in (b'\x00\x00\x00', b'\xff\xff\xff'):
+            raise AardvarkError(ERR_SPI_NOT_AVAILABLE, 'no flash found')
+        if not self._probe_sfdp():
+            # the capacity byte is the log2 of the size for most vendors
+            capacity = self.jedec_id[2]
+            self.size = 1 << capacity if 10 <= capacity < 32 else None
+        self.addr_width = 4 if self.size and self.size > 1 << 24 else 3
+
+    def _probe_sfdp(self):
+        header = self.read_sfdp(0, 16)
+        if header[:4] != b'SFDP':
+            return False
+        # the first parameter header always belongs to the basic flash
+        # parameter table
+        length = header[11]
+        ptr = int.from_bytes(header[12:15], 'little')
+        if length < 9:
+            return False
+        table = self.read_sfdp(ptr, min(length, 16) * 4)
+        dwords = struct.unpack('<%dI' % (len(table) // 4), table)
+
+        density = dwords[1]
+        if density & (1 << 31):
+            self.size = (1 << (density & 0x7fffffff)) // 8
+        else:
+            self.size = (density + 1) // 8
+
+        erase_types = list()
+        for dword in dwords[7:9]:
+            for shift in (0, 16):
+                n = (dword >> shift) & 0xff
+                if n:
+                    opcode = (dword >> (shift + 8)) & 0xff
+                    erase_types.append((1 << n, opcode))
+        if erase_types:
+            self.erase_types = sorted(erase_types)
+
+        if len(dwords) >= 11:
+            self.page_size = 1 << ((dwords[10] >> 4) & 0xf)
+        return True
+
+    def read_status(self):
+        """Read the status register."""
+        return self._command(CMD_READ_STATUS, length=1)[0]
+
+    def write_enable(self):
+        self._command(CMD_WRITE_ENABLE)
+
+    def wait_ready(self, timeout=None):
+        """Poll the status register until the write in progress bit is
+        cleared."""
+        if timeout is None:
+            timeout = self.program_timeout
+        deadline = time.monotonic() + timeout
+        while self.read_status() & SR_WIP:
+            if time.monotonic() > deadline:
+                raise AardvarkError(ERR_SPI_WRITE_ERROR,
+                        'flash operation timed out')
+
+    def _check_range(self, offset, length):
+        if offset < 0 or length < 0 or offset + length > self.size:
+            raise ValueError('range 0x%x+0x%x exceeds the device size 0x%x'
+                    % (offset, length, self.size))
+
+    def read(self, offset=0, length=None):
+        """Read `length` bytes starting at `offset`. If `length` is omitted,
+        everything up to the end of the flash is read."""
+        if length is None:
+            length = self.size - offset
+        buf = bytearray(length)
+        self.read_into(buf, offset)
+        return bytes(buf)
+
+    def read_into(self, buf, offset=0, progress=None):
+        """Read into `buf`, which can be any writable object supporting the
+        buffer protocol, starting at `offset`.
+
+        The fast read command is used. Each transfer is as large as
+        :attr:`Aardvark.BUFFER_SIZE` allows and uses the same pair of
+        transfer buffers. If given, ``progress(done, total)`` is called
+        after each transfer.
+
+        Returns the number of bytes read.
+        """
+        view = memoryview(buf).cast('B')
+        length = len(view)
+        self._check_range(offset, length)
+        cmd = CMD_FAST_READ[self.addr_width == 4]
+        header = 2 + self.addr_width
+        chunk = min(length, self.dev.BUFFER_SIZE - header)
+        out = bytearray(header + chunk)
+        out_view = memoryview(out)
+        rx_view = memoryview(bytearray(header + chunk))
+        out[0] = cmd
+        pos = 0
+        while pos < length:
+            n = min(length - pos, chunk)
+            out[1:1 + self.addr_width] = (offset + pos).to_bytes(
+                    self.addr_width, 'big')
+            self.dev.spi_transfer_into(out_view[:header + n],
+                    rx_view[:header + n])
+            view[pos:pos + n] = rx_view[header:header + n]
+            pos += n
+            if progress is not None:
+                progress(pos, length)
+        return length
+
+    def read_to_file(self, f, offset=0, length=None, chunk_size=1 << 20,
+            progress=None):
+        """Read `length` bytes starting at `offset` and write them to `f`.
+
+        If `f` is a file name, the file is mapped into memory and the data
+        is read straight into it, see :func:`pyaardvark.image.map_image`.
+        Otherwise `f` is a file object and the data is written in chunks of
+        `chunk_size` bytes.
+
+        If given, ``progress(done, total)`` is called after each chunk.
+
+        Returns the number of bytes read.
+        """
+        if length is None:
+            length = self.size - offset
+        self._check_range(offset, length)
+        if _is_path(f):
+            with map_image(f, writable=True, size=length) as view:
+                return self.read_into(view, offset, progress)
+        buf = bytearray(min(chunk_size, length))
+        view = memoryview(buf)
+        pos = 0
+        while pos < length:
+            n = min(length - pos, len(buf))
+            self.read_into(view[:n], offset + pos)
+            f.write(view[:n])
+            pos += n
+            if progress is not None:
+                progress(pos, length)
+        return length
+
+    def program(self, offset, data, progress=None):
+        """Program `data`, which can be any object supporting the buffer
+        protocol or a file name, starting at `offset`. The range has to be
+        erased.
+
+        The data is split on page boundaries. After each page, the status
+        register is polled until the flash is ready again. If given,
+        ``progress(done, total)`` is called after each page.
+        """
+        with map_image(data) as data:
+            self._program(offset, data, progress)
+
+    def _program(self, offset, data, progress):
+        length = len(data)
+        self._check_range(offset, length)
+        cmd = CMD_PAGE_PROGRAM[self.addr_width == 4]
+        header = 1 + self.addr_width
+        buf = bytearray(header + self.page_size)
+        buf[0] = cmd
+        pos = 0
+        while pos < length:
+            start = offset + pos
+            n = min(length - pos, self.page_size - start % self.page_size)
+            buf[1:header] = start.to_bytes(self.addr_width, 'big')
+            buf[header:header + n] = data[pos:pos + n]
+            self.write_enable()
+            self.dev.spi_write(memoryview(buf)[:header + n])
+            self.wait_ready(self.program_timeout)
+            pos += n
+            if progress is not None:
+                progress(pos, length)
+
+    def erase_plan(self, offset, length):
+        """Return the list of erase operations :meth:`erase` would use for
+        the given range as tuples ``(offset, size)``. A size equal to
+        :attr:`size` stands for a chip erase."""
+        self._check_range(offset, length)
+        smallest = self.erase_types[0][0]
+        if offset % smallest or length % smallest:
+            raise ValueError('range 0x%x+0x%x is not aligned to the erase '
+                    'size 0x%x' % (offset, length, smallest))
+        if offset == 0 and length == self.size:
+            return [(0, self.size)]
+        plan = list()
+        end = offset + length
+        while offset < end:
+            for size, _ in reversed(self.erase_types):
+                if offset % size == 0 and offset + size <= end:
+                    break
+            plan.append((offset, size))
+            offset += size
+        return plan
+
+    def erase(self, offset=0, length=None):
+        """Erase `length` bytes starting at `offset`. If `length` is
+        omitted, everything up to the end of the flash is erased.
+
+        The range is erased with as few operations as possible, ie. the
+        largest erase size which fits is chosen for each step and the whole
+        flash is erased with a single chip erase.
+        """
+        if length is None:
+            length = self.size - offset
+        opcodes = dict(self.erase_types)
+        for addr, size in self.erase_plan(offset, length):
+            self.write_enable()
+            if size == self.size:
+                self._command(CMD_CHIP_ERASE)
+                self.wait_ready(self.chip_erase_timeout)
+                continue
+            opcode = opcodes[size]
+            if self.addr_width == 4:
+                opcode = CMD_ERASE.get(opcode, opcode)
+            self._command(opcode, addr, self.addr_width)
+            self.wait_ready(self.erase_timeout)
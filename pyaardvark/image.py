@@ -0,0 +1,85 @@
+# Copyright (c) 2014-2018  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Image files as sources and sinks of bulk transfers.
+
+:func:`map_image` maps a file into memory, so images larger than the
+available RAM can be transferred. The memory drivers accept file names
+wherever they accept buffers for their bulk transfers, eg.::
+
+  flash.program(0, 'firmware.bin', progress=print)
+  flash.read_to_file('dump.bin')
+"""
+
+import contextlib
+import mmap
+import os
+
+
+def _is_path(obj):
+    return isinstance(obj, str) or hasattr(obj, '__fspath__')
+
+
+@contextlib.contextmanager
+def map_image(source, writable=False, size=None):
+    """Return a context manager which yields a byte-wise
+    :class:`memoryview` of `source`.
+
+    `source` is either a file name, in which case the file is mapped into
+    memory, or an object supporting the buffer protocol, like an
+    :class:`mmap.mmap` object, which is used as is.
+
+    Files are mapped copy-on-write unless `writable` is `True`. Thus the
+    view is writable in both cases, which allows passing it to the
+    binding without copying, but changes only reach the file if `writable`
+    is `True`. A writable file is created if it doesn't exist and resized
+    to `size` bytes if `size` is given.
+    """
+    if not _is_path(source):
+        yield memoryview(source).cast('B')
+        return
+
+    path = os.fspath(source)
+    if writable:
+        mode = 'r+b' if os.path.exists(path) else 'w+b'
+    else:
+        mode = 'rb'
+    with open(path, mode) as f:
+        if writable and size is not None:
+            f.truncate(size)
+        length = os.fstat(f.fileno()).st_size
+        if length == 0:
+            # empty files can't be mapped
+            yield memoryview(bytearray())
+            return
+        access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_COPY
+        m = mmap.mmap(f.fileno(), length, access=access)
+        view = memoryview(m)
+        try:
+            yield view
+            if writable:
+                m.flush()
+        except BaseException:
+            view.release()
+            try:
+                m.close()
+            except BufferError:
+                # slices of the view are still referenced by the traceback,
+                # the mapping is closed once they are garbage collected
+                pass
+            raise
+        view.release()
+        m.close()
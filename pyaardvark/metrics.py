@@ -0,0 +1,320 @@
+# Copyright (c) 2014-2018  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Counters and latency histograms of the transfer methods.
+
+Metrics are collected after :meth:`Aardvark.enable_metrics` was called::
+
+  metrics = a.enable_metrics()
+  ...
+  print(metrics.snapshot()['methods']['i2c_master_write'])
+  metrics.write_prometheus('/var/lib/node_exporter/aardvark.prom',
+          labels={'serial': a.unique_id_str()})
+
+The measured methods are replaced on the device object itself, so a device
+without metrics calls the methods of its class directly and doesn't pay
+anything. Calls made by other measured methods, eg. the
+:meth:`Aardvark.i2c_master_write` of :meth:`Aardvark.i2c_master_write_read`,
+are only accounted to the outer method.
+"""
+
+import bisect
+import functools
+import os
+import threading
+import time
+
+from .constants import *
+from .errors import I2CError
+
+#: Upper bounds of the latency buckets in seconds.
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+        0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+_STATUS_COUNTERS = {
+    I2C_STATUS_SLA_NACK: 'nacks',
+    I2C_STATUS_DATA_NACK: 'nacks',
+    I2C_STATUS_SLA_ACK: 'arbitration_lost',
+    I2C_STATUS_ARB_LOST: 'arbitration_lost',
+    I2C_STATUS_BUS_LOCKED: 'bus_locked',
+}
+
+
+def _arg(args, kwargs, index, name):
+    if len(args) > index:
+        return args[index]
+    return kwargs[name]
+
+
+def _nbytes(obj):
+    if isinstance(obj, int):
+        return obj
+    return memoryview(obj).nbytes
+
+
+def _written_data(args, kwargs, result):
+    return _nbytes(_arg(args, kwargs, 1, 'data'))
+
+
+def _read_result(args, kwargs, result):
+    return len(result)
+
+
+def _read_count(args, kwargs, result):
+    return result
+
+
+# Methods which are measured and how many bytes they write and read
+_METHODS = {
+    'i2c_master_write': (_written_data, None),
+    'i2c_master_read': (None, _read_result),
+    'i2c_master_read_into': (None, _read_count),
+    'i2c_master_write_read': (_written_data, _read_result),
+    'i2c_master_write_read_into': (_written_data, _read_count),
+    'i2c_master_write_read_ext': (lambda a, k, r: r.written,
+            lambda a, k, r: r.count),
+    'i2c_batch': (None,
+            lambda a, k, r: sum(len(d) for d in r.data if d is not None)),
+    'i2c_stop': (None, None),
+    'i2c_slave_read': (None, lambda a, k, r: len(r[1])),
+    'i2c_slave_read_into': (None, lambda a, k, r: r[1]),
+    'poll': (None, None),
+    'spi_write': (lambda a, k, r: _nbytes(_arg(a, k, 0, 'data')),
+            _read_result),
+    'spi_transfer_into': (_read_count, _read_count),
+    'spi_slave_read': (None, _read_result),
+    'spi_slave_read_into': (None, _read_count),
+    'gpio_get': (None, None),
+    'gpio_set': (None, None),
+    'gpio_wait_change': (None, None),
+}
+
+
+class MethodMetrics(object):
+    """The counters and the latency histogram of one method."""
+
+    __slots__ = ('calls', 'errors', 'bytes_written', 'bytes_read',
+            'latency_sum', 'latency_counts')
+
+    def __init__(self, buckets):
+        self.calls = 0
+        self.errors = 0
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self.latency_sum = 0.0
+        # one count per bucket plus one for the values above the last
+        # bound
+        self.latency_counts = [0] * (len(buckets) + 1)
+
+
+class Metrics(object):
+    """The metrics of a device.
+
+    `buckets` are the upper bounds of the latency histogram buckets in
+    seconds, see :data:`DEFAULT_BUCKETS`.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Reset all counters."""
+        with self._lock:
+            self._methods = dict()
+            self._counters = dict(transfers=0, nacks=0, arbitration_lost=0,
+                    bus_locked=0)
+
+    def _method(self, name):
+        m = self._methods.get(name)
+        if m is None:
+            m = self._methods[name] = MethodMetrics(self.buckets)
+        return m
+
+    def _record(self, name, duration, written, read, transfers, statuses,
+            failed):
+        index = bisect.bisect_left(self.buckets, duration)
+        with self._lock:
+            m = self._method(name)
+            m.calls += 1
+            m.latency_sum += duration
+            m.latency_counts[index] += 1
+            m.bytes_written += written
+            m.bytes_read += read
+            counters = self._counters
+            counters['transfers'] += transfers
+            for status in statuses:
+                key = _STATUS_COUNTERS.get(status)
+                if key is not None:
+                    counters[key] += 1
+            if failed:
+                m.errors += 1
+
+    def snapshot(self):
+        """Return the metrics as a dictionary.
+
+        The keys ``transfers``, ``nacks``, ``arbitration_lost`` and
+        ``bus_locked`` hold the counters of the device. ``methods`` maps the
+        names of the called methods to dictionaries with the keys
+        ``calls``, ``errors``, ``bytes_written``, ``bytes_read``,
+        ``latency_sum`` and ``latency_buckets``. The latter is a list of
+        tuples ``(upper_bound, count)``, the last bound is infinity.
+        """
+        bounds = self.buckets + (float('inf'),)
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot['methods'] = dict((name, dict(calls=m.calls,
+                    errors=m.errors, bytes_written=m.bytes_written,
+                    bytes_read=m.bytes_read, latency_sum=m.latency_sum,
+                    latency_buckets=list(zip(bounds, m.latency_counts))))
+                    for name, m in self._methods.items())
+        return snapshot
+
+    def prometheus_text(self, labels=None, prefix='aardvark'):
+        """Return the metrics in the Prometheus text format. `labels` is a
+        dictionary of labels added to all samples, eg. the serial number of
+        the adapter."""
+        snapshot = self.snapshot()
+        base = ''.join('%s="%s",' % (k, _escape(v))
+                for k, v in sorted((labels or {}).items()))
+        lines = list()
+
+        def sample(name, value, extra=''):
+            label_str = (base + extra).rstrip(',')
+            if label_str:
+                lines.append('%s_%s{%s} %s' % (prefix, name, label_str,
+                        _format(value)))
+            else:
+                lines.append('%s_%s %s' % (prefix, name, _format(value)))
+
+        for key, help in (
+                ('transfers', 'Number of transfers.'),
+                ('nacks', 'Number of I2C transfers which were not '
+                        'acknowledged.'),
+                ('arbitration_lost', 'Number of I2C transfers which lost '
+                        'the arbitration.'),
+                ('bus_locked', 'Number of I2C transfers which timed out on '
+                        'a locked bus.')):
+            lines.append('# HELP %s_%s_total %s' % (prefix, key, help))
+            lines.append('# TYPE %s_%s_total counter' % (prefix, key))
+            sample(key + '_total', snapshot[key])
+
+        methods = sorted(snapshot['methods'].items())
+        for key, help in (
+                ('calls', 'Number of calls per method.'),
+                ('errors', 'Number of failed calls per method.'),
+                ('bytes_written', 'Number of bytes written per method.'),
+                ('bytes_read', 'Number of bytes read per method.')):
+            lines.append('# HELP %s_%s_total %s' % (prefix, key, help))
+            lines.append('# TYPE %s_%s_total counter' % (prefix, key))
+            for name, m in methods:
+                sample(key + '_total', m[key], 'method="%s",' % name)
+
+        lines.append('# HELP %s_call_duration_seconds Duration of the '
+                'calls per method.' % prefix)
+        lines.append('# TYPE %s_call_duration_seconds histogram' % prefix)
+        for name, m in methods:
+            method = 'method="%s",' % name
+            total = 0
+            for bound, count in m['latency_buckets']:
+                total += count
+                le = '+Inf' if bound == float('inf') else _format(bound)
+                sample('call_duration_seconds_bucket', total,
+                        '%sle="%s",' % (method, le))
+            sample('call_duration_seconds_sum', m['latency_sum'], method)
+            sample('call_duration_seconds_count', m['calls'], method)
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, filename, labels=None, prefix='aardvark'):
+        """Write :meth:`prometheus_text` to `filename`. The file is replaced
+        atomically, so it can be read by the textfile collector of the node
+        exporter at any time."""
+        tmp = '%s.%d.tmp' % (filename, os.getpid())
+        with open(tmp, 'w') as f:
+            f.write(self.prometheus_text(labels, prefix))
+        os.replace(tmp, filename)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+            '\n', '\\n')
+
+
+def _format(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _measured(func, name, metrics, local, written, read):
+    clock = time.perf_counter
+    # poll and the GPIO methods are no transfers
+    transfers = 1 if written or read or name == 'i2c_stop' else 0
+
+    @functools.wraps(func)
+    def measured(*args, **kwargs):
+        if local.__dict__.get('active'):
+            return func(*args, **kwargs)
+        local.active = True
+        start = clock()
+        try:
+            result = func(*args, **kwargs)
+        except I2CError as e:
+            metrics._record(name, clock() - start, 0, 0, transfers,
+                    (e.errno,), True)
+            raise
+        except Exception:
+            metrics._record(name, clock() - start, 0, 0, transfers, (),
+                    True)
+            raise
+        finally:
+            local.active = False
+        duration = clock() - start
+
+        statuses = ()
+        failed = False
+        count = transfers
+        if name == 'i2c_batch':
+            statuses = [s for s in result.statuses if s is not None]
+            failed = not result.ok
+            count = len(statuses)
+        elif name == 'i2c_master_write_read_ext':
+            statuses = (result.status,)
+            failed = not result.ok
+        metrics._record(name, duration,
+                written(args, kwargs, result) if written else 0,
+                read(args, kwargs, result) if read else 0,
+                count, statuses, failed)
+        return result
+    return measured
+
+
+def _instrument(dev, metrics):
+    """Replace the measured methods of `dev` by wrappers which record
+    their calls in `metrics`."""
+    local = threading.local()
+    for name, (written, read) in _METHODS.items():
+        func = getattr(type(dev), name, None)
+        if func is None:
+            continue
+        setattr(dev, name, _measured(getattr(dev, name), name, metrics,
+                local, written, read))
+
+
+def _uninstrument(dev):
+    for name in _METHODS:
+        dev.__dict__.pop(name, None)
@@ -0,0 +1,233 @@
+# Copyright (c) 2014-2018  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+import collections
+import concurrent.futures
+import time
+
+from .aardvark import find_devices, open
+
+
+def _call(dev, func, args, kwargs):
+    start = time.monotonic()
+    try:
+        return (func(dev, *args, **kwargs), None, time.monotonic() - start)
+    except Exception as e:
+        return (None, e, time.monotonic() - start)
+
+
+class _ThreadWorker(object):
+    def __init__(self, serial_number, backend):
+        self.device = open(serial_number=serial_number, backend=backend)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1,
+                thread_name_prefix='aardvark-%s' % serial_number)
+
+    def submit(self, func, args, kwargs):
+        return self._executor.submit(_call, self.device, func, args, kwargs)
+
+    def close(self):
+        self._executor.shutdown()
+        self.device.close()
+
+
+# The device owned by a worker process
+_process_device = None
+
+def _process_open(serial_number, backend):
+    global _process_device
+    _process_device = open(serial_number=serial_number, backend=backend)
+
+def _process_call(func, args, kwargs):
+    return _call(_process_device, func, args, kwargs)
+
+def _process_close():
+    global _process_device
+    _process_device.close()
+    _process_device = None
+
+
+class _ProcessWorker(object):
+    device = None
+
+    def __init__(self, serial_number, backend):
+        self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=1)
+        try:
+            self._executor.submit(_process_open, serial_number,
+                    backend).result()
+        except BaseException:
+            self._executor.shutdown()
+            raise
+
+    def submit(self, func, args, kwargs):
+        return self._executor.submit(_process_call, func, args, kwargs)
+
+    def close(self):
+        try:
+            self._executor.submit(_process_close).result()
+        finally:
+            self._executor.shutdown()
+
+
+class DevicePool(object):
+    """A set of adapters which are kept open to run operations on all of
+    them in parallel.
+
+    `serial_numbers` is the list of serial numbers of the adapters to open.
+    If omitted, all adapters which are not in use are opened. `backend` is
+    passed to :func:`pyaardvark.open`.
+
+    Each adapter gets its own worker thread. If `processes` is `True`, each
+    adapter gets its own worker process instead, which opens and owns the
+    device. Use processes if the work done in Python dominates the time
+    spent in the binding. In that case, the callables passed to :meth:`run`
+    and their arguments and results have to be picklable.
+
+    Example::
+
+      def program(a, image):
+          a.enable_i2c = True
+          a.i2c_master_write(0x50, image)
+          return a.unique_id_str()
+
+      with DevicePool() as pool:
+          result = pool.run(program, image)
+          print(result.errors)
+    """
+
+    def __init__(self, serial_numbers=None, backend=None, processes=False):
+        if serial_numbers is None:
+            serial_numbers = [d['serial_number']
+                    for d in find_devices(backend) if not d['in_use']]
+        worker_cls = _ProcessWorker if processes else _ThreadWorker
+        self._workers = collections.OrderedDict()
+        try:
+            for serial_number in serial_numbers:
+                self._workers[serial_number] = worker_cls(serial_number,
+                        backend)
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.close()
+        return False
+
+    def __len__(self):
+        return len(self._workers)
+
+    def __getitem__(self, serial_number):
+        """Return the :class:`Aardvark` object of an adapter. Not available
+        if the pool uses worker processes."""
+        dev = self._workers[serial_number].device
+        if dev is None:
+            raise KeyError(serial_number)
+        return dev
+
+    @property
+    def serial_numbers(self):
+        """The serial numbers of all adapters of the pool."""
+        return list(self._workers)
+
+    def close(self):
+        """Close all adapters."""
+        while self._workers:
+            _, worker = self._workers.popitem()
+            worker.close()
+
+    def run(self, func, *args, serial_numbers=None, **kwargs):
+        """Call ``func(dev, *args, **kwargs)`` for each adapter in parallel
+        and wait until all calls are finished.
+
+        The keyword-only argument `serial_numbers` restricts the call to a
+        subset of the adapters. It is not passed to `func`.
+
+        Returns a :class:`PoolResult` object. Exceptions raised by `func`
+        are recorded in the result, not raised.
+        """
+        if serial_numbers is None:
+            serial_numbers = self.serial_numbers
+
+        start = time.monotonic()
+        futures = [(sn, self._workers[sn].submit(func, args, kwargs))
+                for sn in serial_numbers]
+        results = collections.OrderedDict()
+        for sn, future in futures:
+            results[sn] = DeviceResult(sn, *future.result())
+        return PoolResult(results, time.monotonic() - start)
+
+
+class DeviceResult(object):
+    """The outcome of a call on one adapter of a :class:`DevicePool`."""
+
+    __slots__ = ('serial_number', 'value', 'error', 'duration')
+
+    def __init__(self, serial_number, value, error, duration):
+        self.serial_number = serial_number
+        #: The return value of the call.
+        self.value = value
+        #: The exception raised by the call or `None`.
+        self.error = error
+        #: The duration of the call in seconds.
+        self.duration = duration
+
+    def __repr__(self):
+        return 'DeviceResult(%r, value=%r, error=%r, duration=%r)' % (
+                self.serial_number, self.value, self.error, self.duration)
+
+
+class PoolResult(object):
+    """Returned by :meth:`DevicePool.run`. Indexing the object by serial
+    number returns the corresponding :class:`DeviceResult`."""
+
+    def __init__(self, results, duration):
+        self._results = results
+        #: The duration of the whole run in seconds.
+        self.duration = duration
+
+    def __getitem__(self, serial_number):
+        return self._results[serial_number]
+
+    def __iter__(self):
+        return iter(self._results.values())
+
+    def __len__(self):
+        return len(self._results)
+
+    @property
+    def ok(self):
+        """`True` if no call raised an exception."""
+        return all(r.error is None for r in self)
+
+    @property
+    def values(self):
+        """A dictionary which maps the serial numbers to the return
+        values."""
+        return dict((r.serial_number, r.value) for r in self)
+
+    @property
+    def errors(self):
+        """A dictionary which maps the serial numbers of the failed calls to
+        the exceptions."""
+        return dict((r.serial_number, r.error) for r in self
+                if r.error is not None)
+
+    @property
+    def durations(self):
+        """A dictionary which maps the serial numbers to the durations."""
+        return dict((r.serial_number, r.duration) for r in self)
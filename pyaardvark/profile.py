@@ -0,0 +1,156 @@
+# Copyright (c) 2014-2018  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+import json
+import time
+
+from .constants import *
+
+
+class Profile(object):
+    """A set of adapter settings which are applied together by
+    :meth:`Aardvark.apply_profile`.
+
+    Each setting corresponds to the property of the same name of
+    :class:`Aardvark`, except `spi_mode` which is passed to
+    :meth:`Aardvark.spi_configure_mode`. Settings which are `None` are left
+    untouched.
+    """
+
+    FIELDS = ('enable_i2c', 'enable_spi', 'i2c_bitrate', 'spi_bitrate',
+            'i2c_pullups', 'target_power', 'i2c_bus_timeout', 'spi_mode')
+
+    def __init__(self, **kwargs):
+        for name in self.FIELDS:
+            setattr(self, name, kwargs.pop(name, None))
+        if kwargs:
+            raise TypeError('Unknown settings: %s' % ', '.join(sorted(kwargs)))
+
+    def __eq__(self, other):
+        if not isinstance(other, Profile):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'Profile(%s)' % ', '.join('%s=%r' % i
+                for i in sorted(self.to_dict().items()))
+
+    def to_dict(self):
+        """Return all settings which are not `None` as a dictionary."""
+        return dict((name, getattr(self, name)) for name in self.FIELDS
+                if getattr(self, name) is not None)
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**d)
+
+    def save(self, filename):
+        """Save the profile as a JSON file."""
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+
+    @classmethod
+    def load(cls, filename):
+        """Load a profile from a JSON file written by :meth:`save`."""
+        with open(filename) as f:
+            return cls.from_dict(json.load(f))
+
+    def apply(self, dev):
+        """Apply the profile to the :class:`Aardvark` object `dev`. See
+        :meth:`Aardvark.apply_profile`."""
+        start = time.monotonic()
+        changed = dict()
+
+        def update(name, current, value):
+            if value is not None and current != value:
+                setattr(dev, name, value)
+                changed[name] = (current, value)
+
+        # target power is switched off first and switched on last, so the
+        # target never sees the old and the new configuration at once.
+        power = dev.target_power if self.target_power is not None else None
+        if power is not None:
+            power = bool(power)
+        if self.target_power is not None and not self.target_power:
+            update('target_power', power, False)
+
+        # the interfaces are changed with a single configuration, which is
+        # computed from a single query
+        config = new_config = None
+        if self.enable_i2c is not None or self.enable_spi is not None:
+            config = new_config = dev._interface_configuration(CONFIG_QUERY)
+            for enable, bit in ((self.enable_i2c, CONFIG_GPIO_I2C),
+                    (self.enable_spi, CONFIG_SPI_GPIO)):
+                if enable:
+                    new_config |= bit
+                elif enable is not None:
+                    new_config &= ~bit
+
+        def configure():
+            dev._interface_configuration(new_config)
+            for name, bit in (('enable_i2c', CONFIG_GPIO_I2C),
+                    ('enable_spi', CONFIG_SPI_GPIO)):
+                if (config ^ new_config) & bit:
+                    changed[name] = (bool(config & bit),
+                            bool(new_config & bit))
+
+        # interfaces which are only disabled are disabled before the
+        # settings are changed, interfaces which are enabled afterwards
+        enabling = config != new_config and new_config & ~config
+        if config != new_config and not enabling:
+            configure()
+
+        if self.i2c_pullups is not None:
+            update('i2c_pullups', bool(dev.i2c_pullups),
+                    bool(self.i2c_pullups))
+        for name in ('i2c_bitrate', 'i2c_bus_timeout', 'spi_bitrate'):
+            if getattr(self, name) is not None:
+                update(name, getattr(dev, name), getattr(self, name))
+        if self.spi_mode is not None:
+            # the SPI mode can't be queried, it is only known if the
+            # configuration is cached
+            current = None
+            if dev._config_cache is not None:
+                current = dev._config_cache.get('spi_mode')
+            if current != self.spi_mode:
+                dev.spi_configure_mode(self.spi_mode)
+                changed['spi_mode'] = (current, self.spi_mode)
+
+        if enabling:
+            configure()
+        if self.target_power:
+            update('target_power', power, True)
+
+        return ProfileResult(changed, time.monotonic() - start)
+
+
+class ProfileResult(object):
+    """Returned by :meth:`Aardvark.apply_profile`."""
+
+    def __init__(self, changed, duration):
+        #: A dictionary which maps the name of each changed setting to a
+        #: tuple ``(old, new)``. The old value is `None` if it was unknown.
+        self.changed = changed
+
+        #: Time in seconds it took to apply the profile.
+        self.duration = duration
+
+    def __repr__(self):
+        return 'ProfileResult(changed=%r, duration=%r)' % (self.changed,
+                self.duration)
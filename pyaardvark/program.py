@@ -0,0 +1,284 @@
+# Copyright (c) 2014-2018  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Differential programming of memories.
+
+The image is split into blocks and a :class:`BlockIndex` holds a digest of
+each block. :func:`program` reads back each block of the memory, compares
+its digest with the index and only rewrites the blocks which differ.
+Afterwards, the rewritten blocks are verified against the same index::
+
+  flash = SPIFlash(a)
+  index = BlockIndex.from_image(image, flash.erase_types[0][0])
+  result = program(flash, image, index)
+  print('%d of %d blocks changed' % (len(result.changed),
+          len(index)))
+
+The index only depends on the image, so it can be computed once and stored
+with :meth:`BlockIndex.save`.
+
+Supported memories are :class:`pyaardvark.eeprom.I2CEeprom` and
+:class:`pyaardvark.flash.SPIFlash`, or any object with the same
+``read_into()`` and ``write()`` or ``erase()``/``program()`` methods.
+Neither device type can compute digests itself, so the blocks are read
+back and hashed on the host.
+"""
+
+import hashlib
+import json
+import time
+
+from .constants import *
+from .errors import AardvarkError
+from .image import map_image
+
+
+class BlockIndex(object):
+    """The digests of the blocks of an image.
+
+    `digests` is a list of digests, one per `block_size` bytes of the
+    image, computed with the :mod:`hashlib` algorithm `algorithm`. The last
+    block may be shorter, `size` is the length of the image.
+    """
+
+    def __init__(self, block_size, size, digests, algorithm='sha256'):
+        self.block_size = block_size
+        self.size = size
+        self.digests = digests
+        self.algorithm = algorithm
+
+    def __len__(self):
+        return len(self.digests)
+
+    def __eq__(self, other):
+        if not isinstance(other, BlockIndex):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def digest(self, data):
+        """Return the digest of `data`."""
+        return hashlib.new(self.algorithm, data).digest()
+
+    def blocks(self):
+        """Return an iterator over the tuples ``(offset, length)`` of all
+        blocks."""
+        for offset in range(0, self.size, self.block_size):
+            yield (offset, min(self.block_size, self.size - offset))
+
+    @classmethod
+    def from_image(cls, image, block_size, algorithm='sha256'):
+        """Compute the index of `image`, which can be any object supporting
+        the buffer protocol or a file name."""
+        with map_image(image) as view:
+            index = cls(block_size, len(view), list(), algorithm)
+            for offset, length in index.blocks():
+                index.digests.append(index.digest(
+                        view[offset:offset + length]))
+        return index
+
+    def to_dict(self):
+        return dict(block_size=self.block_size, size=self.size,
+                algorithm=self.algorithm,
+                digests=[d.hex() for d in self.digests])
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['block_size'], d['size'],
+                [bytes.fromhex(h) for h in d['digests']],
+                d.get('algorithm', 'sha256'))
+
+    def save(self, filename):
+        """Save the index as a JSON file."""
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+
+    @classmethod
+    def load(cls, filename):
+        """Load an index from a JSON file written by :meth:`save`."""
+        with open(filename) as f:
+            return cls.from_dict(json.load(f))
+
+
+class ProgramResult(object):
+    """Returned by :func:`program`."""
+
+    def __init__(self):
+        #: Offsets of the blocks which differed from the image.
+        self.changed = list()
+        #: Ranges ``(offset, length)`` which were erased.
+        self.erased = list()
+        #: Number of bytes written.
+        self.written = 0
+        #: Number of bytes read, including verification.
+        self.read = 0
+        #: Duration in seconds.
+        self.duration = 0
+
+    def __repr__(self):
+        return ('ProgramResult(changed=%d, erased=%r, written=%d, read=%d, '
+                'duration=%r)' % (len(self.changed), self.erased,
+                        self.written, self.read, self.duration))
+
+
+def _differing_blocks(memory, index, offset, buf, result, progress):
+    view = memoryview(buf)
+    for block_offset, length in index.blocks():
+        chunk = view[:length]
+        memory.read_into(chunk, offset + block_offset)
+        result.read += length
+        if index.digest(chunk) != index.digests[block_offset
+                // index.block_size]:
+            yield block_offset, chunk
+        if progress is not None:
+            progress(block_offset + length, index.size)
+
+
+def verify(memory, index, offset=0, blocks=None):
+    """Read back the memory starting at `offset` and compare it block by
+    block with `index`.
+
+    If `blocks` is given, only the blocks at these offsets (relative to
+    `offset`) are checked.
+
+    Returns the list of offsets of the blocks which don't match.
+    """
+    buf = bytearray(index.block_size)
+    view = memoryview(buf)
+    mismatches = list()
+    if blocks is None:
+        blocks = [o for o, _ in index.blocks()]
+    for block_offset in blocks:
+        length = min(index.block_size, index.size - block_offset)
+        memory.read_into(view[:length], offset + block_offset)
+        if index.digest(view[:length]) != index.digests[block_offset
+                // index.block_size]:
+            mismatches.append(block_offset)
+    return mismatches
+
+
+def _program_eeprom(memory, image, offset, block_offset, current, result):
+    # only the pages which differ are rewritten
+    page_size = memory.page_size
+    end = block_offset + len(current)
+    pos = block_offset
+    while pos < end:
+        n = min(end - pos, page_size - (offset + pos) % page_size)
+        new = image[pos:pos + n]
+        if current[pos - block_offset:pos - block_offset + n] != new:
+            memory.write(offset + pos, new)
+            result.written += n
+        pos += n
+
+
+def _program_flash(memory, image, offset, block_offset, current, result):
+    new = image[block_offset:block_offset + len(current)]
+    # programming can only clear bits, erase only if a bit has to be set
+    c = int.from_bytes(current, 'big')
+    n = int.from_bytes(new, 'big')
+    if c & n != n:
+        erase_size = memory.erase_types[0][0]
+        length = -(-len(current) // erase_size) * erase_size
+        memory.erase(offset + block_offset, length)
+        result.erased.append((offset + block_offset, length))
+        current = b'\xff' * len(current)
+
+    # program the pages which differ, skipping erased pages of the image
+    page_size = memory.page_size
+    end = block_offset + len(new)
+    pos = block_offset
+    while pos < end:
+        n = min(end - pos, page_size - (offset + pos) % page_size)
+        data = image[pos:pos + n]
+        if current[pos - block_offset:pos - block_offset + n] != data:
+            memory.program(offset + pos, data)
+            result.written += n
+        pos += n
+
+
+def program(memory, image, index=None, offset=0, verify_blocks=True,
+        progress=None):
+    """Program `image` into `memory` starting at `offset`, skipping all
+    blocks which already have the right contents.
+
+    `image` can be any object supporting the buffer protocol or a file
+    name, see :func:`pyaardvark.image.map_image`. `index` is
+    the :class:`BlockIndex` of the image. If it is omitted, it is computed
+    with the smallest erase size of a flash or the page size of an EEPROM
+    as block size.
+
+    For flashes, the block size has to be a multiple of the smallest erase
+    size and `offset` has to be aligned to it. A block is only erased if
+    one of its bits has to be changed from 0 to 1. Note that the bytes
+    following the image in its last block are erased as well.
+
+    If `verify_blocks` is `True`, the rewritten blocks are read back and
+    compared with the index. An :class:`AardvarkError` is raised if one
+    of them doesn't match.
+
+    If given, ``progress(done, total)`` is called after each block with
+    the number of bytes of the image processed so far.
+
+    Returns a :class:`ProgramResult` object.
+    """
+    with map_image(image) as image:
+        return _program(memory, image, index, offset, verify_blocks,
+                progress)
+
+
+def _program(memory, image, index, offset, verify_blocks, progress):
+    start = time.monotonic()
+    is_flash = hasattr(memory, 'erase')
+    if index is None:
+        if is_flash:
+            block_size = memory.erase_types[0][0]
+        else:
+            block_size = memory.page_size
+        index = BlockIndex.from_image(image, block_size)
+    if index.size != len(image):
+        raise ValueError('the index does not match the image')
+    if is_flash:
+        erase_size = memory.erase_types[0][0]
+        if index.block_size % erase_size or offset % erase_size:
+            raise ValueError('blocks are not aligned to the erase size 0x%x'
+                    % erase_size)
+
+    result = ProgramResult()
+    buf = bytearray(index.block_size)
+    for block_offset, current in _differing_blocks(memory, index, offset,
+            buf, result, progress):
+        result.changed.append(block_offset)
+        if is_flash:
+            _program_flash(memory, image, offset, block_offset, current,
+                    result)
+        else:
+            _program_eeprom(memory, image, offset, block_offset, current,
+                    result)
+
+    if verify_blocks and result.changed:
+        mismatches = verify(memory, index, offset, result.changed)
+        result.read += sum(min(index.block_size, index.size - o)
+                for o in result.changed)
+        if mismatches:
+            raise AardvarkError(ERR_SPI_WRITE_ERROR if is_flash
+                    else ERR_I2C_WRITE_ERROR,
+                    'verification failed at offsets %s' % ', '.join(
+                            '0x%x' % (offset + o) for o in mismatches))
+
+    result.duration = time.monotonic() - start
+    return result
@@ -0,0 +1,506 @@
+# Copyright (c) 2014-2018  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Recording and replay of the calls to the binding.
+
+A :class:`Recorder` wraps a binding and writes each call with its
+arguments, result, received data and timing to a binary log. It can be
+passed as `backend` to :func:`pyaardvark.open` or be installed for all
+devices using the default binding with :func:`record`::
+
+  with record('session.log'):
+      a = pyaardvark.open()
+      ...
+
+The log is read with :func:`read_log` and re-run against an adapter or the
+simulator with :func:`replay`, which reports the calls whose results
+differ from the recorded ones::
+
+  result = replay('session.log', backend='sim')
+  for diff in result.differences:
+      print(diff)
+
+The log consists of a header followed by records. Function names are
+written once and referenced by a number afterwards. Buffers which are only
+filled by a call are stored after the call, but not before it.
+"""
+
+import array
+import contextlib
+import struct
+import threading
+import time
+
+from . import aardvark as _aardvark
+from .aardvark import _get_api
+from .image import _is_path
+
+_MAGIC = b'AALOG\x00\x00\x01'
+_HEADER = struct.Struct('<8sd')
+
+_REC_NAME = 1
+_REC_CALL = 2
+_NAME = struct.Struct('<BHB')
+_CALL = struct.Struct('<BHdf')
+
+_T_NONE = 0
+_T_INT = 1
+_T_BUFFER = 2
+_T_TUPLE = 3
+_T_STR = 4
+_T_ERROR = 5
+_T_EMPTY = 6
+
+_INT = struct.Struct('<q')
+_BUFFER = struct.Struct('<cI')
+_LENGTH = struct.Struct('<I')
+_COUNT = struct.Struct('<H')
+
+# Arguments which are buffers filled by the call
+_OUTPUTS = {
+    'py_aa_find_devices': (1,),
+    'py_aa_find_devices_ext': (2, 3),
+    'py_aa_i2c_read': (4,),
+    'py_aa_i2c_read_ext': (4,),
+    'py_aa_i2c_write_read': (6,),
+    'py_aa_i2c_slave_read': (2,),
+    'py_aa_i2c_slave_read_ext': (2,),
+    'py_aa_spi_write': (4,),
+    'py_aa_spi_slave_read': (2,),
+}
+
+# Functions which don't take a handle as first argument
+_NO_HANDLE = frozenset(('py_version', 'py_aa_status_string',
+        'py_aa_find_devices', 'py_aa_find_devices_ext', 'py_aa_open',
+        'py_aa_open_ext', 'py_aa_sleep_ms'))
+
+
+class _Empty(object):
+    """An output buffer as recorded before the call."""
+
+    __slots__ = ('format', 'nbytes')
+
+    def __init__(self, format, nbytes):
+        self.format = format
+        self.nbytes = nbytes
+
+    def __eq__(self, other):
+        return (isinstance(other, _Empty) and self.format == other.format
+                and self.nbytes == other.nbytes)
+
+    def __repr__(self):
+        return '<%d bytes>' % self.nbytes
+
+    def allocate(self):
+        if self.format == 'B':
+            return bytearray(self.nbytes)
+        a = array.array(self.format)
+        a.frombytes(bytes(self.nbytes))
+        return a
+
+
+class CallError(object):
+    """The exception raised by a call, in place of its result."""
+
+    __slots__ = ('message',)
+
+    def __init__(self, message):
+        self.message = message
+
+    def __eq__(self, other):
+        return isinstance(other, CallError) and self.message == other.message
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'CallError(%r)' % self.message
+
+
+def _encode(out, value, empty=False):
+    if value is None:
+        out.append(_T_NONE)
+    elif isinstance(value, int):
+        out.append(_T_INT)
+        out += _INT.pack(value)
+    elif isinstance(value, str):
+        data = value.encode('utf-8')
+        out.append(_T_STR)
+        out += _LENGTH.pack(len(data))
+        out += data
+    elif isinstance(value, CallError):
+        data = value.message.encode('utf-8')
+        out.append(_T_ERROR)
+        out += _LENGTH.pack(len(data))
+        out += data
+    elif isinstance(value, (tuple, list)):
+        out.append(_T_TUPLE)
+        out += _COUNT.pack(len(value))
+        for item in value:
+            _encode(out, item)
+    else:
+        view = memoryview(value)
+        fmt = view.format[-1:].encode('ascii')
+        if empty:
+            out.append(_T_EMPTY)
+            out += _BUFFER.pack(fmt, view.nbytes)
+        else:
+            out.append(_T_BUFFER)
+            out += _BUFFER.pack(fmt, view.nbytes)
+            out += view.cast('B') if view.c_contiguous else view.tobytes()
+
+
+def _encode_args(args, outputs):
+    out = bytearray()
+    out.append(_T_TUPLE)
+    out += _COUNT.pack(len(args))
+    for i, arg in enumerate(args):
+        _encode(out, arg, i in outputs)
+    return out
+
+
+def _decode(data, pos):
+    t = data[pos]
+    pos += 1
+    if t == _T_NONE:
+        return None, pos
+    elif t == _T_INT:
+        return _INT.unpack_from(data, pos)[0], pos + _INT.size
+    elif t in (_T_STR, _T_ERROR):
+        n, = _LENGTH.unpack_from(data, pos)
+        pos += _LENGTH.size
+        s = bytes(data[pos:pos + n]).decode('utf-8')
+        return (s if t == _T_STR else CallError(s)), pos + n
+    elif t == _T_TUPLE:
+        n, = _COUNT.unpack_from(data, pos)
+        pos += _COUNT.size
+        items = list()
+        for _ in range(n):
+            item, pos = _decode(data, pos)
+            items.append(item)
+        return tuple(items), pos
+    elif t in (_T_BUFFER, _T_EMPTY):
+        fmt, n = _BUFFER.unpack_from(data, pos)
+        pos += _BUFFER.size
+        fmt = fmt.decode('ascii')
+        if t == _T_EMPTY:
+            return _Empty(fmt, n), pos
+        raw = bytes(data[pos:pos + n])
+        if fmt == 'B':
+            return bytearray(raw), pos + n
+        a = array.array(fmt)
+        a.frombytes(raw)
+        return a, pos + n
+    raise ValueError('corrupt log: unknown type %d' % t)
+
+
+class Call(object):
+    """A recorded call."""
+
+    __slots__ = ('index', 'time', 'duration', 'name', 'args', 'result',
+            'outputs')
+
+    def __init__(self, index, time, duration, name, args, result, outputs):
+        #: Position in the log, starting at 0.
+        self.index = index
+        #: Start of the call in seconds since the recording started.
+        self.time = time
+        #: Duration of the call in seconds.
+        self.duration = duration
+        #: Name of the binding function.
+        self.name = name
+        #: Tuple of arguments. Output buffers are given as placeholders
+        #: with the size of the buffer.
+        self.args = args
+        #: The return value or a :class:`CallError`.
+        self.result = result
+        #: Tuple of the contents of the output buffers after the call.
+        self.outputs = outputs
+
+    def __repr__(self):
+        return 'Call(#%d %s%r -> %r)' % (self.index, self.name, self.args,
+                self.result)
+
+
+class Recorder(object):
+    """A binding which records all calls to `backend` (see
+    :func:`pyaardvark.open`) to `log`, which is either a file name or a
+    file object opened in binary mode.
+
+    Only the functions whose names start with ``py_`` are recorded, all
+    other attributes are passed through. The recorder is thread-safe.
+    """
+
+    def __init__(self, log, backend=None):
+        self._api = _get_api(backend)
+        if _is_path(log):
+            self._file = open(log, 'wb')
+            self._owns_file = True
+        else:
+            self._file = log
+            self._owns_file = False
+        self._lock = threading.Lock()
+        self._names = dict()
+        self._start = time.monotonic()
+        self._file.write(_HEADER.pack(_MAGIC, time.time()))
+        #: Number of recorded calls.
+        self.calls = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.close()
+        return False
+
+    def __getattr__(self, name):
+        attr = getattr(self._api, name)
+        if not name.startswith('py_') or not callable(attr):
+            return attr
+        wrapper = self._wrap(name, attr)
+        # cache the wrapper, so __getattr__ is only called once per name
+        setattr(self, name, wrapper)
+        return wrapper
+
+    def _wrap(self, name, func):
+        outputs = _OUTPUTS.get(name, ())
+        monotonic = time.monotonic
+
+        def recorded(*args):
+            args_data = _encode_args(args, outputs)
+            start = monotonic()
+            try:
+                result = func(*args)
+            except Exception as e:
+                self._write(name, start, monotonic() - start, args_data,
+                        CallError('%s: %s' % (type(e).__name__, e)), ())
+                raise
+            duration = monotonic() - start
+            self._write(name, start, duration, args_data, result,
+                    tuple(args[i] for i in outputs))
+            return result
+        return recorded
+
+    def _write(self, name, start, duration, args_data, result, outputs):
+        data = bytearray()
+        with self._lock:
+            if self._file is None:
+                return
+            ident = self._names.get(name)
+            if ident is None:
+                ident = self._names[name] = len(self._names)
+                encoded = name.encode('ascii')
+                data += _NAME.pack(_REC_NAME, ident, len(encoded))
+                data += encoded
+            data += _CALL.pack(_REC_CALL, ident, start - self._start,
+                    duration)
+            data += args_data
+            _encode(data, result)
+            _encode(data, outputs)
+            self._file.write(data)
+            self.calls += 1
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        """Stop recording and close the log if it was opened by the
+        recorder."""
+        with self._lock:
+            if self._file is None:
+                return
+            if self._owns_file:
+                self._file.close()
+            else:
+                self._file.flush()
+            self._file = None
+
+
+@contextlib.contextmanager
+def record(log, backend=None):
+    """Return a context manager which records the calls of all devices
+    which use the default binding.
+
+    The binding of :mod:`pyaardvark.aardvark` is replaced by a
+    :class:`Recorder` for `backend` (the default binding if omitted), which
+    is yielded and closed on exit.
+    """
+    recorder = Recorder(log, backend)
+    saved = _aardvark.api
+    _aardvark.api = recorder
+    try:
+        yield recorder
+    finally:
+        _aardvark.api = saved
+        recorder.close()
+
+
+def read_log(log):
+    """Return an iterator over the :class:`Call` objects of `log`, which is
+    either a file name or a file object opened in binary mode."""
+    if _is_path(log):
+        with open(log, 'rb') as f:
+            data = f.read()
+    else:
+        data = log.read()
+    return _iter_calls(data)
+
+
+def _iter_calls(data):
+    data = memoryview(data)
+    magic, _ = _HEADER.unpack_from(data, 0)
+    if magic != _MAGIC:
+        raise ValueError('not a pyaardvark log')
+    pos = _HEADER.size
+    names = dict()
+    index = 0
+    while pos < len(data):
+        tag = data[pos]
+        if tag == _REC_NAME:
+            _, ident, n = _NAME.unpack_from(data, pos)
+            pos += _NAME.size
+            names[ident] = bytes(data[pos:pos + n]).decode('ascii')
+            pos += n
+        elif tag == _REC_CALL:
+            _, ident, start, duration = _CALL.unpack_from(data, pos)
+            pos += _CALL.size
+            args, pos = _decode(data, pos)
+            result, pos = _decode(data, pos)
+            outputs, pos = _decode(data, pos)
+            yield Call(index, start, duration, names[ident], args, result,
+                    outputs)
+            index += 1
+        else:
+            raise ValueError('corrupt log: unknown record %d' % tag)
+
+
+class Difference(object):
+    """A replayed call whose result or output differs from the log."""
+
+    __slots__ = ('call', 'result', 'outputs')
+
+    def __init__(self, call, result, outputs):
+        #: The recorded :class:`Call`.
+        self.call = call
+        #: The result of the replayed call.
+        self.result = result
+        #: The contents of the output buffers of the replayed call.
+        self.outputs = outputs
+
+    def __repr__(self):
+        parts = list()
+        if self.result != self.call.result:
+            parts.append('result %r != %r' % (self.result,
+                    self.call.result))
+        for i, (new, old) in enumerate(zip(self.outputs, self.call.outputs)):
+            if new != old:
+                parts.append('output %d %s != %s' % (i, bytes(new).hex(),
+                        bytes(old).hex()))
+        return '#%d %s: %s' % (self.call.index, self.call.name,
+                ', '.join(parts))
+
+
+class ReplayResult(object):
+    """Returned by :func:`replay`."""
+
+    def __init__(self):
+        #: Number of replayed calls.
+        self.calls = 0
+        #: List of :class:`Difference` objects.
+        self.differences = list()
+        #: Duration of the replay in seconds.
+        self.duration = 0
+        #: Duration of the recording in seconds, from the start of the
+        #: first to the end of the last call.
+        self.recorded_duration = 0
+
+    @property
+    def ok(self):
+        """`True` if all calls returned the recorded results."""
+        return not self.differences
+
+    def __repr__(self):
+        return ('ReplayResult(calls=%d, differences=%d, duration=%r, '
+                'recorded_duration=%r)' % (self.calls,
+                        len(self.differences), self.duration,
+                        self.recorded_duration))
+
+
+def _same(recorded, actual):
+    if isinstance(recorded, (bytearray, array.array)):
+        return memoryview(recorded).cast('B') == memoryview(actual).cast('B')
+    return recorded == actual
+
+
+def replay(log, backend=None, pace=False, skip=('py_aa_sleep_ms',)):
+    """Re-run the calls of `log` against `backend` (see
+    :func:`pyaardvark.open`) and compare their results and received data
+    with the recorded ones.
+
+    The handles returned by the replayed open calls are substituted for
+    the recorded ones. If `pace` is `True`, each call is started at the
+    same time relative to the start as in the recording, otherwise the
+    calls are made back to back. Calls of the functions in `skip` are not
+    replayed.
+
+    Returns a :class:`ReplayResult` object.
+    """
+    api = _get_api(backend)
+    handles = dict()
+    result = ReplayResult()
+    start = time.monotonic()
+    for call in read_log(log):
+        result.recorded_duration = call.time + call.duration
+        if call.name in skip:
+            continue
+        if pace:
+            delay = start + call.time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        args = [a.allocate() if isinstance(a, _Empty) else a
+                for a in call.args]
+        if call.name not in _NO_HANDLE and args:
+            args[0] = handles.get(args[0], args[0])
+        try:
+            actual = getattr(api, call.name)(*args)
+        except Exception as e:
+            actual = CallError('%s: %s' % (type(e).__name__, e))
+        outputs = tuple(args[i] for i in _OUTPUTS.get(call.name, ()))
+        result.calls += 1
+
+        expected = call.result
+        if call.name in ('py_aa_open', 'py_aa_open_ext') and not \
+                isinstance(actual, CallError):
+            recorded_handle = expected if call.name == 'py_aa_open' \
+                    else expected[0]
+            actual_handle = actual if call.name == 'py_aa_open' \
+                    else actual[0]
+            if recorded_handle > 0 and actual_handle > 0:
+                handles[recorded_handle] = actual_handle
+                # the handle itself is not compared
+                if call.name == 'py_aa_open':
+                    actual = expected
+                else:
+                    actual = (expected[0],) + tuple(actual[1:])
+
+        if not _same(expected, actual) or not all(_same(old, new)
+                for old, new in zip(call.outputs, outputs)):
+            result.differences.append(Difference(call, actual, outputs))
+    result.duration = time.monotonic() - start
+    return result
@@ -0,0 +1,248 @@
+# Copyright (c) 2014-2018  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+import array
+import logging
+import queue
+import threading
+
+from .constants import *
+from .aardvark import (Aardvark, ThreadSafeAardvark, _get_api,
+        _raise_error_if_negative, _unique_id_str)
+from .errors import AardvarkError
+
+log = logging.getLogger(__name__)
+
+
+class DeviceEvent(object):
+    """A change reported by :meth:`DeviceRegistry.scan`."""
+
+    #: The adapter was connected.
+    ARRIVED = 'arrived'
+    #: The adapter was disconnected.
+    DEPARTED = 'departed'
+    #: The adapter was opened or closed, see :attr:`in_use`.
+    CHANGED = 'changed'
+
+    __slots__ = ('kind', 'serial_number', 'port', 'in_use')
+
+    def __init__(self, kind, serial_number, port, in_use):
+        self.kind = kind
+        self.serial_number = serial_number
+        self.port = port
+        self.in_use = in_use
+
+    def __eq__(self, other):
+        if not isinstance(other, DeviceEvent):
+            return NotImplemented
+        return all(getattr(self, n) == getattr(other, n)
+                for n in self.__slots__)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'DeviceEvent(%r, %r, port=%r, in_use=%r)' % (self.kind,
+                self.serial_number, self.port, self.in_use)
+
+
+class DeviceRegistry(object):
+    """A cache of the attached adapters.
+
+    :func:`pyaardvark.find_devices` queries the binding twice and builds new
+    dictionaries on every call. The registry reuses its buffers across
+    scans and only updates its cache if the enumeration result differs from
+    the previous one.
+
+    :meth:`open` resolves the serial number from the cache and only rescans
+    if the adapter is unknown or the cached port turns out to be wrong.
+
+    `backend` selects the binding, see :func:`pyaardvark.open`.
+    """
+
+    def __init__(self, backend=None):
+        self._backend = backend
+        self._api = _get_api(backend)
+        self._lock = threading.Lock()
+        self._ports = array.array('H', (0,) * 16)
+        self._unique_ids = array.array('I', (0,) * 16)
+        self._raw = None
+        self._devices = dict()
+
+    def _enumerate(self):
+        while True:
+            num_devices = self._api.py_aa_find_devices_ext(len(self._ports),
+                    len(self._unique_ids), self._ports, self._unique_ids)
+            _raise_error_if_negative(num_devices)
+            if num_devices <= len(self._ports):
+                break
+            # more adapters than we have room for, enlarge the buffers
+            self._ports = array.array('H', (0,) * (2 * num_devices))
+            self._unique_ids = array.array('I', (0,) * (2 * num_devices))
+        return (self._ports[:num_devices], self._unique_ids[:num_devices])
+
+    def scan(self):
+        """Enumerate the adapters, update the cache and return a list of
+        :class:`DeviceEvent` objects describing the differences to the
+        previous scan. The first scan reports every adapter as arrived."""
+        with self._lock:
+            raw = self._enumerate()
+            if raw == self._raw:
+                return list()
+            self._raw = raw
+
+            devices = dict()
+            for port, uid in zip(*raw):
+                serial_number = _unique_id_str(uid)
+                devices[serial_number] = (port & ~PORT_NOT_FREE,
+                        bool(port & PORT_NOT_FREE))
+
+            events = list()
+            for serial_number, (port, in_use) in self._devices.items():
+                if serial_number not in devices:
+                    events.append(DeviceEvent(DeviceEvent.DEPARTED,
+                            serial_number, port, in_use))
+            for serial_number, (port, in_use) in sorted(devices.items()):
+                old = self._devices.get(serial_number)
+                if old is None:
+                    events.append(DeviceEvent(DeviceEvent.ARRIVED,
+                            serial_number, port, in_use))
+                elif old != (port, in_use):
+                    events.append(DeviceEvent(DeviceEvent.CHANGED,
+                            serial_number, port, in_use))
+            self._devices = devices
+            return events
+
+    def devices(self):
+        """Return the cached devices in the format of
+        :func:`pyaardvark.find_devices`. Scans if the cache is empty."""
+        if self._raw is None:
+            self.scan()
+        with self._lock:
+            return [dict(port=port, serial_number=sn, in_use=in_use)
+                    for sn, (port, in_use) in sorted(self._devices.items(),
+                            key=lambda i: i[1][0])]
+
+    def port(self, serial_number):
+        """Return the cached port of the adapter with the given serial number
+        or `None` if it is unknown."""
+        with self._lock:
+            entry = self._devices.get(serial_number)
+        return entry[0] if entry is not None else None
+
+    def _try_open(self, cls, serial_number):
+        port = self.port(serial_number)
+        if port is None:
+            return None
+        try:
+            dev = cls(port, self._backend)
+        except AardvarkError:
+            return None
+        if dev.unique_id_str() != serial_number:
+            dev.close()
+            return None
+        return dev
+
+    def open(self, serial_number, thread_safe=False):
+        """Open the adapter with the given serial number. Same as
+        :func:`pyaardvark.open`, but the port is looked up in the cache.
+        The adapters are only rescanned if the serial number is unknown or
+        the adapter at the cached port has a different serial number."""
+        cls = ThreadSafeAardvark if thread_safe else Aardvark
+        dev = self._try_open(cls, serial_number)
+        if dev is None:
+            log.debug('rescanning for %s', serial_number)
+            self.scan()
+            dev = self._try_open(cls, serial_number)
+        if dev is None:
+            _raise_error_if_negative(ERR_UNABLE_TO_OPEN)
+        return dev
+
+
+class DeviceWatcher(object):
+    """Background thread which rescans a :class:`DeviceRegistry` every
+    `interval` seconds.
+
+    Every :class:`DeviceEvent` is passed to `callback`, if given, and put
+    into :attr:`events`, a :class:`queue.Queue`. The callback is executed
+    in the watcher thread. If `registry` is omitted, a new registry using
+    `backend` is created.
+
+    Example::
+
+      with DeviceWatcher(interval=0.5) as watcher:
+          while True:
+              event = watcher.events.get()
+              if event.kind == DeviceEvent.ARRIVED:
+                  a = watcher.registry.open(event.serial_number)
+    """
+
+    def __init__(self, registry=None, interval=1.0, callback=None,
+            backend=None):
+        if registry is None:
+            registry = DeviceRegistry(backend)
+        #: The watched :class:`DeviceRegistry`.
+        self.registry = registry
+        self.interval = interval
+        self.callback = callback
+        #: Queue of :class:`DeviceEvent` objects.
+        self.events = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.stop()
+        return False
+
+    def start(self):
+        """Start the watcher thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run,
+                name='aardvark-watcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the watcher thread and wait for it to finish."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def poll(self):
+        """Rescan once and dispatch the events. Called periodically by the
+        watcher thread."""
+        events = self.registry.scan()
+        for event in events:
+            self.events.put(event)
+            if self.callback is not None:
+                self.callback(event)
+        return events
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception:
+                log.exception('scanning for devices failed')
+            self._stop.wait(self.interval)
@@ -0,0 +1,243 @@
+# Copyright (c) 2014-2018  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Register maps of I2C devices.
+
+A :class:`RegisterMap` is defined by a dictionary which maps the register
+names to :class:`Register` objects, dictionaries with the same arguments or
+just the register addresses::
+
+  regs = RegisterMap(a, 0x48, {
+      'CONFIG': dict(address=0x01, fields={'OS': (15, 1), 'MUX': (12, 3)}),
+      'CONV': dict(address=0x00, volatile=True),
+      'LO_THRESH': 0x02,
+      'HI_THRESH': 0x03,
+  }, reg_width=2)
+
+  regs.update('CONFIG', MUX=4, OS=1)
+  regs['LO_THRESH'] = 0x8000
+  regs['HI_THRESH'] = 0x7fff
+  regs.flush()
+  value = regs['CONV']
+
+Writes to registers which are not volatile are cached and only sent by
+:meth:`RegisterMap.flush`, which writes contiguous registers with a single
+burst.
+"""
+
+
+class Register(object):
+    """A register at `address`.
+
+    `fields` maps the names of bitfields to tuples ``(shift, width)``. The
+    value of volatile registers can change without being written, eg. status
+    registers. They are neither cached nor written back lazily.
+    """
+
+    __slots__ = ('name', 'address', 'volatile', 'fields')
+
+    def __init__(self, address, volatile=False, fields=None, name=None):
+        self.name = name
+        self.address = address
+        self.volatile = volatile
+        self.fields = dict(fields or {})
+
+    def __repr__(self):
+        return 'Register(%r, address=0x%x, volatile=%r)' % (self.name,
+                self.address, self.volatile)
+
+    def field_mask(self, field):
+        shift, width = self.fields[field]
+        return ((1 << width) - 1) << shift
+
+
+class RegisterMap(object):
+    """The registers of the I2C device at `i2c_address`, accessed through
+    the :class:`Aardvark` object `dev`.
+
+    `addr_width` is the number of bytes of the register address and
+    `reg_width` the number of bytes per register, which are transferred in
+    the `byteorder` ``'big'`` or ``'little'``. Consecutive registers have
+    addresses which differ by `addr_step`; bursts rely on the address
+    auto-increment of the device. `max_burst` limits the number of
+    registers per burst.
+
+    If `write_back` is `False`, writes are sent immediately.
+    """
+
+    def __init__(self, dev, i2c_address, registers, addr_width=1,
+            reg_width=1, byteorder='big', addr_step=1, max_burst=None,
+            write_back=True):
+        self.dev = dev
+        self.i2c_address = i2c_address
+        self.addr_width = addr_width
+        self.reg_width = reg_width
+        self.byteorder = byteorder
+        self.addr_step = addr_step
+        if max_burst is None:
+            max_burst = (dev.BUFFER_SIZE - addr_width) // reg_width
+        self.max_burst = max_burst
+        self.write_back = write_back
+
+        self.registers = dict()
+        for name, reg in registers.items():
+            if isinstance(reg, int):
+                reg = Register(reg)
+            elif isinstance(reg, dict):
+                reg = Register(**reg)
+            reg.name = name
+            self.registers[name] = reg
+
+        self._cache = dict()
+        self._dirty = set()
+
+    def __getitem__(self, name):
+        return self.read(name)
+
+    def __setitem__(self, name, value):
+        self.write(name, value)
+
+    def __contains__(self, name):
+        return name in self.registers
+
+    def _address_bytes(self, address):
+        return address.to_bytes(self.addr_width, 'big')
+
+    def _read_burst(self, regs):
+        """Read the contiguous registers `regs` with a single access."""
+        length = len(regs) * self.reg_width
+        result = self.dev.i2c_master_write_read_ext(self.i2c_address,
+                self._address_bytes(regs[0].address), length)
+        result.raise_for_status()
+        data = result.data
+        values = list()
+        for i, reg in enumerate(regs):
+            chunk = data[i * self.reg_width:(i + 1) * self.reg_width]
+            value = int.from_bytes(chunk, self.byteorder)
+            if not reg.volatile:
+                self._cache[reg.name] = value
+            values.append(value)
+        return values
+
+    def _write_burst(self, regs, values):
+        """Write the contiguous registers `regs` with a single access."""
+        data = bytearray(self._address_bytes(regs[0].address))
+        for value in values:
+            data += value.to_bytes(self.reg_width, self.byteorder)
+        self.dev.i2c_master_write(self.i2c_address, data)
+
+    def _bursts(self, regs):
+        """Split the registers into runs of contiguous registers."""
+        regs = sorted(regs, key=lambda r: r.address)
+        run = list()
+        for reg in regs:
+            if run and (reg.address != run[-1].address + self.addr_step
+                    or len(run) >= self.max_burst):
+                yield run
+                run = list()
+            run.append(reg)
+        if run:
+            yield run
+
+    def read(self, name):
+        """Return the value of the register `name`. Cached values are
+        returned without accessing the device."""
+        if name in self._cache:
+            return self._cache[name]
+        return self._read_burst([self.registers[name]])[0]
+
+    def write(self, name, value):
+        """Set the register `name` to `value`.
+
+        The value of a non-volatile register is only cached and marked as
+        dirty, unless write back is disabled. Volatile registers are written
+        immediately, after all dirty registers are flushed to keep the
+        order of the writes.
+        """
+        reg = self.registers[name]
+        if value >> (8 * self.reg_width):
+            raise ValueError('value 0x%x exceeds the register width' % value)
+        if reg.volatile or not self.write_back:
+            if reg.volatile:
+                self.flush()
+            self._write_burst([reg], [value])
+            if not reg.volatile:
+                self._cache[name] = value
+            return
+        if self._cache.get(name) == value and name not in self._dirty:
+            return
+        self._cache[name] = value
+        self._dirty.add(name)
+
+    def read_field(self, name, field):
+        """Return the value of the bitfield `field` of register `name`."""
+        shift, width = self.registers[name].fields[field]
+        return (self.read(name) >> shift) & ((1 << width) - 1)
+
+    def update(self, name, **fields):
+        """Change the bitfields of register `name` given as keyword
+        arguments with a single read-modify-write. The read is omitted if
+        the value is cached."""
+        reg = self.registers[name]
+        value = self.read(name)
+        for field, field_value in fields.items():
+            shift, width = reg.fields[field]
+            if field_value >> width:
+                raise ValueError('value %r exceeds the field %s' % (
+                        field_value, field))
+            value = (value & ~reg.field_mask(field)) | (field_value << shift)
+        self.write(name, value)
+
+    def load(self, names=None):
+        """Read the registers `names` (all registers by default) into the
+        cache, using bursts for contiguous registers."""
+        if names is None:
+            regs = self.registers.values()
+        else:
+            regs = [self.registers[n] for n in names]
+        for run in self._bursts(r for r in regs if not r.volatile):
+            self._read_burst(run)
+
+    @property
+    def dirty(self):
+        """The names of the registers which have to be written by
+        :meth:`flush`."""
+        return sorted(self._dirty, key=lambda n: self.registers[n].address)
+
+    def flush(self):
+        """Write all dirty registers. Contiguous registers are written with
+        a single burst. Returns the number of bursts."""
+        if not self._dirty:
+            return 0
+        regs = [self.registers[n] for n in self._dirty]
+        bursts = 0
+        for run in self._bursts(regs):
+            self._write_burst(run, [self._cache[r.name] for r in run])
+            for reg in run:
+                self._dirty.discard(reg.name)
+            bursts += 1
+        return bursts
+
+    def invalidate(self, name=None):
+        """Forget the cached value of register `name` or of all registers.
+        Dirty registers are not affected."""
+        if name is None:
+            names = list(self._cache)
+        else:
+            names = [name]
+        for name in names:
+            if name not in self._dirty:
+                self._cache.pop(name, None)
@@ -0,0 +1,257 @@
+# Copyright (c) 2014-2018  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+import functools
+import logging
+import time
+
+from .constants import *
+from .aardvark import (Aardvark, _find_port, _raise_error_if_negative,
+        open)
+from .errors import AardvarkError, CommunicationError
+
+log = logging.getLogger(__name__)
+
+
+class ReconnectPolicy(object):
+    """Determines how often and how fast :class:`ResilientAardvark` tries
+    to reconnect.
+
+    After a communication error, the adapter is reopened after `interval`
+    seconds. If that fails, the interval is multiplied by `backoff` for
+    each further attempt, up to `max_interval`. After `attempts` failed
+    attempts the error is raised.
+    """
+
+    def __init__(self, attempts=5, interval=0.01, backoff=2.0,
+            max_interval=1.0):
+        self.attempts = attempts
+        self.interval = interval
+        self.backoff = backoff
+        self.max_interval = max_interval
+
+    def __repr__(self):
+        return ('ReconnectPolicy(attempts=%r, interval=%r, backoff=%r, '
+                'max_interval=%r)' % (self.attempts, self.interval,
+                        self.backoff, self.max_interval))
+
+    def delays(self):
+        """Return an iterator over the delays before each attempt."""
+        interval = self.interval
+        for _ in range(self.attempts):
+            yield interval
+            interval = min(interval * self.backoff, self.max_interval)
+
+
+# Restored in this order after reconnecting. The values are stored in the
+# configuration cache in the format the binding expects.
+_RESTORE = (
+    ('config', 'py_aa_configure'),
+    ('i2c_pullups', 'py_aa_i2c_pullup'),
+    ('i2c_bitrate', 'py_aa_i2c_bitrate'),
+    ('i2c_bus_timeout', 'py_aa_i2c_bus_timeout'),
+    ('spi_bitrate', 'py_aa_spi_bitrate'),
+    ('target_power', 'py_aa_target_power'),
+)
+
+
+def _reconnecting(func):
+    @functools.wraps(func)
+    def reconnecting(self, *args, **kwargs):
+        # only the outermost call retries, eg. i2c_master_write_read is
+        # retried as a whole
+        if self._in_call:
+            return func(self, *args, **kwargs)
+        self._in_call = True
+        try:
+            delays = None
+            while True:
+                try:
+                    if self._disconnected:
+                        self.reconnect()
+                    return func(self, *args, **kwargs)
+                except AardvarkError as e:
+                    if not (self._disconnected
+                            or isinstance(e, CommunicationError)):
+                        raise
+                    self._disconnected = True
+                    if delays is None:
+                        log.warning('lost connection to %s',
+                                self.serial_number)
+                        delays = self.policy.delays()
+                    delay = next(delays, None)
+                    if delay is None:
+                        raise
+                    time.sleep(delay)
+        finally:
+            self._in_call = False
+    return reconnecting
+
+
+class ResilientAardvark(Aardvark):
+    """An :class:`Aardvark` which survives USB disconnects.
+
+    The adapter is opened by its serial number. If a call fails with a
+    :class:`CommunicationError`, the adapter with the same serial number
+    is reopened according to `policy`, a :class:`ReconnectPolicy`, the
+    configuration is restored and the call is repeated. If the adapter
+    doesn't come back in time, the error is raised.
+
+    The restored configuration consists of the interface configuration,
+    the bitrates, pullups, target power, I2C bus timeout, SPI
+    configuration, I2C and SPI slave mode, the slave responses and the GPIO
+    directions, pullups and outputs. To keep track of it,
+    :attr:`cache_config` is always enabled.
+
+    Note that a repeated call may have been partially executed before the
+    connection was lost, eg. some bytes of a write may have reached the
+    target.
+    """
+
+    def __init__(self, serial_number, backend=None, policy=None):
+        #: Serial number of the adapter.
+        self.serial_number = serial_number
+        #: The :class:`ReconnectPolicy`.
+        self.policy = policy or ReconnectPolicy()
+        #: Number of successful reconnects.
+        self.reconnects = 0
+
+        self._spi_config = None
+        self._spi_ss_polarity = None
+        self._i2c_slave_config = None
+        self._spi_slave_enabled = False
+        self._disconnected = False
+        self._in_call = False
+
+        super(ResilientAardvark, self).__init__(
+                _find_port(serial_number, backend), backend)
+        self._config_cache = dict()
+        if self.unique_id_str() != serial_number:
+            self.close()
+            _raise_error_if_negative(ERR_UNABLE_TO_OPEN)
+
+    @Aardvark.cache_config.setter
+    def cache_config(self, value):
+        if not value:
+            raise ValueError('the configuration is needed to reconnect')
+
+    def invalidate_config(self):
+        """Read the recorded configuration values back from the adapter.
+
+        Unlike :meth:`Aardvark.invalidate_config`, the values are not just
+        forgotten, because they are needed to restore the configuration
+        after a reconnect.
+        """
+        self.sync_config()
+
+    def close(self):
+        """Close the device."""
+        if self.handle is not None:
+            self._api.py_aa_close(self.handle)
+            self.handle = None
+
+    def reconnect(self):
+        """Reopen the adapter and restore its configuration."""
+        if self.handle is not None:
+            self._api.py_aa_close(self.handle)
+            self.handle = None
+        dev = open(serial_number=self.serial_number, backend=self._backend)
+        self.handle, dev.handle = dev.handle, None
+
+        api = self._api
+        cache = self._config_cache
+        for key, func in _RESTORE:
+            if key in cache:
+                _raise_error_if_negative(getattr(api, func)(self.handle,
+                        cache[key]))
+        if self._spi_config is not None:
+            _raise_error_if_negative(api.py_aa_spi_configure(self.handle,
+                    *self._spi_config))
+        if self._spi_ss_polarity is not None:
+            _raise_error_if_negative(api.py_aa_spi_master_ss_polarity(
+                    self.handle, self._spi_ss_polarity))
+        if self._i2c_slave_response is not None:
+            data = self._i2c_slave_response
+            _raise_error_if_negative(api.py_aa_i2c_slave_set_response(
+                    self.handle, len(data), data))
+        if self._i2c_slave_config is not None:
+            _raise_error_if_negative(api.py_aa_i2c_slave_enable(self.handle,
+                    *self._i2c_slave_config))
+        if self._spi_slave_response is not None:
+            data = self._spi_slave_response
+            _raise_error_if_negative(api.py_aa_spi_slave_set_response(
+                    self.handle, len(data), data))
+        if self._spi_slave_enabled:
+            _raise_error_if_negative(api.py_aa_spi_slave_enable(self.handle))
+        if self._gpio_pullups is not None:
+            _raise_error_if_negative(api.py_aa_gpio_pullup(self.handle,
+                    self._gpio_pullups))
+        # set the outputs before they are driven
+        if self._gpio_value is not None:
+            _raise_error_if_negative(api.py_aa_gpio_set(self.handle,
+                    self._gpio_value))
+        if self._gpio_direction is not None:
+            _raise_error_if_negative(api.py_aa_gpio_direction(self.handle,
+                    self._gpio_direction))
+        self._gpio_last = None
+
+        self._disconnected = False
+        self.reconnects += 1
+        log.info('reconnected to %s', self.serial_number)
+
+    def spi_configure(self, polarity, phase, bitorder):
+        super(ResilientAardvark, self).spi_configure(polarity, phase,
+                bitorder)
+        self._spi_config = (polarity, phase, bitorder)
+
+    def spi_ss_polarity(self, polarity):
+        super(ResilientAardvark, self).spi_ss_polarity(polarity)
+        self._spi_ss_polarity = polarity
+
+    def enable_i2c_slave(self, slave_address, buffer_size=None):
+        super(ResilientAardvark, self).enable_i2c_slave(slave_address,
+                buffer_size)
+        size = self._i2c_slave_buffer_size
+        self._i2c_slave_config = (slave_address, size, size)
+
+    def disable_i2c_slave(self):
+        super(ResilientAardvark, self).disable_i2c_slave()
+        self._i2c_slave_config = None
+
+    def enable_spi_slave(self):
+        super(ResilientAardvark, self).enable_spi_slave()
+        self._spi_slave_enabled = True
+
+    def disable_spi_slave(self):
+        super(ResilientAardvark, self).disable_spi_slave()
+        self._spi_slave_enabled = False
+
+# retry all public methods and properties of Aardvark
+for _name in dir(ResilientAardvark):
+    if _name.startswith('_') or _name in ('close', 'reconnect',
+            'cache_config', 'BUFFER_SIZE'):
+        continue
+    _attr = getattr(ResilientAardvark, _name)
+    if isinstance(_attr, property):
+        _attr = property(_reconnecting(_attr.fget),
+                _attr.fset and _reconnecting(_attr.fset), None,
+                _attr.__doc__)
+    elif callable(_attr):
+        _attr = _reconnecting(_attr)
+    else:
+        continue
+    setattr(ResilientAardvark, _name, _attr)
+del _name, _attr
@@ -0,0 +1,1231 @@
+# Copyright (c) 2014-2018  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Pure-Python stand-in for the binary module supplied by Total Phase.
+
+This module implements the same ``py_aa_*`` functions as the vendor
+binding, but instead of talking to real hardware it hosts simulated host
+adapters with virtual I2C and SPI targets attached to them. It can be used
+to run the library (and your own programs) on machines without an Aardvark
+adapter.
+
+The backend is selected either globally by setting the environment variable
+``PYAARDVARK_BACKEND=sim`` before :mod:`pyaardvark` is imported, or per
+device by passing ``backend='sim'`` to :func:`pyaardvark.open`.
+
+Simulated adapters have to be created before they can be opened::
+
+  from pyaardvark import sim
+
+  adapter = sim.add_adapter(serial_number='1234-567890')
+  adapter.attach_i2c(0x50, sim.I2CEeprom(size=256, page_size=8))
+  adapter.attach_spi(sim.SPIFlash(size=1024 * 1024))
+
+  a = pyaardvark.open(serial_number='1234-567890', backend='sim')
+"""
+
+import itertools
+import threading
+import time
+
+from .constants import *
+
+#: Version reported by the simulated binding. Same format as the one of the
+#: vendor module, that is the lower 16 bits are the software version.
+SIM_VERSION = 0x0600
+
+_STATUS_STRINGS = {
+    0: 'ok',
+    ERR_UNABLE_TO_LOAD_LIBRARY: 'unable to load library',
+    ERR_UNABLE_TO_LOAD_DRIVER: 'unable to load USB driver',
+    ERR_UNABLE_TO_LOAD_FUNCTION: 'unable to load binding function',
+    ERR_INCOMPATIBLE_LIBRARY: 'incompatible library version',
+    ERR_INCOMPATIBLE_DEVICE: 'incompatible device version',
+    ERR_COMMUNICATION_ERROR: 'communication error',
+    ERR_UNABLE_TO_OPEN: 'unable to open device',
+    ERR_UNABLE_TO_CLOSE: 'unable to close device',
+    ERR_INVALID_HANDLE: 'invalid device handle',
+    ERR_CONFIG_ERROR: 'configuration error',
+    ERR_I2C_NOT_AVAILABLE: 'i2c feature not available',
+    ERR_I2C_NOT_ENABLED: 'i2c not enabled',
+    ERR_I2C_READ_ERROR: 'i2c read error',
+    ERR_I2C_WRITE_ERROR: 'i2c write error',
+    ERR_I2C_SLAVE_BAD_CONFIG: 'i2c slave enable bad config',
+    ERR_I2C_SLAVE_READ_ERROR: 'i2c slave read error',
+    ERR_I2C_SLAVE_TIMEOUT: 'i2c slave timeout',
+    ERR_I2C_DROPPED_EXCESS_BYTES: 'i2c slave dropped excess bytes',
+    ERR_I2C_BUS_ALREADY_FREE: 'i2c bus already free',
+    ERR_SPI_NOT_AVAILABLE: 'spi feature not available',
+    ERR_SPI_NOT_ENABLED: 'spi not enabled',
+    ERR_SPI_WRITE_ERROR: 'spi write error',
+    ERR_SPI_SLAVE_READ_ERROR: 'spi slave read error',
+    ERR_SPI_SLAVE_TIMEOUT: 'spi slave timeout',
+    ERR_SPI_DROPPED_EXCESS_BYTES: 'spi slave dropped excess bytes',
+    ERR_GPIO_NOT_AVAILABLE: 'gpio feature not available',
+}
+
+# Maximum size of the slave response buffers of the real hardware.
+_SLAVE_RESPONSE_SIZE = 64
+
+# Features as reported by aa_features()
+_FEATURE_SPI = 0x01
+_FEATURE_I2C = 0x02
+_FEATURE_GPIO = 0x08
+
+
+class I2CTarget(object):
+    """Base class for simulated I2C targets.
+
+    A target is attached to a :class:`SimAdapter` at a specific address. For
+    every master transaction, :meth:`start` is called first. If it returns
+    `False`, the address is not acknowledged. Afterwards :meth:`write` or
+    :meth:`read` is called with the payload. :meth:`stop` is called once the
+    adapter generates a stop condition.
+
+    `now` is the current time of the adapter in seconds.
+    """
+
+    #: Time in seconds the target stretches the clock after each byte.
+    clock_stretch = 0
+
+    def start(self, now, read):
+        """Called on a (repeated) start condition. Return `True` to
+        acknowledge the address."""
+        return True
+
+    def write(self, now, data):
+        """Called with the bytes written by the master. Return the number of
+        acknowledged bytes."""
+        return len(data)
+
+    def read(self, now, length):
+        """Return up to `length` bytes to the master. Missing bytes are read
+        as 0xff."""
+        return b'\xff' * length
+
+    def stop(self, now):
+        """Called on a stop condition."""
+        pass
+
+
+class I2CRegisterFile(I2CTarget):
+    """A generic register based device.
+
+    The first `addr_width` bytes of a write access set the register pointer
+    (most significant byte first), all following bytes are written to the
+    registers. Reads start at the register pointer. The pointer is
+    incremented after each byte and wraps around at `size`.
+    """
+
+    def __init__(self, size=256, addr_width=1, data=None):
+        self.size = size
+        self.addr_width = addr_width
+        self.memory = bytearray(b'\xff' * size)
+        if data is not None:
+            self.memory[:len(data)] = data
+        self.pointer = 0
+        self._addr_bytes = None
+
+    def start(self, now, read):
+        self._addr_bytes = None if read else bytearray()
+        return True
+
+    def _set_pointer(self, data):
+        consumed = 0
+        while (self._addr_bytes is not None
+                and len(self._addr_bytes) < self.addr_width
+                and consumed < len(data)):
+            self._addr_bytes.append(data[consumed])
+            consumed += 1
+        if (self._addr_bytes is not None
+                and len(self._addr_bytes) == self.addr_width):
+            self.pointer = int.from_bytes(self._addr_bytes, 'big') % self.size
+            self._addr_bytes = None
+        return consumed
+
+    def write(self, now, data):
+        consumed = self._set_pointer(data)
+        for b in data[consumed:]:
+            self.store(self.pointer, b)
+            self.pointer = (self.pointer + 1) % self.size
+        return len(data)
+
+    def store(self, offset, value):
+        """Store a single byte. Can be overridden to model read-only or
+        side-effect registers."""
+        self.memory[offset] = value
+
+    def read(self, now, length):
+        data = bytearray(length)
+        for i in range(length):
+            data[i] = self.memory[self.pointer]
+            self.pointer = (self.pointer + 1) % self.size
+        return data
+
+
+class I2CEeprom(I2CRegisterFile):
+    """A 24Cxx style I2C EEPROM.
+
+    Writes are buffered in the page buffer and wrap around within a page,
+    just like the real devices do. The data is committed on the stop
+    condition. Afterwards the device is busy for `write_cycle_time` seconds
+    and does not acknowledge its address, which allows ACK polling.
+    """
+
+    def __init__(self, size=256, page_size=8, addr_width=1,
+            write_cycle_time=0.005, data=None):
+        super(I2CEeprom, self).__init__(size, addr_width, data)
+        self.page_size = page_size
+        self.write_cycle_time = write_cycle_time
+        self.busy_until = 0
+        self._pending = dict()
+        self._page_start = None
+
+    def start(self, now, read):
+        if now < self.busy_until:
+            return False
+        super(I2CEeprom, self).start(now, read)
+        return True
+
+    def write(self, now, data):
+        consumed = self._set_pointer(data)
+        if consumed and self._addr_bytes is None:
+            self._page_start = self.pointer - self.pointer % self.page_size
+        for b in data[consumed:]:
+            self._pending[self.pointer] = b
+            offset = (self.pointer + 1) % self.page_size
+            self.pointer = self._page_start + offset
+        return len(data)
+
+    def stop(self, now):
+        if self._pending:
+            for offset, value in self._pending.items():
+                self.store(offset, value)
+            self._pending.clear()
+            self.busy_until = now + self.write_cycle_time
+
+
+class SPITarget(object):
+    """Base class for simulated SPI targets.
+
+    Each call to :meth:`transfer` corresponds to one transaction, ie. the
+    slave select line is asserted before the first byte and deasserted
+    after the last byte.
+    """
+
+    def transfer(self, now, data):
+        """Return as many bytes as given in `data`."""
+        return b'\xff' * len(data)
+
+
+class SPIFlash(SPITarget):
+    """A simple SPI NOR flash.
+
+    Supports the common command set: read JEDEC ID (9Fh), read SFDP (5Ah),
+    read (03h), fast read (0Bh), write enable (06h), write disable (04h),
+    read status (05h), page program (02h), 4k sector erase (20h), 32k block
+    erase (52h), 64k block erase (D8h) and chip erase (C7h/60h).
+
+    Devices larger than 16 MiB additionally support the commands with
+    4-byte addresses: read (13h), fast read (0Ch), page program (12h) and
+    the erase commands (21h, 5Ch, DCh).
+
+    Program and erase operations keep the write in progress bit set for the
+    given amount of seconds.
+    """
+
+    SR_WIP = 0x01
+    SR_WEL = 0x02
+
+    # command: (handler, address width)
+    _COMMANDS = {
+        0x03: ('_cmd_read', 3),
+        0x0b: ('_cmd_fast_read', 3),
+        0x02: ('_cmd_program', 3),
+        0x20: ('_cmd_erase_4k', 3),
+        0x52: ('_cmd_erase_32k', 3),
+        0xd8: ('_cmd_erase_64k', 3),
+        0x13: ('_cmd_read', 4),
+        0x0c: ('_cmd_fast_read', 4),
+        0x12: ('_cmd_program', 4),
+        0x21: ('_cmd_erase_4k', 4),
+        0x5c: ('_cmd_erase_32k', 4),
+        0xdc: ('_cmd_erase_64k', 4),
+    }
+
+    def __init__(self, size=1024 * 1024, page_size=256,
+            jedec_id=b'\xef\x40\x14', data=None, page_program_time=0.0007,
+            sector_erase_time=0.045, block_erase_time=0.15,
+            chip_erase_time=2.0, sfdp=True):
+        self.size = size
+        self.page_size = page_size
+        self.jedec_id = bytes(jedec_id)
+        self.memory = bytearray(b'\xff' * size)
+        if data is not None:
+            self.memory[:len(data)] = data
+        self.page_program_time = page_program_time
+        self.sector_erase_time = sector_erase_time
+        self.block_erase_time = block_erase_time
+        self.chip_erase_time = chip_erase_time
+        self.sfdp = self._build_sfdp() if sfdp else None
+        self.status = 0
+        self.busy_until = 0
+
+    def _build_sfdp(self):
+        # SFDP header and one parameter header pointing to a JESD216B basic
+        # flash parameter table with 16 DWORDs at 0x30
+        sfdp = bytearray(b'\xff' * 0x70)
+        sfdp[0:8] = b'SFDP\x06\x01\x00\xff'
+        sfdp[8:16] = b'\x00\x06\x01\x10\x30\x00\x00\xff'
+        dwords = [0] * 16
+        # 4k erase supported, write granularity >= 64 bytes, 4k erase opcode
+        dwords[0] = 0x01 | 0x04 | (0x20 << 8)
+        if self.size > 1 << 24:
+            # 3- or 4-byte addressing
+            dwords[0] |= 1 << 17
+        bits = self.size * 8
+        if bits <= 1 << 31:
+            dwords[1] = bits - 1
+        else:
+            dwords[1] = (1 << 31) | (bits.bit_length() - 1)
+        # erase types: 4k (20h), 32k (52h), 64k (D8h)
+        dwords[7] = 12 | (0x20 << 8) | (15 << 16) | (0x52 << 24)
+        dwords[8] = 16 | (0xd8 << 8)
+        # page size
+        dwords[10] = (self.page_size.bit_length() - 1) << 4
+        for i, dword in enumerate(dwords):
+            sfdp[0x30 + 4 * i:0x34 + 4 * i] = dword.to_bytes(4, 'little')
+        return bytes(sfdp)
+
+    def _address(self, data, width=3):
+        return int.from_bytes(bytes(data[1:1 + width]), 'big') % self.size
+
+    def _busy(self, now):
+        if now >= self.busy_until:
+            self.status &= ~self.SR_WIP
+        return self.status & self.SR_WIP
+
+    def _start_operation(self, now, duration):
+        self.status = (self.status | self.SR_WIP) & ~self.SR_WEL
+        self.busy_until = now + duration
+
+    def _read(self, data, offset, addr):
+        rx = bytearray(b'\xff' * len(data))
+        length = len(data) - offset
+        if length > 0:
+            end = addr + length
+            chunk = self.memory[addr:end]
+            if end > self.size:
+                chunk += self.memory[:end - self.size]
+            rx[offset:] = chunk
+        return rx
+
+    def _erase(self, now, data, width, block_size, duration):
+        addr = self._address(data, width)
+        addr -= addr % block_size
+        self.memory[addr:addr + block_size] = b'\xff' * block_size
+        self._start_operation(now, duration)
+
+    def _cmd_read(self, now, data, width):
+        return self._read(data, 1 + width, self._address(data, width))
+
+    def _cmd_fast_read(self, now, data, width):
+        return self._read(data, 2 + width, self._address(data, width))
+
+    def _cmd_program(self, now, data, width):
+        if not self.status & self.SR_WEL or len(data) <= 1 + width:
+            return
+        addr = self._address(data, width)
+        page = addr - addr % self.page_size
+        for b in data[1 + width:]:
+            self.memory[addr] &= b
+            addr = page + (addr + 1) % self.page_size
+        self._start_operation(now, self.page_program_time)
+
+    def _cmd_erase_4k(self, now, data, width):
+        if self.status & self.SR_WEL and len(data) >= 1 + width:
+            self._erase(now, data, width, 4096, self.sector_erase_time)
+
+    def _cmd_erase_32k(self, now, data, width):
+        if self.status & self.SR_WEL and len(data) >= 1 + width:
+            self._erase(now, data, width, 32768, self.block_erase_time)
+
+    def _cmd_erase_64k(self, now, data, width):
+        if self.status & self.SR_WEL and len(data) >= 1 + width:
+            self._erase(now, data, width, 65536, self.block_erase_time)
+
+    def transfer(self, now, data):
+        if not data:
+            return b''
+        cmd = data[0]
+        busy = self._busy(now)
+
+        if cmd == 0x05:
+            return bytes([0xff]) + bytes([self.status]) * (len(data) - 1)
+        if busy:
+            # all other commands are ignored while the device is busy
+            return b'\xff' * len(data)
+
+        if cmd in self._COMMANDS:
+            name, width = self._COMMANDS[cmd]
+            if width == 4 and self.size <= 1 << 24:
+                return b'\xff' * len(data)
+            rx = getattr(self, name)(now, data, width)
+            if rx is not None:
+                return rx
+        elif cmd == 0x9f:
+            rx = bytearray(b'\xff' * len(data))
+            id_ = self.jedec_id[:len(data) - 1]
+            rx[1:1 + len(id_)] = id_
+            return rx
+        elif cmd == 0x5a and self.sfdp is not None:
+            rx = bytearray(b'\xff' * len(data))
+            addr = int.from_bytes(bytes(data[1:4]), 'big')
+            table = self.sfdp[addr:addr + len(data) - 5]
+            rx[5:5 + len(table)] = table
+            return rx
+        elif cmd == 0x06:
+            self.status |= self.SR_WEL
+        elif cmd == 0x04:
+            self.status &= ~self.SR_WEL
+        elif cmd in (0xc7, 0x60) and self.status & self.SR_WEL:
+            self.memory[:] = b'\xff' * self.size
+            self._start_operation(now, self.chip_erase_time)
+        return b'\xff' * len(data)
+
+
+class SimAdapter(object):
+    """A simulated Aardvark host adapter.
+
+    Use :func:`add_adapter` to create one. I2C targets are attached with
+    :meth:`attach_i2c`, a SPI target with :meth:`attach_spi`.
+
+    For the slave mode, the adapter can act as the opposing master by
+    using :meth:`i2c_master_transmit` and :meth:`i2c_master_receive`
+    respectively :meth:`spi_master_transfer`. GPIO inputs are driven with
+    :meth:`drive_gpio` and the outputs are observed with :meth:`gpio_state`.
+
+    The adapter models the time the real hardware would spend on the bus.
+    Each call which has to go to the adapter costs `usb_latency` seconds. An
+    I2C transaction costs nine bit times per byte (including the address
+    byte and the ACK bit), one bit time for each start and stop condition
+    and the clock stretching of the target. A SPI transaction costs eight
+    bit times plus `spi_byte_gap` bit times per byte.
+
+    If `realtime` is `True`, the calls actually take that long. Otherwise
+    the adapter keeps a virtual clock, which is the wall clock advanced by
+    the modelled time. Either way, :meth:`elapsed` returns the time a run
+    would have taken on real hardware.
+    """
+
+    def __init__(self, port, unique_id, hardware=0x0300, firmware=0x0300,
+            usb_latency=0.001, spi_byte_gap=1, realtime=False):
+        self.port = port
+        self.unique_id = unique_id
+        self.hardware = hardware
+        self.firmware = firmware
+        self.handle = None
+
+        self.i2c_targets = dict()
+        self.spi_target = None
+
+        self.lock = threading.RLock()
+        self._events = threading.Condition(self.lock)
+
+        self.usb_latency = usb_latency
+        self.spi_byte_gap = spi_byte_gap
+        self.realtime = realtime
+        self._offset = 0
+        self.reset_timing()
+
+        self.reset()
+
+    def reset(self):
+        """Reset the adapter to its power-on state."""
+        with self.lock:
+            self.config = CONFIG_SPI_I2C
+            self.i2c_bitrate = 100
+            self.spi_bitrate = 1000
+            self.i2c_pullups = I2C_PULLUP_NONE
+            self.target_power = TARGET_POWER_NONE
+            self.i2c_bus_timeout = 200
+            self.spi_config = (SPI_POL_RISING_FALLING, SPI_PHASE_SAMPLE_SETUP,
+                    SPI_BITORDER_MSB)
+            self.spi_ss_polarity = SPI_SS_ACTIVE_LOW
+
+            self._bus_held_by = None
+
+            self.i2c_slave_address = None
+            self.i2c_slave_response = b''
+            self.i2c_slave_transmitted = 0
+            self._i2c_slave_rx = list()
+            self._i2c_slave_tx = list()
+
+            self.spi_slave_enabled = False
+            self.spi_slave_response = b''
+            self._spi_slave_rx = list()
+
+            self.gpio_direction = 0
+            self.gpio_pullups = 0
+            self.gpio_output = 0
+            self._gpio_driven = 0
+            self._gpio_levels = 0
+            self._gpio_last = 0
+
+    def now(self):
+        """Return the current time of the adapter in seconds."""
+        return time.monotonic() + self._offset
+
+    def _advance(self, duration):
+        if self.realtime:
+            time.sleep(duration)
+        else:
+            self._offset += duration
+
+    def reset_timing(self):
+        """Reset the timing statistics and restart :meth:`elapsed`."""
+        with self.lock:
+            self.round_trips = 0
+            self.usb_time = 0
+            self.bus_time = 0
+            self._start_time = self.now()
+
+    def elapsed(self):
+        """Return the time in seconds since the last :meth:`reset_timing`,
+        including the modelled USB and bus time."""
+        return self.now() - self._start_time
+
+    def round_trip(self):
+        """Account for one USB round trip to the adapter."""
+        with self.lock:
+            self.round_trips += 1
+            self.usb_time += self.usb_latency
+            self._advance(self.usb_latency)
+
+    def _bus(self, bits, bitrate_khz, extra=0):
+        duration = bits / (bitrate_khz * 1000.0) + extra
+        self.bus_time += duration
+        self._advance(duration)
+
+    def attach_i2c(self, address, target):
+        """Attach an :class:`I2CTarget` at the given address."""
+        with self.lock:
+            self.i2c_targets[address] = target
+        return target
+
+    def detach_i2c(self, address):
+        with self.lock:
+            del self.i2c_targets[address]
+
+    def attach_spi(self, target):
+        """Attach a :class:`SPITarget`."""
+        with self.lock:
+            self.spi_target = target
+        return target
+
+    def _gpio_pins(self):
+        pins = GPIO_ALL
+        if self.config & CONFIG_GPIO_I2C:
+            pins &= ~(GPIO_SCL | GPIO_SDA)
+        if self.config & CONFIG_SPI_GPIO:
+            pins &= ~(GPIO_MISO | GPIO_SCK | GPIO_MOSI | GPIO_SS)
+        return pins
+
+    def gpio_state(self):
+        """Return the levels of the GPIO pins as seen by the adapter.
+
+        Output pins have the level set by the adapter. Input pins have the
+        level set by :meth:`drive_gpio` or, if they are not driven, read as
+        high if their pullup is enabled and as low otherwise. Pins used by
+        the I2C or SPI interface read as low.
+        """
+        with self.lock:
+            pins = self._gpio_pins()
+            outputs = self.gpio_direction & pins
+            inputs = pins & ~outputs
+            levels = ((self._gpio_levels & self._gpio_driven)
+                    | (self.gpio_pullups & ~self._gpio_driven))
+            return (self.gpio_output & outputs) | (levels & inputs)
+
+    def drive_gpio(self, value, mask=GPIO_ALL):
+        """Act as the target and drive the pins in `mask` to the levels
+        given by the bitmask `value`."""
+        with self.lock:
+            self._gpio_driven |= mask
+            self._gpio_levels = (self._gpio_levels & ~mask) | (value & mask)
+            self._notify()
+
+    def release_gpio(self, mask=GPIO_ALL):
+        """Stop driving the pins in `mask`."""
+        with self.lock:
+            self._gpio_driven &= ~mask
+            self._notify()
+
+    def _gpio_changed(self):
+        inputs = self._gpio_pins() & ~self.gpio_direction
+        return (self.gpio_state() ^ self._gpio_last) & inputs
+
+    def wait_gpio_change(self, timeout):
+        """Wait until an input pin differs from the last reported state. A
+        negative `timeout` waits forever."""
+        with self.lock:
+            if timeout < 0:
+                timeout = None
+            else:
+                timeout = timeout / 1000.0
+            self._events.wait_for(self._gpio_changed, timeout)
+            self._gpio_last = self.gpio_state()
+            return self._gpio_last
+
+    def _release_bus(self):
+        if self._bus_held_by is not None:
+            # stop condition
+            self._bus(1, self.i2c_bitrate)
+            self._bus_held_by.stop(self.now())
+            self._bus_held_by = None
+
+    def i2c_transfer(self, address, flags, data=None, length=0):
+        """Perform one master transaction. Returns a tuple (status, data,
+        count)."""
+        target = self.i2c_targets.get(address)
+        bitrate = self.i2c_bitrate
+        read = data is None
+
+        if self._bus_held_by is not None and self._bus_held_by is not target:
+            self._release_bus()
+
+        # start condition and address byte(s)
+        self._bus(1 + (18 if flags & I2C_10_BIT_ADDR else 9), bitrate)
+
+        if target is None or not target.start(self.now(), read):
+            self._release_bus()
+            return (I2C_STATUS_SLA_NACK, b'', 0)
+
+        status = I2C_STATUS_OK
+        if read:
+            rx = bytes(target.read(self.now(), length))
+            rx += b'\xff' * (length - len(rx))
+            count = length
+        else:
+            rx = b''
+            count = target.write(self.now(), data)
+            if count < len(data):
+                status = I2C_STATUS_DATA_NACK
+        self._bus(count * 9, bitrate, count * target.clock_stretch)
+
+        self._bus_held_by = target
+        if not flags & I2C_NO_STOP or status != I2C_STATUS_OK:
+            self._release_bus()
+
+        return (status, rx, count)
+
+    def spi_transfer(self, data):
+        """Perform one SPI master transaction."""
+        self._bus(len(data) * (8 + self.spi_byte_gap), self.spi_bitrate)
+        if self.spi_target is None:
+            return b'\xff' * len(data)
+        return bytes(self.spi_target.transfer(self.now(), data))
+
+    def _notify(self):
+        self._events.notify_all()
+
+    def _pending_events(self):
+        events = POLL_NO_DATA
+        if self._i2c_slave_rx:
+            events |= POLL_I2C_READ
+        if self._i2c_slave_tx:
+            events |= POLL_I2C_WRITE
+        if self._spi_slave_rx:
+            events |= POLL_SPI
+        return events
+
+    def wait_events(self, timeout):
+        """Wait for slave events. A negative `timeout` waits forever."""
+        with self.lock:
+            if timeout < 0:
+                timeout = None
+            else:
+                timeout = timeout / 1000.0
+            self._events.wait_for(self._pending_events, timeout)
+            return self._pending_events()
+
+    def i2c_master_transmit(self, address, data):
+        """Act as an opposing master and write `data` to the adapter, which
+        must be in slave mode. Returns `True` if the address was
+        acknowledged."""
+        with self.lock:
+            if (self.i2c_slave_address is None
+                    or address not in (self.i2c_slave_address, 0)):
+                return False
+            if address == 0:
+                address = 0x80
+            self._i2c_slave_rx.append((address, bytes(data)))
+            self._notify()
+        return True
+
+    def i2c_master_receive(self, address, length):
+        """Act as an opposing master and read `length` bytes from the
+        adapter, which must be in slave mode. Returns `None` if the address
+        was not acknowledged."""
+        with self.lock:
+            if (self.i2c_slave_address is None
+                    or address != self.i2c_slave_address):
+                return None
+            response = self.i2c_slave_response
+            if response:
+                data = bytes(response[i % len(response)]
+                        for i in range(length))
+            else:
+                data = b'\xff' * length
+            self._i2c_slave_tx.append(length)
+            self._notify()
+        return data
+
+    def spi_master_transfer(self, data):
+        """Act as an opposing SPI master. The adapter must be in SPI slave
+        mode. Returns the bytes clocked out by the adapter."""
+        with self.lock:
+            if not self.spi_slave_enabled:
+                return b'\xff' * len(data)
+            response = self.spi_slave_response or b'\xff'
+            rx = bytes(response[i % len(response)]
+                    for i in range(len(data)))
+            self._spi_slave_rx.append(bytes(data))
+            self._notify()
+        return rx
+
+
+_lock = threading.Lock()
+_adapters = list()
+_handles = dict()
+# handles of adapters which were removed while they were open
+_unplugged = set()
+_handle_counter = itertools.count(1)
+
+
+def _parse_serial_number(serial_number):
+    if isinstance(serial_number, int):
+        return serial_number
+    id1, id2 = serial_number.split('-')
+    return int(id1) * 1000000 + int(id2)
+
+
+def add_adapter(serial_number=None, port=None, **kwargs):
+    """Create a new simulated adapter and return the :class:`SimAdapter`
+    object.
+
+    `serial_number` can either be a string in the format NNNN-MMMMMM or an
+    integer. If omitted, a serial number is generated. The same applies for
+    the `port`.
+    """
+    with _lock:
+        if port is None:
+            used = set(a.port for a in _adapters)
+            port = next(p for p in itertools.count() if p not in used)
+        if serial_number is None:
+            serial_number = 2237000000 + port
+        adapter = SimAdapter(port, _parse_serial_number(serial_number),
+                **kwargs)
+        _adapters.append(adapter)
+    return adapter
+
+
+def remove_adapter(adapter):
+    """Remove an adapter, like unplugging it from the USB bus. Calls using
+    a handle of the adapter fail with :data:`ERR_COMMUNICATION_ERROR`
+    afterwards."""
+    with _lock:
+        _adapters.remove(adapter)
+        if adapter.handle is not None:
+            _handles.pop(adapter.handle, None)
+            _unplugged.add(adapter.handle)
+            adapter.handle = None
+
+
+def adapters():
+    """Return a list of all simulated adapters."""
+    with _lock:
+        return list(_adapters)
+
+
+def reset():
+    """Remove all simulated adapters."""
+    with _lock:
+        del _adapters[:]
+        _handles.clear()
+        _unplugged.clear()
+
+
+def _adapter(handle):
+    return _handles.get(handle)
+
+
+def _device(handle):
+    # Same as _adapter() but for calls which need a round trip to the
+    # adapter.
+    adapter = _handles.get(handle)
+    if adapter is not None:
+        adapter.round_trip()
+    return adapter
+
+
+def _bad_handle(handle):
+    # The binding reports a communication error for handles of adapters
+    # which were disconnected.
+    if handle in _unplugged:
+        return ERR_COMMUNICATION_ERROR
+    return ERR_INVALID_HANDLE
+
+
+def _bytes(buf, length):
+    return bytes(memoryview(buf).cast('B')[:length])
+
+
+def _copy_into(buf, data):
+    memoryview(buf).cast('B')[:len(data)] = data
+
+
+#
+# Binding functions
+#
+
+def py_version():
+    return (SIM_VERSION << 16) | SIM_VERSION
+
+
+def py_aa_status_string(status):
+    return _STATUS_STRINGS.get(status)
+
+
+def py_aa_find_devices(num_devices, devices):
+    return py_aa_find_devices_ext(num_devices, 0, devices, None)
+
+
+def py_aa_find_devices_ext(num_devices, num_ids, devices, unique_ids):
+    with _lock:
+        for i, adapter in enumerate(sorted(_adapters, key=lambda a: a.port)):
+            port = adapter.port
+            if adapter.handle is not None:
+                port |= PORT_NOT_FREE
+            if i < num_devices:
+                devices[i] = port
+            if i < num_ids:
+                unique_ids[i] = adapter.unique_id
+        return len(_adapters)
+
+
+def py_aa_open(port):
+    handle, _ = py_aa_open_ext(port)
+    return handle
+
+
+def py_aa_open_ext(port):
+    with _lock:
+        for adapter in _adapters:
+            if adapter.port == port:
+                break
+        else:
+            return (ERR_UNABLE_TO_OPEN, (0,) * 6)
+        if adapter.handle is not None:
+            return (ERR_UNABLE_TO_OPEN, (0,) * 6)
+        adapter.handle = next(_handle_counter)
+        _handles[adapter.handle] = adapter
+    version = (SIM_VERSION, adapter.firmware, adapter.hardware, 0, 0, 0)
+    return (adapter.handle, version)
+
+
+def py_aa_close(handle):
+    with _lock:
+        adapter = _handles.pop(handle, None)
+        if adapter is None:
+            if handle in _unplugged:
+                _unplugged.discard(handle)
+                return 1
+            return ERR_INVALID_HANDLE
+        with adapter.lock:
+            adapter._release_bus()
+            adapter.handle = None
+        return 1
+
+
+def py_aa_port(handle):
+    adapter = _adapter(handle)
+    if adapter is None:
+        return _bad_handle(handle)
+    return adapter.port
+
+
+def py_aa_features(handle):
+    adapter = _adapter(handle)
+    if adapter is None:
+        return _bad_handle(handle)
+    return _FEATURE_SPI | _FEATURE_I2C | _FEATURE_GPIO
+
+
+def py_aa_unique_id(handle):
+    adapter = _adapter(handle)
+    if adapter is None:
+        return 0
+    return adapter.unique_id
+
+
+def py_aa_sleep_ms(milliseconds):
+    time.sleep(milliseconds / 1000.0)
+    return milliseconds
+
+
+def py_aa_configure(handle, config):
+    adapter = _device(handle)
+    if adapter is None:
+        return _bad_handle(handle)
+    with adapter.lock:
+        if config != CONFIG_QUERY:
+            if config not in (CONFIG_GPIO_ONLY, CONFIG_SPI_GPIO,
+                    CONFIG_GPIO_I2C, CONFIG_SPI_I2C):
+                return ERR_CONFIG_ERROR
+            adapter.config = config
+        return adapter.config
+
+
+def py_aa_target_power(handle, power_mask):
+    adapter = _device(handle)
+    if adapter is None:
+        return _bad_handle(handle)
+    with adapter.lock:
+        if power_mask != TARGET_POWER_QUERY:
+            adapter.target_power = power_mask
+        return adapter.target_power
+
+
+def py_aa_i2c_pullup(handle, pullup_mask):
+    adapter = _device(handle)
+    if adapter is None:
+        return _bad_handle(handle)
+    with adapter.lock:
+        if pullup_mask != I2C_PULLUP_QUERY:
+            adapter.i2c_pullups = pullup_mask
+        return adapter.i2c_pullups
+
+
+def py_aa_i2c_bitrate(handle, bitrate_khz):
+    adapter = _device(handle)
+    if adapter is None:
+        return _bad_handle(handle)
+    with adapter.lock:
+        if bitrate_khz:
+            adapter.i2c_bitrate = max(1, min(bitrate_khz, 800))
+        return adapter.i2c_bitrate
+
+
+def py_aa_i2c_bus_timeout(handle, timeout_ms):
+    adapter = _device(handle)
+    if adapter is None:
+        return _bad_handle(handle)
+    with adapter.lock:
+        if timeout_ms:
+            adapter.i2c_bus_timeout = max(10, min(timeout_ms, 450))
+        return adapter.i2c_bus_timeout
+
+
+def _i2c_adapter(handle):
+    adapter = _device(handle)
+    if adapter is None:
+        return (None, _bad_handle(handle))
+    if not adapter.config & CONFIG_GPIO_I2C:
+        return (None, ERR_I2C_NOT_ENABLED)
+    return (adapter, 0)
+
+
+def py_aa_i2c_free_bus(handle):
+    adapter, err = _i2c_adapter(handle)
+    if adapter is None:
+        return err
+    with adapter.lock:
+        if adapter._bus_held_by is None:
+            return ERR_I2C_BUS_ALREADY_FREE
+        adapter._release_bus()
+    return 0
+
+
+def py_aa_i2c_write_ext(handle, slave_addr, flags, num_bytes, data_out):
+    adapter, err = _i2c_adapter(handle)
+    if adapter is None:
+        return (err, 0)
+    with adapter.lock:
+        status, _, count = adapter.i2c_transfer(slave_addr, flags,
+                data=_bytes(data_out, num_bytes))
+    return (status, count)
+
+
+def py_aa_i2c_write(handle, slave_addr, flags, num_bytes, data_out):
+    status, count = py_aa_i2c_write_ext(handle, slave_addr, flags, num_bytes,
+            data_out)
+    if status < 0:
+        return status
+    return count
+
+
+def py_aa_i2c_read_ext(handle, slave_addr, flags, num_bytes, data_in):
+    adapter, err = _i2c_adapter(handle)
+    if adapter is None:
+        return (err, 0)
+    with adapter.lock:
+        status, rx, count = adapter.i2c_transfer(slave_addr, flags,
+                length=num_bytes)
+    _copy_into(data_in, rx[:count])
+    return (status, count)
+
+
+def py_aa_i2c_read(handle, slave_addr, flags, num_bytes, data_in):
+    status, count = py_aa_i2c_read_ext(handle, slave_addr, flags, num_bytes,
+            data_in)
+    if status < 0:
+        return status
+    return count
+
+
+def py_aa_i2c_write_read(handle, slave_addr, flags, out_num_bytes, out_data,
+        in_num_bytes, in_data):
+    adapter, err = _i2c_adapter(handle)
+    if adapter is None:
+        return (err, 0, 0)
+    with adapter.lock:
+        w_status, _, w_count = adapter.i2c_transfer(slave_addr,
+                flags | I2C_NO_STOP, data=_bytes(out_data, out_num_bytes))
+        if w_status != I2C_STATUS_OK:
+            adapter._release_bus()
+            return (w_status, w_count, 0)
+        r_status, rx, r_count = adapter.i2c_transfer(slave_addr,
+                flags & ~I2C_NO_STOP, length=in_num_bytes)
+    _copy_into(in_data, rx[:r_count])
+    return ((r_status << 8) | w_status, w_count, r_count)
+
+
+def py_aa_i2c_slave_enable(handle, addr, maxTxBytes, maxRxBytes):
+    adapter, err = _i2c_adapter(handle)
+    if adapter is None:
+        return err
+    with adapter.lock:
+        adapter.i2c_slave_address = addr
+        adapter.i2c_slave_max_tx = maxTxBytes
+        adapter.i2c_slave_max_rx = maxRxBytes
+    return 0
+
+
+def py_aa_i2c_slave_disable(handle):
+    adapter, err = _i2c_adapter(handle)
+    if adapter is None:
+        return err
+    with adapter.lock:
+        adapter.i2c_slave_address = None
+        del adapter._i2c_slave_rx[:]
+        del adapter._i2c_slave_tx[:]
+    return 0
+
+
+def py_aa_i2c_slave_set_response(handle, num_bytes, data_out):
+    adapter = _device(handle)
+    if adapter is None:
+        return _bad_handle(handle)
+    num_bytes = min(num_bytes, _SLAVE_RESPONSE_SIZE)
+    with adapter.lock:
+        adapter.i2c_slave_response = _bytes(data_out, num_bytes)
+    return num_bytes
+
+
+def py_aa_i2c_slave_write_stats_ext(handle):
+    adapter = _device(handle)
+    if adapter is None:
+        return (_bad_handle(handle), 0)
+    with adapter.lock:
+        if not adapter._i2c_slave_tx:
+            return (ERR_I2C_SLAVE_TIMEOUT, 0)
+        count = adapter._i2c_slave_tx.pop(0)
+        adapter.i2c_slave_transmitted = count
+    return (I2C_STATUS_OK, count)
+
+
+def py_aa_i2c_slave_write_stats(handle):
+    status, count = py_aa_i2c_slave_write_stats_ext(handle)
+    if status < 0:
+        return status
+    return count
+
+
+def py_aa_i2c_slave_read_ext(handle, num_bytes, data_in):
+    adapter = _device(handle)
+    if adapter is None:
+        return (_bad_handle(handle), 0, 0)
+    with adapter.lock:
+        if not adapter._i2c_slave_rx:
+            return (ERR_I2C_SLAVE_TIMEOUT, 0, 0)
+        addr, data = adapter._i2c_slave_rx.pop(0)
+    if len(data) > num_bytes:
+        data = data[:num_bytes]
+    _copy_into(data_in, data)
+    return (I2C_STATUS_OK, addr, len(data))
+
+
+def py_aa_i2c_slave_read(handle, num_bytes, data_in):
+    status, addr, count = py_aa_i2c_slave_read_ext(handle, num_bytes, data_in)
+    if status < 0:
+        return (status, 0)
+    return (count, addr)
+
+
+def py_aa_async_poll(handle, timeout):
+    adapter = _adapter(handle)
+    if adapter is None:
+        return _bad_handle(handle)
+    return adapter.wait_events(timeout)
+
+
+def _spi_adapter(handle):
+    adapter = _device(handle)
+    if adapter is None:
+        return (None, _bad_handle(handle))
+    if not adapter.config & CONFIG_SPI_GPIO:
+        return (None, ERR_SPI_NOT_ENABLED)
+    return (adapter, 0)
+
+
+def py_aa_spi_bitrate(handle, bitrate_khz):
+    adapter = _device(handle)
+    if adapter is None:
+        return _bad_handle(handle)
+    with adapter.lock:
+        if bitrate_khz:
+            adapter.spi_bitrate = max(125, min(bitrate_khz, 8000))
+        return adapter.spi_bitrate
+
+
+def py_aa_spi_configure(handle, polarity, phase, bitorder):
+    adapter = _device(handle)
+    if adapter is None:
+        return _bad_handle(handle)
+    with adapter.lock:
+        adapter.spi_config = (polarity, phase, bitorder)
+    return 0
+
+
+def py_aa_spi_master_ss_polarity(handle, polarity):
+    adapter = _device(handle)
+    if adapter is None:
+        return _bad_handle(handle)
+    with adapter.lock:
+        adapter.spi_ss_polarity = polarity
+    return 0
+
+
+def py_aa_spi_write(handle, out_num_bytes, data_out, in_num_bytes, data_in):
+    adapter, err = _spi_adapter(handle)
+    if adapter is None:
+        return err
+    with adapter.lock:
+        rx = adapter.spi_transfer(_bytes(data_out, out_num_bytes))
+    count = min(in_num_bytes, len(rx))
+    _copy_into(data_in, rx[:count])
+    return len(rx)
+
+
+def py_aa_spi_slave_enable(handle):
+    adapter, err = _spi_adapter(handle)
+    if adapter is None:
+        return err
+    with adapter.lock:
+        adapter.spi_slave_enabled = True
+    return 0
+
+
+def py_aa_spi_slave_disable(handle):
+    adapter, err = _spi_adapter(handle)
+    if adapter is None:
+        return err
+    with adapter.lock:
+        adapter.spi_slave_enabled = False
+        del adapter._spi_slave_rx[:]
+    return 0
+
+
+def py_aa_spi_slave_set_response(handle, num_bytes, data_out):
+    adapter = _device(handle)
+    if adapter is None:
+        return _bad_handle(handle)
+    num_bytes = min(num_bytes, _SLAVE_RESPONSE_SIZE)
+    with adapter.lock:
+        adapter.spi_slave_response = _bytes(data_out, num_bytes)
+    return num_bytes
+
+
+def py_aa_spi_slave_read(handle, num_bytes, data_in):
+    adapter = _device(handle)
+    if adapter is None:
+        return _bad_handle(handle)
+    with adapter.lock:
+        if not adapter._spi_slave_rx:
+            return ERR_SPI_SLAVE_TIMEOUT
+        data = adapter._spi_slave_rx.pop(0)
+    # like the adapter, the excess bytes of a frame are dropped
+    _copy_into(data_in, data[:num_bytes])
+    if len(data) > num_bytes:
+        return ERR_SPI_DROPPED_EXCESS_BYTES
+    return len(data)
+
+
+def py_aa_gpio_direction(handle, direction_mask):
+    adapter = _device(handle)
+    if adapter is None:
+        return _bad_handle(handle)
+    with adapter.lock:
+        adapter.gpio_direction = direction_mask & GPIO_ALL
+        adapter._notify()
+    return 0
+
+
+def py_aa_gpio_pullup(handle, pullup_mask):
+    adapter = _device(handle)
+    if adapter is None:
+        return _bad_handle(handle)
+    with adapter.lock:
+        adapter.gpio_pullups = pullup_mask & GPIO_ALL
+        adapter._notify()
+    return 0
+
+
+def py_aa_gpio_get(handle):
+    adapter = _device(handle)
+    if adapter is None:
+        return _bad_handle(handle)
+    with adapter.lock:
+        adapter._gpio_last = adapter.gpio_state()
+        return adapter._gpio_last
+
+
+def py_aa_gpio_set(handle, value):
+    adapter = _device(handle)
+    if adapter is None:
+        return _bad_handle(handle)
+    with adapter.lock:
+        adapter.gpio_output = value & GPIO_ALL
+        adapter._notify()
+    return 0
+
+
+def py_aa_gpio_change(handle, timeout):
+    adapter = _device(handle)
+    if adapter is None:
+        return _bad_handle(handle)
+    return adapter.wait_gpio_change(timeout)
@@ -0,0 +1,237 @@
+# Copyright (c) 2014-2018  Kontron Europe GmbH
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Emulation of I2C devices with the slave mode of the adapter.
+
+An :class:`I2CSlaveServer` enables the slave mode and runs the poll loop in
+a background thread. Each transaction of the opposing master is dispatched
+to an :class:`I2CSlaveHandler`::
+
+  regs = RegisterFileHandler(size=256)
+  with I2CSlaveServer(a, 0x42, regs):
+      regs.store(0x10, b'\\x01\\x02')
+      ...
+
+The adapter answers read requests on its own with the response set last.
+Thus the handlers don't compute the data when the master reads, but return
+the response for the next read after each transaction.
+"""
+
+import logging
+import threading
+
+from .constants import *
+
+log = logging.getLogger(__name__)
+
+# Size of the slave response buffer of the adapter
+RESPONSE_SIZE = 64
+
+
+class I2CSlaveHandler(object):
+    """Base class of the devices emulated by an :class:`I2CSlaveServer`.
+
+    The methods returning a response may return `None` to keep the current
+    response of the adapter.
+    """
+
+    def response(self):
+        """Return the initial response."""
+        return None
+
+    def write(self, address, data):
+        """Called after the master wrote `data` to `address`, which is
+        either the slave address or 0 for a general call. `data` is a
+        :class:`memoryview` which is only valid during the call. Returns the
+        next response."""
+        return None
+
+    def read(self, count):
+        """Called after the master read `count` bytes. Returns the next
+        response."""
+        return None
+
+    def idle(self):
+        """Called in each cycle of the poll loop. Returns the next response,
+        eg. if the application changed the emulated data."""
+        return None
+
+
+class RegisterFileHandler(I2CSlaveHandler):
+    """A register based device with `size` bytes of memory.
+
+    The first `addr_width` bytes of a write set the register pointer (most
+    significant byte first), all following bytes are stored starting at the
+    pointer. Reads start at the pointer. The pointer is incremented for each
+    byte and wraps around at `size`.
+
+    The response is always pre-armed with the `response_size` bytes at the
+    register pointer, so the master reads the current data without waiting
+    for the poll loop.
+    """
+
+    def __init__(self, size=256, addr_width=1, data=None,
+            response_size=RESPONSE_SIZE):
+        self.size = size
+        self.addr_width = addr_width
+        self.response_size = min(response_size, size)
+        self.memory = bytearray(size)
+        if data is not None:
+            self.memory[:len(data)] = data
+        #: The register pointer.
+        self.pointer = 0
+        self._lock = threading.Lock()
+        self._changed = False
+
+    def load(self, offset, length):
+        """Return `length` bytes of the memory starting at `offset`."""
+        with self._lock:
+            return bytes(self._wrapped(offset, length))
+
+    def store(self, offset, data):
+        """Change the memory starting at `offset`. Can be called from any
+        thread; the response is updated by the poll loop."""
+        with self._lock:
+            for i, b in enumerate(data):
+                self.memory[(offset + i) % self.size] = b
+            self._changed = True
+
+    def _wrapped(self, offset, length):
+        end = offset + length
+        if end <= self.size:
+            return self.memory[offset:end]
+        return self.memory[offset:] + self.memory[:end - self.size]
+
+    def _response(self):
+        self._changed = False
+        return self._wrapped(self.pointer, self.response_size)
+
+    def response(self):
+        with self._lock:
+            return self._response()
+
+    def write(self, address, data):
+        with self._lock:
+            if len(data) >= self.addr_width:
+                self.pointer = int.from_bytes(data[:self.addr_width],
+                        'big') % self.size
+                data = data[self.addr_width:]
+            for b in data:
+                self.memory[self.pointer] = b
+                self.pointer = (self.pointer + 1) % self.size
+            return self._response()
+
+    def read(self, count):
+        with self._lock:
+            self.pointer = (self.pointer + count) % self.size
+            return self._response()
+
+    def idle(self):
+        with self._lock:
+            if self._changed:
+                return self._response()
+        return None
+
+
+class I2CSlaveServer(object):
+    """Emulate the I2C device `handler`, an :class:`I2CSlaveHandler`, at
+    `slave_address` with the :class:`Aardvark` object `dev`.
+
+    :meth:`start` enables the slave mode and starts a thread which polls
+    the adapter in intervals of `poll_interval` milliseconds. The adapter
+    must not be used by other threads while the server is running.
+    `buffer_size` is passed to :meth:`Aardvark.enable_i2c_slave`.
+    """
+
+    def __init__(self, dev, slave_address, handler, buffer_size=None,
+            poll_interval=50):
+        self.dev = dev
+        self.slave_address = slave_address
+        self.handler = handler
+        self.buffer_size = buffer_size
+        self.poll_interval = poll_interval
+
+        #: Number of writes received from the master.
+        self.writes = 0
+        #: Number of reads served to the master.
+        self.reads = 0
+        #: The exception which stopped the poll loop, if any.
+        self.error = None
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.stop()
+        return False
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Enable the slave mode and start the poll loop."""
+        if self._thread is not None:
+            raise RuntimeError('server already started')
+        self._respond(self.handler.response())
+        self.dev.enable_i2c_slave(self.slave_address, self.buffer_size)
+        self._stop.clear()
+        self.error = None
+        self._thread = threading.Thread(target=self._run,
+                name='i2c-slave-0x%02x' % self.slave_address)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the poll loop and disable the slave mode. Raises the
+        exception which stopped the loop, if any."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.dev.disable_i2c_slave()
+        if self.error is not None:
+            raise self.error
+
+    def _respond(self, response):
+        if response is not None:
+            self.dev.i2c_slave_response = response
+
+    def _run(self):
+        dev = self.dev
+        handler = self.handler
+        try:
+            while not self._stop.is_set():
+                events = dev.poll(self.poll_interval)
+                # handle the received data first, the master usually sets
+                # the register pointer before it reads
+                if POLL_I2C_READ in events:
+                    addr, data = dev.i2c_slave_read_view()
+                    self.writes += 1
+                    self._respond(handler.write(addr, data))
+                if POLL_I2C_WRITE in events:
+                    count = dev.i2c_slave_last_transmit_size
+                    self.reads += 1
+                    self._respond(handler.read(count))
+                self._respond(handler.idle())
+        except Exception as e:
+            log.exception('I2C slave server stopped')
+            self.error = e
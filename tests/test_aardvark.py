@@ -52,6 +52,37 @@ def test_find_devices_valid_devices(api):
     assert devs[1]['serial_number'] == '1111-222222'
     assert not devs[1]['in_use']
 
+@patch('pyaardvark.aardvark.api', autospec=True)
+def test_enumerate_devices(api):
+    def f_ext(num, num_ids, devices, ids):
+        devices[0] = 42 | pyaardvark.PORT_NOT_FREE
+        ids[0] = 1234567890
+        devices[1] = 4711
+        ids[1] = 12345
+        return 2
+
+    api.py_aa_find_devices.return_value = 2
+    api.py_aa_find_devices_ext.side_effect = f_ext
+
+    devs = pyaardvark.enumerate_devices()
+    assert devs == [
+        pyaardvark.DeviceInfo(42, 1234567890, True),
+        pyaardvark.DeviceInfo(4711, 12345, False),
+    ]
+    assert devs[0].serial_number == '1234-567890'
+    assert devs[1].serial_number == '0000-012345'
+    assert devs[1]['port'] == 4711
+    assert devs[1].to_dict() == dict(port=4711,
+            serial_number='0000-012345', in_use=False)
+    with pytest.raises(KeyError):
+        devs[0]['unique_id']
+
+@patch('pyaardvark.aardvark.api', autospec=True)
+def test_enumerate_devices_none(api):
+    api.py_aa_find_devices.return_value = 0
+    assert pyaardvark.enumerate_devices() == []
+    assert not api.py_aa_find_devices_ext.called
+
 @patch('pyaardvark.aardvark.api', autospec=True)
 def test_open_port(api):
     api.py_aa_open_ext.return_value = (42, (0,) * 6)
@@ -124,6 +155,34 @@ def test_open_version_check_api(api):
         api.py_aa_open_ext.return_value = (1, (100, 0, 0, 200, 0, 0))
         pyaardvark.open()
 
+def test_status_names():
+    assert pyaardvark.I2C_STATUS_NAMES[I2C_STATUS_SLA_NACK] == \
+            'I2C_STATUS_SLA_NACK'
+    assert pyaardvark.ERROR_NAMES[ERR_COMMUNICATION_ERROR] == \
+            'ERR_COMMUNICATION_ERROR'
+    assert pyaardvark.aardvark.status_string(I2C_STATUS_BUS_LOCKED) == \
+            'I2C_STATUS_BUS_LOCKED'
+    assert pyaardvark.aardvark.status_string(42) == \
+            'I2C_STATUS_UNKNOWN_STATUS'
+
+@pytest.mark.parametrize('code, cls', [
+    (I2C_STATUS_BUS_ERROR, pyaardvark.I2CBusError),
+    (I2C_STATUS_SLA_ACK, pyaardvark.I2CArbitrationLostError),
+    (I2C_STATUS_SLA_NACK, pyaardvark.I2CNackError),
+    (I2C_STATUS_DATA_NACK, pyaardvark.I2CNackError),
+    (I2C_STATUS_ARB_LOST, pyaardvark.I2CArbitrationLostError),
+    (I2C_STATUS_BUS_LOCKED, pyaardvark.I2CBusLockedError),
+    (ERR_COMMUNICATION_ERROR, pyaardvark.CommunicationError),
+    (ERR_I2C_NOT_ENABLED, pyaardvark.I2CError),
+    (ERR_SPI_NOT_ENABLED, pyaardvark.SPIError),
+    (ERR_UNABLE_TO_OPEN, pyaardvark.AardvarkError),
+])
+def test_error_from_code(code, cls):
+    e = pyaardvark.error_from_code(code)
+    assert type(e) is cls
+    assert isinstance(e, IOError)
+    assert e.errno == code
+
 @patch('pyaardvark.aardvark.api', autospec=True)
 class TestAardvark(object):
     @patch('pyaardvark.aardvark.api', autospec=True)
@@ -271,6 +330,75 @@ class TestAardvark(object):
                 call(self.a.handle, 0),
         ])
 
+    def test_cache_config_getter(self, api):
+        api.py_aa_i2c_bitrate.return_value = 100
+        self.a.cache_config = True
+        assert self.a.i2c_bitrate == 100
+        assert self.a.i2c_bitrate == 100
+        api.py_aa_i2c_bitrate.assert_called_once_with(self.a.handle, 0)
+
+    def test_cache_config_setter(self, api):
+        api.py_aa_i2c_pullup.return_value = pyaardvark.I2C_PULLUP_BOTH
+        self.a.cache_config = True
+        self.a.i2c_pullups = True
+        self.a.i2c_pullups = True
+        assert self.a.i2c_pullups == pyaardvark.I2C_PULLUP_BOTH
+        api.py_aa_i2c_pullup.assert_called_once_with(self.a.handle,
+                pyaardvark.I2C_PULLUP_BOTH)
+
+    def test_cache_config_enable_i2c(self, api):
+        api.py_aa_configure.side_effect = [CONFIG_SPI_GPIO, CONFIG_SPI_I2C]
+        self.a.cache_config = True
+        self.a.enable_i2c = True
+        self.a.enable_i2c = True
+        assert self.a.enable_i2c
+        api.py_aa_configure.assert_has_calls([
+                call(self.a.handle, CONFIG_QUERY),
+                call(self.a.handle, CONFIG_SPI_I2C),
+        ])
+        assert api.py_aa_configure.call_count == 2
+
+    def test_cache_config_invalidate(self, api):
+        api.py_aa_spi_bitrate.return_value = 1000
+        self.a.cache_config = True
+        self.a.spi_bitrate = 1000
+        self.a.invalidate_config()
+        self.a.spi_bitrate = 1000
+        assert api.py_aa_spi_bitrate.call_count == 2
+
+    def test_cache_config_error(self, api):
+        api.py_aa_target_power.return_value = -1
+        self.a.cache_config = True
+        with pytest.raises(IOError):
+            self.a.target_power = True
+        api.py_aa_target_power.return_value = TARGET_POWER_BOTH
+        self.a.target_power = True
+        assert api.py_aa_target_power.call_count == 2
+
+    def test_cache_config_disabled(self, api):
+        api.py_aa_i2c_bus_timeout.return_value = 200
+        assert not self.a.cache_config
+        self.a.i2c_bus_timeout = 200
+        self.a.i2c_bus_timeout = 200
+        assert api.py_aa_i2c_bus_timeout.call_count == 2
+
+    def test_sync_config(self, api):
+        api.py_aa_configure.return_value = CONFIG_SPI_I2C
+        api.py_aa_i2c_bitrate.return_value = 400
+        api.py_aa_spi_bitrate.return_value = 1000
+        api.py_aa_i2c_pullup.return_value = I2C_PULLUP_NONE
+        api.py_aa_target_power.return_value = TARGET_POWER_BOTH
+        api.py_aa_i2c_bus_timeout.return_value = 200
+        self.a.cache_config = True
+        config = self.a.sync_config()
+        assert config == dict(enable_i2c=True, enable_spi=True,
+                i2c_bitrate=400, spi_bitrate=1000,
+                i2c_pullups=I2C_PULLUP_NONE, target_power=TARGET_POWER_BOTH,
+                i2c_bus_timeout=200)
+        assert self.a.sync_config() == config
+        assert api.py_aa_i2c_bitrate.call_count == 2
+        assert api.py_aa_configure.call_count == 2
+
     def test_i2c_master_write(self, api):
         addr = 0x50
         data = b'\x01\x02\x03'
@@ -291,6 +419,19 @@ class TestAardvark(object):
             api.py_aa_i2c_write_ext.return_value = (I2C_STATUS_BUS_ERROR, 0)
             self.a.i2c_master_write(0, b'')
 
+    def test_i2c_master_write_nack(self, api):
+        api.py_aa_i2c_write_ext.return_value = (I2C_STATUS_SLA_NACK, 0)
+        with pytest.raises(pyaardvark.I2CNackError) as e:
+            self.a.i2c_master_write(0x50, b'')
+        assert e.value.errno == I2C_STATUS_SLA_NACK
+        assert e.value.strerror == 'I2C_STATUS_SLA_NACK'
+
+    def test_i2c_master_write_not_enabled(self, api):
+        api.py_aa_i2c_write_ext.return_value = (ERR_I2C_NOT_ENABLED, 0)
+        with pytest.raises(pyaardvark.I2CError) as e:
+            self.a.i2c_master_write(0x50, b'')
+        assert e.value.errno == ERR_I2C_NOT_ENABLED
+
     def test_i2c_master_read(self, api):
         def i2c_master_read(_handle, _addr, _flags, length, data):
             assert data == array.array('B', (0,) * length)
@@ -306,6 +447,44 @@ class TestAardvark(object):
                 self.a.handle, addr, flags, 3, ANY)
         assert data == b'\x00\x01\x02'
 
+    def test_i2c_master_write_buffer(self, api):
+        data = bytearray(b'\x01\x02\x03')
+        api.py_aa_i2c_write_ext.return_value = (I2C_STATUS_OK, 3)
+        self.a.i2c_master_write(0x50, data)
+        assert api.py_aa_i2c_write_ext.call_args[0][4] is data
+
+    def test_i2c_master_read_into(self, api):
+        def i2c_master_read(_handle, _addr, _flags, length, data):
+            for i in range(length):
+                data[i] = i + 1
+            return (I2C_STATUS_OK, length - 1)
+
+        api.py_aa_i2c_read_ext.side_effect = i2c_master_read
+        buf = bytearray(4)
+        assert self.a.i2c_master_read_into(0x50, buf) == 3
+        api.py_aa_i2c_read_ext.assert_called_once_with(
+                self.a.handle, 0x50, pyaardvark.I2C_NO_FLAGS, 4, buf)
+        assert buf == b'\x01\x02\x03\x04'
+
+    def test_i2c_master_read_into_not_writable(self, api):
+        for buf in (b'\0' * 4, [0] * 4, array.array('H', [0] * 4)):
+            with pytest.raises(TypeError):
+                self.a.i2c_master_read_into(0x50, buf)
+        assert not api.py_aa_i2c_read_ext.called
+
+    def test_i2c_master_write_items(self, api):
+        api.py_aa_i2c_write_ext.return_value = (I2C_STATUS_OK, 3)
+        self.a.i2c_master_write(0x50, array.array('H', [0x20, 1, 2]))
+        assert api.py_aa_i2c_write_ext.call_args[0][3:] == (3,
+                array.array('B', [0x20, 1, 2]))
+        with pytest.raises(OverflowError):
+            self.a.i2c_master_write(0x50, array.array('H', [0x100]))
+
+    def test_i2c_master_read_into_error(self, api):
+        with pytest.raises(IOError):
+            api.py_aa_i2c_read_ext.return_value = (I2C_STATUS_BUS_ERROR, 0)
+            self.a.i2c_master_read_into(0, bytearray(1))
+
     def test_i2c_master_read_default_flags(self, api):
         api.py_aa_i2c_read_ext.return_value = (I2C_STATUS_OK, 1)
         _ = self.a.i2c_master_read(0, 0)
@@ -352,6 +531,55 @@ class TestAardvark(object):
             api.py_aa_i2c_read_ext.return_value = (I2C_STATUS_OK, 1)
             self.a.i2c_master_write_read(0, b'', 0)
 
+    def test_i2c_master_write_read_ext(self, api):
+        def write_read(_handle, _addr, _flags, nw, data_out, nr, data_in):
+            data_in[:nr] = bytearray(range(nr))
+            return (I2C_STATUS_OK, nw, nr)
+
+        api.py_aa_i2c_write_read.side_effect = write_read
+        result = self.a.i2c_master_write_read_ext(0x50, b'\x00\x01', 3)
+        api.py_aa_i2c_write_read.assert_called_once_with(self.a.handle, 0x50,
+                pyaardvark.I2C_NO_FLAGS, 2, ANY, 3, ANY)
+        assert not api.py_aa_i2c_write_ext.called
+        assert not api.py_aa_i2c_read_ext.called
+        assert result.ok
+        assert result.phase is None
+        assert result.written == 2
+        assert result.data == b'\x00\x01\x02'
+
+    def test_i2c_master_write_read_ext_failed_phase(self, api):
+        api.py_aa_i2c_write_read.return_value = (I2C_STATUS_SLA_NACK, 0, 0)
+        result = self.a.i2c_master_write_read_ext(0x50, b'\x00', 1)
+        assert result.phase == 'write'
+        assert result.status == I2C_STATUS_SLA_NACK
+        assert result.read_status is None
+        with pytest.raises(pyaardvark.I2CNackError):
+            result.raise_for_status()
+
+        api.py_aa_i2c_write_read.return_value = (
+                I2C_STATUS_BUS_ERROR << 8 | I2C_STATUS_OK, 1, 0)
+        result = self.a.i2c_master_write_read_ext(0x50, b'\x00', 1)
+        assert result.phase == 'read'
+        assert result.status == I2C_STATUS_BUS_ERROR
+
+    def test_i2c_master_write_read_ext_error(self, api):
+        api.py_aa_i2c_write_read.return_value = (ERR_COMMUNICATION_ERROR, 0, 0)
+        with pytest.raises(pyaardvark.CommunicationError):
+            self.a.i2c_master_write_read_ext(0x50, b'\x00', 1)
+
+    def test_i2c_master_write_read_ext_fallback(self, api):
+        del api.py_aa_i2c_write_read
+        api.py_aa_i2c_write_ext.return_value = (I2C_STATUS_OK, 1)
+        api.py_aa_i2c_read_ext.return_value = (I2C_STATUS_DATA_NACK, 0)
+        buf = bytearray(2)
+        result = self.a.i2c_master_write_read_ext(0x50, b'\x00', buf)
+        api.py_aa_i2c_write_ext.assert_called_once_with(self.a.handle, 0x50,
+                pyaardvark.I2C_NO_STOP, 1, ANY)
+        api.py_aa_i2c_read_ext.assert_called_once_with(self.a.handle, 0x50,
+                pyaardvark.I2C_NO_FLAGS, 2, buf)
+        assert result.phase == 'read'
+        assert result.buffer is buf
+
     def test_i2c_stop(self, api):
         api.py_aa_i2c_free_bus.return_value = 0
         self.a.i2c_stop()
@@ -404,6 +632,41 @@ class TestAardvark(object):
                 self.a.handle, self.a.BUFFER_SIZE, ANY)
         assert ret == (addr, b'\x00\x01\x02')
 
+    def test_enable_i2c_slave_buffer_size(self, api):
+        api.py_aa_i2c_slave_enable.return_value = 0
+        api.py_aa_i2c_slave_read_ext.return_value = (I2C_STATUS_OK, 0x50, 0)
+        self.a.enable_i2c_slave(0x50, buffer_size=16)
+        api.py_aa_i2c_slave_enable.assert_called_once_with(
+                self.a.handle, 0x50, 16, 16)
+        self.a.i2c_slave_read()
+        api.py_aa_i2c_slave_read_ext.assert_called_once_with(
+                self.a.handle, 16, ANY)
+
+    def test_i2c_slave_read_reuses_buffer(self, api):
+        bufs = list()
+        def i2c_slave_read(_handle, length, data):
+            bufs.append(data)
+            data[0] = len(bufs)
+            return (I2C_STATUS_OK, 0x50, 1)
+
+        api.py_aa_i2c_slave_read_ext.side_effect = i2c_slave_read
+        assert self.a.i2c_slave_read() == (0x50, b'\x01')
+        addr, view = self.a.i2c_slave_read_view()
+        assert (addr, view) == (0x50, b'\x02')
+        assert bufs[0] is bufs[1]
+
+    def test_i2c_slave_read_into(self, api):
+        def i2c_slave_read(_handle, length, data):
+            data[0:2] = b'\x01\x02'
+            return (I2C_STATUS_OK, 0x80, 2)
+
+        api.py_aa_i2c_slave_read_ext.side_effect = i2c_slave_read
+        buf = bytearray(4)
+        assert self.a.i2c_slave_read_into(buf) == (0x00, 2)
+        api.py_aa_i2c_slave_read_ext.assert_called_once_with(
+                self.a.handle, 4, buf)
+        assert buf == b'\x01\x02\x00\x00'
+
     def test_i2c_slave_read_error(self, api):
         with pytest.raises(IOError):
             api.py_aa_i2c_slave_read_ext.return_value = (-1, 0, I2C_STATUS_BUS_ERROR)
@@ -501,7 +764,88 @@ class TestAardvark(object):
         api.py_aa_spi_write.assert_called_once_with(self.a.handle, len(data),
                 array.array('B', data), len(data), ANY)
 
+    def test_spi_transfer_into(self, api):
+        def spi_write(_handle, len_tx, tx, len_rx, rx):
+            for i in range(len_rx):
+                rx[i] = tx[i] + 1
+            return len_tx
+        api.py_aa_spi_write.side_effect = spi_write
+        tx = bytearray(b'\x01\x02\x03')
+        rx = memoryview(bytearray(2))
+        assert self.a.spi_transfer_into(tx, rx) == 3
+        assert rx == b'\x02\x03'
+        api.py_aa_spi_write.assert_called_once_with(self.a.handle, 3, tx,
+                2, rx)
+
+    def test_spi_transfer_into_not_writable(self, api):
+        with pytest.raises(TypeError):
+            self.a.spi_transfer_into(b'\x01\x02', b'\0' * 2)
+        assert not api.py_aa_spi_write.called
+
     def test_spi_spi_write_error(self, api):
         with pytest.raises(IOError):
             api.py_aa_spi_write.return_value = -1
             self.a.spi_write(b'')
+
+@patch('pyaardvark.aardvark.api', autospec=True)
+def test_gpio(api):
+    api.py_aa_open_ext.return_value = (42, (0,) * 6)
+    api.py_aa_gpio_direction.return_value = 0
+    api.py_aa_gpio_pullup.return_value = 0
+    api.py_aa_gpio_set.return_value = 0
+    api.py_aa_gpio_get.return_value = GPIO_MISO
+    a = pyaardvark.open()
+    assert a.gpio_direction is None
+    a.gpio_direction = GPIO_SS | GPIO_MOSI
+    api.py_aa_gpio_direction.assert_called_once_with(42, GPIO_SS | GPIO_MOSI)
+    assert a.gpio_direction == GPIO_SS | GPIO_MOSI
+    a.gpio_pullups = GPIO_MISO
+    api.py_aa_gpio_pullup.assert_called_once_with(42, GPIO_MISO)
+    a.gpio_set(GPIO_SS)
+    a.gpio_set(GPIO_MOSI, mask=GPIO_MOSI)
+    assert api.py_aa_gpio_set.call_args_list == [call(42, GPIO_SS),
+            call(42, GPIO_SS | GPIO_MOSI)]
+    assert a.gpio_get() == GPIO_MISO
+
+@patch('pyaardvark.aardvark.api', autospec=True)
+def test_gpio_wait_change(api):
+    api.py_aa_open_ext.return_value = (42, (0,) * 6)
+    api.py_aa_gpio_get.return_value = 0
+    api.py_aa_gpio_change.side_effect = [0, GPIO_MISO]
+    a = pyaardvark.open()
+    assert a.gpio_wait_change() is None
+    api.py_aa_gpio_get.assert_called_once_with(42)
+    api.py_aa_gpio_change.assert_called_with(42, -1)
+    assert a.gpio_wait_change(10) == GPIO_MISO
+    api.py_aa_gpio_change.assert_called_with(42, 10)
+    assert api.py_aa_gpio_get.call_count == 1
+
+@patch('pyaardvark.aardvark.api', autospec=True)
+def test_gpio_error(api):
+    api.py_aa_open_ext.return_value = (42, (0,) * 6)
+    api.py_aa_gpio_get.return_value = ERR_GPIO_NOT_AVAILABLE
+    a = pyaardvark.open()
+    with pytest.raises(pyaardvark.AardvarkError) as e:
+        a.gpio_get()
+    assert e.value.errno == ERR_GPIO_NOT_AVAILABLE
+    assert e.value.strerror == 'ERR_GPIO_NOT_AVAILABLE'
+    assert not api.py_aa_status_string.called
+
+@patch('pyaardvark.aardvark.api', autospec=True)
+def test_spi_slave_frames(api):
+    api.py_aa_open_ext.return_value = (42, (0,) * 6)
+    frames = [b'\x01\x02', b'\x03']
+    def read(handle, num_bytes, data_in):
+        if not frames:
+            return ERR_SPI_SLAVE_TIMEOUT
+        frame = frames.pop(0)
+        data_in[:len(frame)] = frame
+        return len(frame)
+    api.py_aa_spi_slave_read.side_effect = read
+    api.py_aa_async_poll.return_value = POLL_NO_DATA
+    a = pyaardvark.open()
+    received = [bytes(f) for f in a.spi_slave_frames(timeout=10,
+            buffer_size=16)]
+    assert received == [b'\x01\x02', b'\x03']
+    api.py_aa_spi_slave_read.assert_called_with(42, 16, ANY)
+    api.py_aa_async_poll.assert_called_once_with(42, 10)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+import asyncio
+import threading
+
+import pyaardvark
+import pyaardvark.aio
+from pyaardvark import sim
+from pyaardvark.constants import *
+import pytest
+
+
+@pytest.fixture
+def adapter():
+    sim.reset()
+    adapter = sim.add_adapter(serial_number='1234-567890')
+    adapter.attach_i2c(0x20, sim.I2CRegisterFile(data=range(256)))
+    yield adapter
+    sim.reset()
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_open_and_transfers(adapter):
+    async def main():
+        async with await pyaardvark.aio.open(serial_number='1234-567890',
+                backend='sim') as a:
+            await a.set('i2c_bitrate', 400)
+            assert await a.get('i2c_bitrate') == 400
+            await a.i2c_master_write(0x20, b'\x00\x42')
+            assert await a.i2c_master_write_read(0x20, b'\x00', 2) == \
+                    b'\x42\x01'
+            assert await a.i2c_master_read(0x20, 1) == b'\x02'
+            result = await a.i2c_batch([('write_read', 0x20, b'\x05', 1)])
+            assert result[0] == b'\x05'
+            return a.device
+    dev = run(main())
+    assert dev.handle is None
+
+def test_worker_thread(adapter):
+    async def main():
+        a = await pyaardvark.aio.open(backend='sim')
+        names = set()
+        for _ in range(3):
+            names.add(await a.run(lambda: threading.current_thread().name))
+        await a.close()
+        return names
+    names = run(main())
+    assert len(names) == 1
+    assert threading.current_thread().name not in names
+
+def test_errors(adapter):
+    async def main():
+        async with await pyaardvark.aio.open(backend='sim') as a:
+            with pytest.raises(pyaardvark.I2CNackError):
+                await a.i2c_master_read(0x21, 1)
+    run(main())
+
+def test_poll(adapter):
+    async def main():
+        async with await pyaardvark.aio.open(backend='sim') as a:
+            await a.run(a.device.enable_i2c_slave, 0x40)
+            assert await a.poll(10) == []
+            poll = asyncio.ensure_future(a.poll())
+            await asyncio.sleep(0.01)
+            assert not poll.done()
+            adapter.i2c_master_transmit(0x40, b'\x01')
+            assert await poll == [POLL_I2C_READ]
+            assert await a.i2c_slave_read() == (0x40, b'\x01')
+    run(main())
+
+def test_poll_cancel(adapter):
+    async def main():
+        async with await pyaardvark.aio.open(backend='sim') as a:
+            a.poll_interval = 10
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(a.poll(), 0.05)
+            # the worker thread is available again
+            assert await a.get('i2c_bitrate', timeout=1) == 100
+    run(main())
+
+def test_gpio_wait_change(adapter):
+    async def main():
+        async with await pyaardvark.aio.open(backend='sim') as a:
+            a.poll_interval = 10
+            await a.set('enable_spi', False)
+            await a.gpio_set(GPIO_SS)
+            assert await a.gpio_get() == 0
+            assert await a.gpio_wait_change(10) is None
+            change = asyncio.ensure_future(a.gpio_wait_change())
+            await asyncio.sleep(0.03)
+            assert not change.done()
+            adapter.drive_gpio(GPIO_MOSI)
+            assert await change == GPIO_MOSI
+    run(main())
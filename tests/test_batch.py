@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+import pyaardvark
+from pyaardvark import sim
+from pyaardvark.constants import *
+import pytest
+
+
+@pytest.fixture
+def adapter():
+    sim.reset()
+    adapter = sim.add_adapter()
+    adapter.attach_i2c(0x20, sim.I2CRegisterFile(data=range(256)))
+    yield adapter
+    sim.reset()
+
+@pytest.fixture
+def a(adapter):
+    with pyaardvark.open(backend='sim') as a:
+        yield a
+
+def test_batch(adapter, a):
+    batch = pyaardvark.I2CBatch()
+    assert batch.write(0x20, b'\x10\xaa\xbb') == 0
+    assert batch.write_read(0x20, b'\x10', 3) == 1
+    assert batch.read(0x20, 2) == 2
+    result = a.i2c_batch(batch)
+    assert result.ok
+    assert result.statuses == [I2C_STATUS_OK] * 3
+    assert result[0] is None
+    assert result[1] == b'\xaa\xbb\x12'
+    assert result[2] == b'\x13\x14'
+
+def test_batch_reuse(adapter, a):
+    batch = pyaardvark.I2CBatch()
+    batch.write_read(0x20, b'\x00', 1)
+    assert a.i2c_batch(batch)[0] == b'\x00'
+    a.i2c_master_write(0x20, b'\x00\x42')
+    assert a.i2c_batch(batch)[0] == b'\x42'
+
+def test_batch_tuples(adapter, a):
+    result = a.i2c_batch([
+        ('write', 0x20, b'\x00\x01'),
+        ('write_read', 0x20, b'\x00', 1),
+        ('read', 0x20, 1, I2C_NO_FLAGS),
+    ])
+    assert result.data == [None, b'\x01', b'\x01']
+
+def test_batch_stop_on_error(adapter, a):
+    result = a.i2c_batch([
+        ('write', 0x20, b'\x00'),
+        ('write_read', 0x21, b'\x00', 1),
+        ('read', 0x20, 1),
+    ])
+    assert not result.ok
+    assert result.statuses == [I2C_STATUS_OK, I2C_STATUS_SLA_NACK, None]
+    assert result.errors == [(1, I2C_STATUS_SLA_NACK)]
+
+def test_batch_keep_going(adapter, a):
+    result = a.i2c_batch([
+        ('write', 0x21, b'\x00'),
+        ('write_read', 0x20, b'\x05', 1),
+    ], stop_on_error=False)
+    assert result.statuses == [I2C_STATUS_SLA_NACK, I2C_STATUS_OK]
+    assert result[1] == b'\x05'
+
+def test_batch_raise_for_status(adapter, a):
+    result = a.i2c_batch([('read', 0x21, 1)])
+    with pytest.raises(pyaardvark.I2CNackError):
+        result.raise_for_status()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+import io
+
+import pyaardvark
+from pyaardvark import sim
+from pyaardvark.eeprom import I2CEeprom
+import pytest
+
+
+@pytest.fixture
+def adapter():
+    sim.reset()
+    adapter = sim.add_adapter()
+    yield adapter
+    sim.reset()
+
+@pytest.fixture
+def a(adapter):
+    a = pyaardvark.open(backend='sim')
+    yield a
+    a.close()
+
+def test_write_read(adapter, a):
+    target = sim.I2CEeprom(size=4096, page_size=32, addr_width=2)
+    adapter.attach_i2c(0x50, target)
+    eeprom = I2CEeprom(a, 0x50, size=4096, page_size=32, addr_width=2)
+
+    data = bytes(range(256)) * 2
+    eeprom.write(0x10, data)
+    assert target.memory[0x10:0x210] == data
+    assert target.memory[:0x10] == b'\xff' * 0x10
+    assert eeprom.read(0x10, len(data)) == data
+
+def test_write_splits_pages(adapter, a):
+    target = sim.I2CEeprom(size=256, page_size=8)
+    adapter.attach_i2c(0x50, target)
+    eeprom = I2CEeprom(a, 0x50, size=256, page_size=8)
+
+    writes = []
+    orig = a.i2c_master_write
+    def i2c_master_write(addr, data, *args):
+        if len(data):
+            writes.append(bytes(data))
+        return orig(addr, data, *args)
+    a.i2c_master_write = i2c_master_write
+
+    eeprom.write(6, bytes(range(12)))
+    assert writes == [b'\x06\x00\x01', b'\x08' + bytes(range(2, 10)),
+            b'\x10\x0a\x0b']
+    assert target.memory[6:18] == bytes(range(12))
+
+def test_ack_polling(adapter, a):
+    target = sim.I2CEeprom(size=256, page_size=8, write_cycle_time=0.005)
+    adapter.attach_i2c(0x50, target)
+    eeprom = I2CEeprom(a, 0x50)
+    adapter.reset_timing()
+    eeprom.write(0, b'\x01' * 16)
+    # two write cycles plus some polling overhead, no fixed sleeps
+    assert 0.010 <= adapter.elapsed() < 0.020
+    assert eeprom.read(0, 16) == b'\x01' * 16
+
+def test_write_timeout(adapter, a):
+    eeprom = I2CEeprom(a, 0x50, write_timeout=0)
+    with pytest.raises(pyaardvark.I2CNackError):
+        eeprom.wait_ready()
+
+def test_block_select(adapter, a):
+    low = sim.I2CEeprom(size=256, page_size=16)
+    high = sim.I2CEeprom(size=256, page_size=16)
+    adapter.attach_i2c(0x50, low)
+    adapter.attach_i2c(0x51, high)
+    eeprom = I2CEeprom(a, 0x50, size=512, page_size=16)
+
+    eeprom.write(0xf8, bytes(range(16)))
+    assert low.memory[0xf8:] == bytes(range(8))
+    assert high.memory[:8] == bytes(range(8, 16))
+    assert eeprom.read(0xf8, 16) == bytes(range(16))
+
+def test_read_chunks(adapter, a):
+    adapter.attach_i2c(0x50, sim.I2CEeprom(size=65536, page_size=128,
+            addr_width=2, data=bytes(range(256)) * 256))
+    eeprom = I2CEeprom(a, 0x50, size=65536, page_size=128, addr_width=2)
+    a.BUFFER_SIZE = 1000
+    reads = []
+    orig = a.i2c_master_write_read_ext
+    def write_read_ext(addr, data, buf):
+        reads.append(len(buf))
+        return orig(addr, data, buf)
+    a.i2c_master_write_read_ext = write_read_ext
+
+    buf = bytearray(2500)
+    assert eeprom.read_into(buf, 0x100) == 2500
+    assert buf == (bytes(range(256)) * 10)[:2500]
+    assert reads == [1000, 1000, 500]
+
+def test_read_to_file(adapter, a):
+    data = bytes(range(256)) * 4
+    adapter.attach_i2c(0x50, sim.I2CEeprom(size=1024, page_size=16,
+            addr_width=2, data=data))
+    eeprom = I2CEeprom(a, 0x50, size=1024, page_size=16, addr_width=2)
+    f = io.BytesIO()
+    assert eeprom.read_to_file(f, chunk_size=300) == 1024
+    assert f.getvalue() == data
+
+def test_range_check(adapter, a):
+    eeprom = I2CEeprom(a, 0x50, size=256)
+    with pytest.raises(ValueError):
+        eeprom.write(250, b'\x00' * 8)
+    with pytest.raises(ValueError):
+        eeprom.read(0, 257)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+import io
+
+import pyaardvark
+from pyaardvark import sim
+from pyaardvark.flash import SPIFlash
+import pytest
+
+
+@pytest.fixture
+def adapter():
+    sim.reset()
+    adapter = sim.add_adapter()
+    yield adapter
+    sim.reset()
+
+@pytest.fixture
+def a(adapter):
+    a = pyaardvark.open(backend='sim')
+    yield a
+    a.close()
+
+def _target(**kwargs):
+    kwargs.setdefault('page_program_time', 0)
+    kwargs.setdefault('sector_erase_time', 0)
+    kwargs.setdefault('block_erase_time', 0)
+    kwargs.setdefault('chip_erase_time', 0)
+    return sim.SPIFlash(**kwargs)
+
+def test_probe_sfdp(adapter, a):
+    adapter.attach_spi(_target(size=2 * 1024 * 1024, page_size=128))
+    flash = SPIFlash(a)
+    assert flash.jedec_id == b'\xef\x40\x14'
+    assert flash.size == 2 * 1024 * 1024
+    assert flash.page_size == 128
+    assert flash.addr_width == 3
+    assert flash.erase_types == [(4096, 0x20), (32768, 0x52), (65536, 0xd8)]
+
+def test_probe_jedec_id(adapter, a):
+    adapter.attach_spi(_target(size=1 << 20, sfdp=False))
+    flash = SPIFlash(a)
+    assert flash.size == 1 << 20
+    assert flash.page_size == 256
+
+def test_probe_no_flash(adapter, a):
+    with pytest.raises(pyaardvark.AardvarkError):
+        SPIFlash(a)
+
+def test_erase_plan(adapter, a):
+    adapter.attach_spi(_target(size=1 << 20))
+    flash = SPIFlash(a)
+    assert flash.erase_plan(0, flash.size) == [(0, flash.size)]
+    assert flash.erase_plan(0x7000, 0x1a000) == [
+        (0x7000, 0x1000),
+        (0x8000, 0x8000),
+        (0x10000, 0x10000),
+        (0x20000, 0x1000),
+    ]
+    with pytest.raises(ValueError):
+        flash.erase_plan(0x800, 0x1000)
+
+def test_program_read(adapter, a):
+    target = adapter.attach_spi(_target(size=1 << 20))
+    flash = SPIFlash(a)
+    data = bytes(range(256)) * 4
+    flash.program(0x80, data)
+    assert target.memory[0x80:0x480] == data
+    assert flash.read(0x80, len(data)) == data
+
+    flash.program(0xf80, data[:0x100])
+    flash.erase(0, 0x1000)
+    assert target.memory[:0x1000] == b'\xff' * 0x1000
+    assert target.memory[0x1000:0x1080] == data[0x80:0x100]
+
+def test_program_waits_for_ready(adapter, a):
+    target = adapter.attach_spi(_target(size=1 << 20,
+            page_program_time=0.003))
+    flash = SPIFlash(a)
+    flash.program(0, b'\x00' * 512)
+    assert target.memory[:512] == b'\x00' * 512
+
+def test_read_chunks(adapter, a):
+    data = bytes(range(256)) * 1024
+    adapter.attach_spi(_target(size=1 << 20, data=data))
+    flash = SPIFlash(a)
+    a.BUFFER_SIZE = 1000
+    assert flash.read(0x10, 0x3000) == data[0x10:0x3010]
+    f = io.BytesIO()
+    assert flash.read_to_file(f, 0, 0x4000, chunk_size=0x1800) == 0x4000
+    assert f.getvalue() == data[:0x4000]
+
+def test_4byte_addressing(adapter, a):
+    size = 32 * 1024 * 1024
+    target = adapter.attach_spi(_target(size=size, jedec_id=b'\xef\x40\x19'))
+    flash = SPIFlash(a)
+    assert flash.size == size
+    assert flash.addr_width == 4
+    flash.program(size - 0x100, b'\x12\x34')
+    assert target.memory[size - 0x100:size - 0xfe] == b'\x12\x34'
+    assert flash.read(size - 0x100, 2) == b'\x12\x34'
+    flash.erase(size - 0x1000, 0x1000)
+    assert target.memory[size - 0x100] == 0xff
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+import mmap
+
+import pyaardvark
+from pyaardvark import sim
+from pyaardvark.aardvark import _to_buffer
+from pyaardvark.eeprom import I2CEeprom
+from pyaardvark.flash import SPIFlash
+from pyaardvark.image import map_image
+from pyaardvark.program import BlockIndex, program
+import pytest
+
+
+@pytest.fixture
+def adapter():
+    sim.reset()
+    adapter = sim.add_adapter()
+    yield adapter
+    sim.reset()
+
+@pytest.fixture
+def a(adapter):
+    a = pyaardvark.open(backend='sim')
+    yield a
+    a.close()
+
+def test_map_image_copy_on_write(tmpdir):
+    path = tmpdir.join('image.bin')
+    path.write_binary(b'\x01\x02\x03')
+    with map_image(str(path)) as view:
+        assert view == b'\x01\x02\x03'
+        assert not view.readonly
+        # no copy is needed to pass the view to the binding
+        assert _to_buffer(view).obj is view.obj
+        view[0] = 0xff
+    assert path.read_binary() == b'\x01\x02\x03'
+    # the view is released and the mapping closed
+    with pytest.raises(ValueError):
+        view[0]
+
+def test_map_image_writable(tmpdir):
+    path = tmpdir.join('dump.bin')
+    with map_image(path, writable=True, size=4) as view:
+        view[:] = b'\x01\x02\x03\x04'
+    assert path.read_binary() == b'\x01\x02\x03\x04'
+
+def test_map_image_empty(tmpdir):
+    path = tmpdir.join('empty.bin')
+    path.write_binary(b'')
+    with map_image(str(path)) as view:
+        assert len(view) == 0
+
+def test_map_image_buffer():
+    m = mmap.mmap(-1, 16)
+    with map_image(m) as view:
+        view[0] = 0x42
+    assert m[0] == 0x42
+
+def test_eeprom_files(tmpdir, adapter, a):
+    target = sim.I2CEeprom(size=1024, page_size=32, addr_width=2)
+    adapter.attach_i2c(0x50, target)
+    eeprom = I2CEeprom(a, 0x50, size=1024, page_size=32, addr_width=2)
+
+    image = tmpdir.join('image.bin')
+    image.write_binary(bytes(range(256)) * 2)
+    steps = []
+    eeprom.write(0, str(image), progress=lambda *p: steps.append(p))
+    assert target.memory[:512] == bytes(range(256)) * 2
+    assert steps[0] == (32, 512)
+    assert steps[-1] == (512, 512)
+    assert len(steps) == 16
+
+    dump = tmpdir.join('dump.bin')
+    steps = []
+    eeprom.read_to_file(str(dump), 0, 512,
+            progress=lambda *p: steps.append(p))
+    assert dump.read_binary() == bytes(range(256)) * 2
+    assert steps[-1] == (512, 512)
+
+def test_flash_files(tmpdir, adapter, a):
+    target = adapter.attach_spi(sim.SPIFlash(size=1 << 16,
+            page_program_time=0, sector_erase_time=0))
+    flash = SPIFlash(a)
+
+    image = tmpdir.join('image.bin')
+    image.write_binary(b'\x5a' * 0x2000)
+    flash.program(0, str(image))
+    assert target.memory[:0x2000] == b'\x5a' * 0x2000
+
+    dump = tmpdir.join('dump.bin')
+    flash.read_to_file(str(dump), 0, 0x2000)
+    assert dump.read_binary() == b'\x5a' * 0x2000
+
+    image.write_binary(b'\x5a' * 0x1000 + b'\xa5' * 0x1000)
+    steps = []
+    result = program(flash, str(image),
+            BlockIndex.from_image(str(image), 0x1000),
+            progress=lambda *p: steps.append(p))
+    assert result.changed == [0x1000]
+    assert steps == [(0x1000, 0x2000), (0x2000, 0x2000)]
+
+def test_read_to_file_error(tmpdir, adapter, a):
+    eeprom = I2CEeprom(a, 0x50, size=256, page_size=16)
+    dump = tmpdir.join('dump.bin')
+    # no target, the error of the transfer is raised and not hidden by
+    # closing the mapping
+    with pytest.raises(pyaardvark.I2CNackError):
+        eeprom.read_to_file(str(dump), 0, 16)
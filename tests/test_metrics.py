@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+import pyaardvark
+from pyaardvark import sim
+from pyaardvark.constants import *
+from pyaardvark.metrics import Metrics
+import pytest
+
+
+@pytest.fixture
+def adapter():
+    sim.reset()
+    adapter = sim.add_adapter()
+    adapter.attach_i2c(0x50, sim.I2CRegisterFile(data=range(256)))
+    yield adapter
+    sim.reset()
+
+@pytest.fixture
+def a(adapter):
+    a = pyaardvark.open(backend='sim')
+    yield a
+    a.close()
+
+def test_disabled_by_default(a):
+    assert a.metrics is None
+    assert 'i2c_master_write' not in vars(a)
+
+def test_counters(a):
+    metrics = a.enable_metrics()
+    assert a.enable_metrics() is metrics
+    a.i2c_master_write(0x50, b'\x00\x01\x02')
+    assert a.i2c_master_write_read(0x50, b'\x10', 4) == b'\x10\x11\x12\x13'
+    a.spi_write(b'\x00' * 8)
+    a.poll(0)
+    with pytest.raises(pyaardvark.I2CNackError):
+        a.i2c_master_read(0x51, 1)
+    result = a.i2c_master_write_read_ext(0x52, b'\x00', 1)
+    assert not result.ok
+
+    snapshot = metrics.snapshot()
+    assert snapshot['transfers'] == 5
+    assert snapshot['nacks'] == 2
+    assert snapshot['arbitration_lost'] == 0
+    methods = snapshot['methods']
+    assert methods['i2c_master_write']['calls'] == 1
+    assert methods['i2c_master_write']['bytes_written'] == 3
+    # the inner write of write_read is only accounted once
+    assert methods['i2c_master_write_read']['bytes_written'] == 1
+    assert methods['i2c_master_write_read']['bytes_read'] == 4
+    assert 'i2c_master_read' in methods
+    assert methods['i2c_master_read']['errors'] == 1
+    assert methods['i2c_master_write_read_ext']['errors'] == 1
+    assert methods['spi_write']['bytes_written'] == 8
+    assert methods['spi_write']['bytes_read'] == 8
+    assert methods['poll']['calls'] == 1
+    buckets = methods['poll']['latency_buckets']
+    assert len(buckets) == len(metrics.buckets) + 1
+    assert buckets[-1][0] == float('inf')
+    assert sum(c for _, c in buckets) == 1
+
+    metrics.reset()
+    assert metrics.snapshot()['methods'] == {}
+
+def test_batch(a):
+    metrics = a.enable_metrics()
+    a.i2c_batch([('write_read', 0x50, b'\x00', 2), ('write', 0x51, b'\x00'),
+            ('read', 0x50, 1)], stop_on_error=False)
+    snapshot = metrics.snapshot()
+    assert snapshot['transfers'] == 3
+    assert snapshot['nacks'] == 1
+    assert snapshot['methods']['i2c_batch']['bytes_read'] == 3
+
+def test_disable(a):
+    a.enable_metrics()
+    a.disable_metrics()
+    assert a.metrics is None
+    assert 'i2c_master_write' not in vars(a)
+    a.i2c_master_write(0x50, b'\x00')
+
+def test_histogram_buckets():
+    metrics = Metrics(buckets=(0.001, 0.01))
+    metrics._record('poll', 0.0005, 0, 0, 0, (), False)
+    metrics._record('poll', 0.001, 0, 0, 0, (), False)
+    metrics._record('poll', 0.005, 0, 0, 0, (), False)
+    metrics._record('poll', 1, 0, 0, 0, (), False)
+    buckets = metrics.snapshot()['methods']['poll']['latency_buckets']
+    assert buckets == [(0.001, 2), (0.01, 1), (float('inf'), 1)]
+
+def test_prometheus(a, tmp_path):
+    metrics = a.enable_metrics(buckets=(0.001, 0.01))
+    a.i2c_master_write(0x50, b'\x00\x01')
+    text = metrics.prometheus_text(labels={'serial': '1234-567890'})
+    assert '# TYPE aardvark_calls_total counter' in text
+    assert ('aardvark_calls_total{serial="1234-567890",'
+            'method="i2c_master_write"} 1') in text
+    assert ('aardvark_bytes_written_total{serial="1234-567890",'
+            'method="i2c_master_write"} 2') in text
+    assert ('aardvark_call_duration_seconds_bucket{serial="1234-567890",'
+            'method="i2c_master_write",le="+Inf"} 1') in text
+    assert 'aardvark_nacks_total{serial="1234-567890"} 0' in text
+
+    filename = str(tmp_path / 'aardvark.prom')
+    metrics.write_prometheus(filename)
+    with open(filename) as f:
+        assert 'aardvark_calls_total{method="i2c_master_write"} 1' in f.read()
+    assert [p.name for p in tmp_path.iterdir()] == ['aardvark.prom']
+
+def test_thread_safe(adapter):
+    a = pyaardvark.open(backend='sim', thread_safe=True)
+    metrics = a.enable_metrics()
+    a.i2c_master_write(0x50, b'\x00')
+    assert metrics.snapshot()['methods']['i2c_master_write']['calls'] == 1
+    a.close()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+import sys
+import threading
+
+import pyaardvark
+from pyaardvark import sim
+from pyaardvark.constants import *
+import pytest
+
+
+@pytest.fixture
+def adapters():
+    sim.reset()
+    adapters = list()
+    for i in range(4):
+        adapter = sim.add_adapter(serial_number='1000-%06d' % i)
+        adapter.attach_i2c(0x50, sim.I2CRegisterFile())
+        adapters.append(adapter)
+    yield adapters
+    sim.reset()
+
+def _serial(a):
+    return a.unique_id_str()
+
+def _write(a, data):
+    a.i2c_master_write(0x50, data)
+    return a.i2c_master_write_read(0x50, data[:1], len(data) - 1)
+
+def test_pool_all_devices(adapters):
+    with pyaardvark.DevicePool(backend='sim') as pool:
+        assert len(pool) == 4
+        result = pool.run(_serial)
+        assert result.ok
+        assert result.values == dict((sn, sn) for sn in pool.serial_numbers)
+        assert set(result.durations) == set(pool.serial_numbers)
+        assert pool['1000-000002'].unique_id_str() == '1000-000002'
+    assert all(a.handle is None for a in adapters)
+
+def test_pool_subset(adapters):
+    with pyaardvark.DevicePool(['1000-000000', '1000-000001'],
+            backend='sim') as pool:
+        result = pool.run(_write, b'\x00\x01\x02',
+                serial_numbers=['1000-000001'])
+        assert len(result) == 1
+        assert result['1000-000001'].value == b'\x01\x02'
+        assert adapters[1].i2c_targets[0x50].memory[:2] == b'\x01\x02'
+        assert adapters[0].i2c_targets[0x50].memory[:2] == b'\xff\xff'
+
+def test_pool_kwargs(adapters):
+    def func(a, *args, **kwargs):
+        return (args, kwargs)
+    with pyaardvark.DevicePool(backend='sim') as pool:
+        result = pool.run(func, 1, serial_numbers=['1000-000000'], x=2)
+        assert result['1000-000000'].value == ((1,), dict(x=2))
+
+def test_pool_errors(adapters):
+    adapters[3].detach_i2c(0x50)
+    with pyaardvark.DevicePool(backend='sim') as pool:
+        result = pool.run(_write, b'\x00\x01')
+        assert not result.ok
+        assert list(result.errors) == ['1000-000003']
+        assert isinstance(result.errors['1000-000003'],
+                pyaardvark.I2CNackError)
+
+def test_pool_parallel(adapters):
+    barrier = threading.Barrier(4, timeout=5)
+    def wait(a):
+        return barrier.wait()
+    with pyaardvark.DevicePool(backend='sim') as pool:
+        assert pool.run(wait).ok
+
+def test_pool_open_error(adapters):
+    with pytest.raises(IOError):
+        pyaardvark.DevicePool(['1000-000000', '9999-999999'], backend='sim')
+    assert adapters[0].handle is None
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'),
+        reason='simulated adapters are only inherited by forked processes')
+def test_pool_processes(adapters):
+    with pyaardvark.DevicePool(['1000-000000', '1000-000001'],
+            backend='sim', processes=True) as pool:
+        result = pool.run(_write, b'\x00\x01\x02')
+        assert result.ok
+        assert result.values == {
+            '1000-000000': b'\x01\x02',
+            '1000-000001': b'\x01\x02',
+        }
+        with pytest.raises(KeyError):
+            pool['1000-000000']
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+import pyaardvark
+from pyaardvark import sim
+from pyaardvark.constants import *
+import pytest
+
+
+@pytest.fixture
+def adapter():
+    sim.reset()
+    adapter = sim.add_adapter()
+    yield adapter
+    sim.reset()
+
+@pytest.fixture
+def a(adapter):
+    with pyaardvark.open(backend='sim') as a:
+        yield a
+
+def test_profile_unknown_setting():
+    with pytest.raises(TypeError):
+        pyaardvark.Profile(foo=1)
+
+def test_profile_save_load(tmpdir):
+    profile = pyaardvark.Profile(enable_i2c=True, i2c_bitrate=400,
+            spi_mode=SPI_MODE_3)
+    filename = str(tmpdir.join('profile.json'))
+    profile.save(filename)
+    assert pyaardvark.Profile.load(filename) == profile
+
+def test_apply_profile(adapter, a):
+    profile = pyaardvark.Profile(enable_i2c=True, enable_spi=False,
+            i2c_bitrate=400, i2c_pullups=True, target_power=True,
+            spi_mode=SPI_MODE_3)
+    result = a.apply_profile(profile)
+    assert result.changed == dict(
+            enable_spi=(True, False),
+            i2c_bitrate=(100, 400),
+            i2c_pullups=(False, True),
+            target_power=(False, True),
+            spi_mode=(None, SPI_MODE_3))
+    assert result.duration >= 0
+    assert adapter.config == CONFIG_GPIO_I2C
+    assert adapter.i2c_bitrate == 400
+    assert adapter.i2c_pullups == I2C_PULLUP_BOTH
+    assert adapter.target_power == TARGET_POWER_BOTH
+    assert adapter.spi_config == (SPI_POL_FALLING_RISING,
+            SPI_PHASE_SETUP_SAMPLE, SPI_BITORDER_MSB)
+
+def test_apply_profile_cached(adapter, a):
+    a.cache_config = True
+    i2c = pyaardvark.Profile(enable_i2c=True, enable_spi=False,
+            i2c_bitrate=400)
+    spi = pyaardvark.Profile(enable_i2c=False, enable_spi=True,
+            spi_bitrate=8000, spi_mode=SPI_MODE_0)
+    a.apply_profile(i2c)
+    a.apply_profile(spi)
+
+    adapter.reset_timing()
+    result = a.apply_profile(i2c.to_dict())
+    assert result.changed == dict(enable_i2c=(False, True),
+            enable_spi=(True, False))
+    # a single configure, the configuration is cached
+    assert adapter.round_trips == 1
+    assert adapter.config == CONFIG_GPIO_I2C
+
+    adapter.reset_timing()
+    result = a.apply_profile(i2c)
+    assert result.changed == dict()
+    assert adapter.round_trips == 0
+
+def test_apply_profile_switch_interface(adapter, a, monkeypatch):
+    a.enable_i2c = True
+    a.enable_spi = False
+    configs = list()
+    configure = sim.py_aa_configure
+    def record_configure(handle, config):
+        configs.append(config)
+        return configure(handle, config)
+    monkeypatch.setattr(sim, 'py_aa_configure', record_configure)
+
+    adapter.reset_timing()
+    a.apply_profile(dict(enable_i2c=False, enable_spi=True))
+    # a single query and a single configure, without passing through
+    # CONFIG_GPIO_ONLY
+    assert configs == [CONFIG_QUERY, CONFIG_SPI_GPIO]
+    assert adapter.round_trips == 2
+    assert adapter.config == CONFIG_SPI_GPIO
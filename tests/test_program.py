@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+import pyaardvark
+from pyaardvark import sim
+from pyaardvark.eeprom import I2CEeprom
+from pyaardvark.flash import SPIFlash
+from pyaardvark.program import BlockIndex, program, verify
+import pytest
+
+
+@pytest.fixture
+def adapter():
+    sim.reset()
+    adapter = sim.add_adapter()
+    yield adapter
+    sim.reset()
+
+@pytest.fixture
+def a(adapter):
+    a = pyaardvark.open(backend='sim')
+    yield a
+    a.close()
+
+def _flash(adapter, a, data=None):
+    target = adapter.attach_spi(sim.SPIFlash(size=1 << 18, data=data,
+            page_program_time=0, sector_erase_time=0, block_erase_time=0,
+            chip_erase_time=0))
+    return target, SPIFlash(a)
+
+def test_index(tmpdir):
+    image = bytes(range(256)) * 10
+    index = BlockIndex.from_image(image, 1024)
+    assert len(index) == 3
+    assert list(index.blocks()) == [(0, 1024), (1024, 1024), (2048, 512)]
+    assert index.digests[2] == index.digest(image[2048:])
+
+    filename = str(tmpdir.join('index.json'))
+    index.save(filename)
+    assert BlockIndex.load(filename) == index
+
+def test_flash_unchanged(adapter, a):
+    image = bytes(range(256)) * 64
+    target, flash = _flash(adapter, a, image)
+    result = program(flash, image)
+    assert result.changed == []
+    assert result.written == 0
+    assert result.read == len(image)
+
+def test_flash_only_changed_blocks(adapter, a):
+    old = bytes(range(256)) * 64
+    target, flash = _flash(adapter, a, old)
+    image = bytearray(old)
+    image[0x1010] = 0x00
+    image[0x3020:0x3022] = b'\xff\xff'
+    result = program(flash, image)
+
+    assert result.changed == [0x1000, 0x3000]
+    # block 0x1000 only clears bits, no erase needed
+    assert result.erased == [(0x3000, 0x1000)]
+    assert result.written == 256 + 0x1000
+    assert target.memory[:len(image)] == image
+
+def test_flash_partial_last_block(adapter, a):
+    target, flash = _flash(adapter, a, b'\x00' * 0x2000)
+    image = b'\x55' * 0x1800
+    result = program(flash, image)
+    assert result.erased == [(0, 0x1000), (0x1000, 0x1000)]
+    assert target.memory[:0x1800] == image
+    assert verify(flash, BlockIndex.from_image(image, 0x1000)) == []
+
+def test_flash_alignment(adapter, a):
+    target, flash = _flash(adapter, a)
+    with pytest.raises(ValueError):
+        program(flash, b'\x00' * 0x1000, offset=0x100)
+
+def test_eeprom_only_changed_pages(adapter, a):
+    old = bytes(range(256))
+    target = sim.I2CEeprom(size=256, page_size=16, data=old)
+    adapter.attach_i2c(0x50, target)
+    eeprom = I2CEeprom(a, 0x50, size=256, page_size=16)
+
+    image = bytearray(old)
+    image[0x25] = 0
+    index = BlockIndex.from_image(image, 64)
+    result = program(eeprom, image, index)
+    assert result.changed == [0]
+    assert result.written == 16
+    assert target.memory == image
+
+def test_verify_failure(adapter, a):
+    target, flash = _flash(adapter, a)
+    flash.program = lambda offset, data: None
+    with pytest.raises(pyaardvark.AardvarkError):
+        program(flash, b'\x00' * 0x1000)
+    assert verify(flash, BlockIndex.from_image(b'\x00' * 0x1000,
+            0x1000)) == [0]
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+import io
+
+import pyaardvark
+from pyaardvark import sim
+from pyaardvark.record import (CallError, Recorder, read_log, record,
+        replay)
+import pytest
+
+
+@pytest.fixture
+def adapter():
+    sim.reset()
+    adapter = sim.add_adapter(serial_number='1234-567890')
+    adapter.attach_i2c(0x50, sim.I2CRegisterFile(data=range(256)))
+    adapter.attach_spi(sim.SPIFlash(size=65536))
+    yield adapter
+    sim.reset()
+
+def _session(backend):
+    a = pyaardvark.open(serial_number='1234-567890', backend=backend)
+    a.i2c_bitrate = 400
+    a.i2c_master_write(0x50, b'\x10\xaa')
+    data = a.i2c_master_write_read(0x50, b'\x10', 4)
+    a.spi_write(b'\x9f\x00\x00\x00')
+    a.close()
+    return data
+
+def test_record_and_read(adapter, tmp_path):
+    log = str(tmp_path / 'session.log')
+    with Recorder(log, backend='sim') as recorder:
+        assert _session(recorder) == b'\xaa\x11\x12\x13'
+        assert recorder.calls > 0
+        calls = recorder.calls
+
+    calls_read = list(read_log(log))
+    assert len(calls_read) == calls
+    names = [c.name for c in calls_read]
+    assert names[:3] == ['py_aa_find_devices', 'py_aa_find_devices_ext',
+            'py_aa_open_ext']
+    assert 'py_aa_close' == names[-1]
+
+    read = [c for c in calls_read if c.name == 'py_aa_i2c_read_ext'][0]
+    assert read.args[1] == 0x50
+    assert read.result == (0, 4)
+    assert read.outputs == (b'\xaa\x11\x12\x13',)
+    write = [c for c in calls_read if c.name == 'py_aa_i2c_write_ext'][0]
+    assert write.args[4] == b'\x10\xaa'
+    assert all(c.time >= 0 and c.duration >= 0 for c in calls_read)
+    assert [c.index for c in calls_read] == list(range(calls))
+
+def test_replay(adapter, tmp_path):
+    log = str(tmp_path / 'session.log')
+    with Recorder(log, backend='sim') as recorder:
+        _session(recorder)
+
+    # same setup, but the simulator hands out another handle
+    adapter.attach_i2c(0x50, sim.I2CRegisterFile(data=range(256)))
+    result = replay(log, backend='sim')
+    assert result.ok, result.differences
+    assert result.calls > 0
+    assert result.recorded_duration > 0
+
+    # the target behaves differently
+    adapter.attach_i2c(0x50, sim.I2CRegisterFile(data=b'\x00' * 256))
+    result = replay(log, backend='sim')
+    assert not result.ok
+    assert len(result.differences) == 1
+    diff = result.differences[0]
+    assert diff.call.name == 'py_aa_i2c_read_ext'
+    assert bytes(diff.outputs[0]) == b'\xaa\x00\x00\x00'
+    assert 'py_aa_i2c_read_ext' in repr(diff)
+
+def test_record_default_binding(adapter, monkeypatch):
+    monkeypatch.setattr(pyaardvark.aardvark, 'api', sim)
+    f = io.BytesIO()
+    with record(f) as recorder:
+        assert pyaardvark.aardvark.api is recorder
+        _session(None)
+    assert pyaardvark.aardvark.api is sim
+    f.seek(0)
+    assert len(list(read_log(f))) == recorder.calls
+
+def test_record_errors(adapter):
+    class Binding(object):
+        def py_aa_close(self, handle):
+            raise TypeError('bad handle')
+    f = io.BytesIO()
+    recorder = Recorder(f, backend=Binding())
+    with pytest.raises(TypeError):
+        recorder.py_aa_close(1)
+    recorder.close()
+    f.seek(0)
+    call, = read_log(f)
+    assert call.result == CallError('TypeError: bad handle')
+
+def test_not_a_log():
+    with pytest.raises(ValueError):
+        list(read_log(io.BytesIO(b'garbage' * 4)))
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+import queue
+
+import pyaardvark
+from pyaardvark import sim
+from pyaardvark.registry import DeviceEvent
+import pytest
+
+
+@pytest.fixture
+def adapters():
+    sim.reset()
+    adapters = [sim.add_adapter(serial_number='1000-%06d' % i)
+            for i in range(2)]
+    yield adapters
+    sim.reset()
+
+def test_scan_events(adapters):
+    registry = pyaardvark.DeviceRegistry(backend='sim')
+    assert registry.scan() == [
+        DeviceEvent('arrived', '1000-000000', 0, False),
+        DeviceEvent('arrived', '1000-000001', 1, False),
+    ]
+    assert registry.scan() == []
+
+    a = registry.open('1000-000001')
+    sim.remove_adapter(adapters[0])
+    sim.add_adapter(serial_number='1000-000002')
+    assert registry.scan() == [
+        DeviceEvent('departed', '1000-000000', 0, False),
+        DeviceEvent('changed', '1000-000001', 1, True),
+        DeviceEvent('arrived', '1000-000002', 0, False),
+    ]
+    a.close()
+
+def test_scan_many_devices(adapters):
+    for i in range(2, 40):
+        sim.add_adapter(serial_number='1000-%06d' % i)
+    registry = pyaardvark.DeviceRegistry(backend='sim')
+    assert len(registry.scan()) == 40
+    assert registry.devices() == pyaardvark.find_devices(backend='sim')
+
+def test_open_from_cache(adapters):
+    registry = pyaardvark.DeviceRegistry(backend='sim')
+    registry.scan()
+    calls = []
+    orig = registry._enumerate
+    registry._enumerate = lambda: calls.append(1) or orig()
+    a = registry.open('1000-000001')
+    assert a.unique_id_str() == '1000-000001'
+    assert calls == []
+    a.close()
+
+def test_open_rescan_on_mismatch(adapters):
+    registry = pyaardvark.DeviceRegistry(backend='sim')
+    registry.scan()
+    sim.remove_adapter(adapters[1])
+    sim.add_adapter(serial_number='1000-000001', port=5)
+    sim.add_adapter(serial_number='1000-000007', port=1)
+    a = registry.open('1000-000001')
+    assert a.unique_id_str() == '1000-000001'
+    assert registry.port('1000-000001') == 5
+    a.close()
+
+def test_open_unknown(adapters):
+    registry = pyaardvark.DeviceRegistry(backend='sim')
+    with pytest.raises(IOError):
+        registry.open('9999-999999')
+
+def test_watcher(adapters):
+    seen = []
+    with pyaardvark.DeviceWatcher(interval=0.01, callback=seen.append,
+            backend='sim') as watcher:
+        assert watcher.events.get(timeout=1).serial_number == '1000-000000'
+        assert watcher.events.get(timeout=1).serial_number == '1000-000001'
+        sim.remove_adapter(adapters[0])
+        event = watcher.events.get(timeout=1)
+        assert event.kind == DeviceEvent.DEPARTED
+        assert event.serial_number == '1000-000000'
+    assert seen[-1] == event
+    with pytest.raises(queue.Empty):
+        watcher.events.get_nowait()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+import pyaardvark
+from pyaardvark import sim
+from pyaardvark.regmap import Register, RegisterMap
+import pytest
+
+
+@pytest.fixture
+def adapter():
+    sim.reset()
+    adapter = sim.add_adapter()
+    yield adapter
+    sim.reset()
+
+@pytest.fixture
+def a(adapter):
+    a = pyaardvark.open(backend='sim')
+    yield a
+    a.close()
+
+@pytest.fixture
+def target(adapter):
+    target = sim.I2CRegisterFile(data=range(256))
+    adapter.attach_i2c(0x40, target)
+    return target
+
+REGISTERS = {
+    'CTRL': dict(address=0x00, fields={'EN': (0, 1), 'MODE': (1, 3)}),
+    'STATUS': dict(address=0x01, volatile=True),
+    'A': 0x10,
+    'B': 0x11,
+    'C': 0x12,
+    'D': 0x14,
+}
+
+def test_register_definitions(a, target):
+    regs = RegisterMap(a, 0x40, dict(REGISTERS,
+            E=Register(0x20, volatile=True)))
+    assert regs.registers['A'].address == 0x10
+    assert regs.registers['A'].name == 'A'
+    assert regs.registers['STATUS'].volatile
+    assert regs.registers['E'].name == 'E'
+    assert regs.registers['E'].volatile
+    assert 'CTRL' in regs
+    assert 'X' not in regs
+
+def test_read_caches(adapter, a, target):
+    regs = RegisterMap(a, 0x40, REGISTERS)
+    adapter.reset_timing()
+    assert regs['A'] == 0x10
+    assert adapter.round_trips == 1
+    target.memory[0x10] = 0x99
+    assert regs['A'] == 0x10
+    assert adapter.round_trips == 1
+    regs.invalidate('A')
+    assert regs['A'] == 0x99
+    assert adapter.round_trips == 2
+
+def test_volatile_is_not_cached(adapter, a, target):
+    regs = RegisterMap(a, 0x40, REGISTERS)
+    assert regs['STATUS'] == 0x01
+    target.memory[0x01] = 0x80
+    assert regs['STATUS'] == 0x80
+
+def test_flush_coalesces_contiguous(adapter, a, target):
+    regs = RegisterMap(a, 0x40, REGISTERS)
+    writes = []
+    a_write = a.i2c_master_write
+    a.i2c_master_write = lambda addr, data, *args: writes.append(
+            bytes(data)) or a_write(addr, data, *args)
+
+    regs['C'] = 0xcc
+    regs['A'] = 0xaa
+    regs['D'] = 0xdd
+    regs['B'] = 0xbb
+    assert writes == []
+    assert regs.dirty == ['A', 'B', 'C', 'D']
+    assert regs['B'] == 0xbb
+    assert target.memory[0x11] == 0x11
+
+    assert regs.flush() == 2
+    assert writes == [b'\x10\xaa\xbb\xcc', b'\x14\xdd']
+    assert target.memory[0x10:0x15] == b'\xaa\xbb\xcc\x13\xdd'
+    assert regs.dirty == []
+    assert regs.flush() == 0
+
+def test_flush_max_burst(a, target):
+    regs = RegisterMap(a, 0x40, REGISTERS, max_burst=2)
+    for name in 'ABC':
+        regs[name] = 0
+    assert regs.flush() == 2
+    assert target.memory[0x10:0x13] == b'\x00\x00\x00'
+
+def test_write_unchanged_is_skipped(a, target):
+    regs = RegisterMap(a, 0x40, REGISTERS)
+    assert regs['A'] == 0x10
+    regs['A'] = 0x10
+    assert regs.dirty == []
+
+def test_volatile_write_flushes_first(a, target):
+    regs = RegisterMap(a, 0x40, REGISTERS)
+    writes = []
+    a_write = a.i2c_master_write
+    a.i2c_master_write = lambda addr, data, *args: writes.append(
+            bytes(data)) or a_write(addr, data, *args)
+    regs['A'] = 0x55
+    regs['STATUS'] = 0x00
+    assert writes == [b'\x10\x55', b'\x01\x00']
+
+def test_write_through(a, target):
+    regs = RegisterMap(a, 0x40, REGISTERS, write_back=False)
+    regs['A'] = 0x55
+    assert target.memory[0x10] == 0x55
+    assert regs.dirty == []
+
+def test_update_fields(adapter, a, target):
+    target.memory[0x00] = 0xf0
+    regs = RegisterMap(a, 0x40, REGISTERS)
+    adapter.reset_timing()
+    regs.update('CTRL', EN=1, MODE=5)
+    regs.flush()
+    assert adapter.round_trips == 2
+    assert target.memory[0x00] == 0xf0 | 0x0b
+    assert regs.read_field('CTRL', 'MODE') == 5
+    assert regs.read_field('CTRL', 'EN') == 1
+
+    # cached, no further read
+    adapter.reset_timing()
+    regs.update('CTRL', EN=0)
+    regs.flush()
+    assert adapter.round_trips == 1
+    assert target.memory[0x00] == 0xfa
+
+def test_update_field_overflow(a, target):
+    regs = RegisterMap(a, 0x40, REGISTERS)
+    with pytest.raises(ValueError):
+        regs.update('CTRL', MODE=8)
+    with pytest.raises(ValueError):
+        regs['A'] = 0x100
+
+def test_load_bursts(adapter, a, target):
+    regs = RegisterMap(a, 0x40, REGISTERS)
+    adapter.reset_timing()
+    regs.load()
+    # CTRL, A-C and D; STATUS is volatile
+    assert adapter.round_trips == 3
+    assert regs['B'] == 0x11
+    assert regs['D'] == 0x14
+    assert adapter.round_trips == 3
+
+def test_wide_registers(a, adapter):
+    target = sim.I2CRegisterFile(size=0x10000, addr_width=2)
+    adapter.attach_i2c(0x40, target)
+    regs = RegisterMap(a, 0x40, {'X': 0x100, 'Y': 0x102}, addr_width=2,
+            reg_width=2, byteorder='little', addr_step=2)
+    regs['X'] = 0x1234
+    regs['Y'] = 0xabcd
+    assert regs.flush() == 1
+    assert target.memory[0x100:0x104] == b'\x34\x12\xcd\xab'
+    regs.invalidate()
+    assert regs['Y'] == 0xabcd
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+import pyaardvark
+from pyaardvark import sim
+from pyaardvark.constants import *
+import pytest
+
+
+SERIAL = '1000-000001'
+
+@pytest.fixture
+def adapter():
+    sim.reset()
+    adapter = sim.add_adapter(serial_number=SERIAL)
+    yield adapter
+    sim.reset()
+
+def _replug(adapter, port=None):
+    sim.remove_adapter(adapter)
+    adapter = sim.add_adapter(serial_number=SERIAL, port=port)
+    adapter.attach_i2c(0x50, sim.I2CRegisterFile())
+    return adapter
+
+def test_policy_delays():
+    policy = pyaardvark.ReconnectPolicy(attempts=5, interval=0.1,
+            backoff=3, max_interval=1.0)
+    assert list(policy.delays()) == pytest.approx([0.1, 0.3, 0.9, 1.0, 1.0])
+
+def test_reconnect_restores_config(adapter):
+    a = pyaardvark.ResilientAardvark(SERIAL, backend='sim')
+    a.enable_spi = False
+    a.i2c_bitrate = 400
+    a.i2c_pullups = True
+    a.spi_configure_mode(SPI_MODE_3)
+    a.i2c_slave_response = b'\x12\x34'
+
+    adapter = _replug(adapter, port=3)
+    a.i2c_master_write(0x50, b'\x00\xab')
+
+    assert a.reconnects == 1
+    assert adapter.handle == a.handle
+    assert adapter.i2c_targets[0x50].memory[0] == 0xab
+    assert adapter.config == CONFIG_GPIO_I2C
+    assert adapter.i2c_bitrate == 400
+    assert adapter.i2c_pullups == I2C_PULLUP_BOTH
+    assert adapter.spi_config == (SPI_POL_FALLING_RISING,
+            SPI_PHASE_SETUP_SAMPLE, SPI_BITORDER_MSB)
+    assert bytes(adapter.i2c_slave_response) == b'\x12\x34'
+    a.close()
+
+def test_reconnect_after_invalidate_config(adapter):
+    a = pyaardvark.ResilientAardvark(SERIAL, backend='sim')
+    a.enable_spi = False
+    a.i2c_bitrate = 400
+    # changed behind the back of the cache
+    adapter.i2c_bitrate = 200
+    a.invalidate_config()
+    assert a.i2c_bitrate == 200
+
+    adapter = _replug(adapter)
+    a.i2c_master_write(0x50, b'\x00\xab')
+    assert a.reconnects == 1
+    assert adapter.config == CONFIG_GPIO_I2C
+    assert adapter.i2c_bitrate == 200
+    a.close()
+
+def test_reconnect_restores_gpio(adapter):
+    a = pyaardvark.ResilientAardvark(SERIAL, backend='sim')
+    a.enable_spi = False
+    a.gpio_pullups = GPIO_MISO
+    a.gpio_set(GPIO_SS)
+    a.gpio_direction = GPIO_SS | GPIO_MOSI
+    adapter = _replug(adapter)
+    assert a.gpio_get() == GPIO_SS | GPIO_MISO
+    assert a.reconnects == 1
+    assert adapter.gpio_direction == GPIO_SS | GPIO_MOSI
+    assert adapter.gpio_state() == GPIO_SS | GPIO_MISO
+    a.close()
+
+def test_reconnect_restores_slave_mode(adapter):
+    a = pyaardvark.ResilientAardvark(SERIAL, backend='sim')
+    a.enable_i2c_slave(0x42, buffer_size=32)
+    adapter = _replug(adapter)
+    assert a.poll(0) == []
+    assert adapter.i2c_slave_address == 0x42
+    a.close()
+
+def test_reconnect_restores_spi_slave_mode(adapter):
+    a = pyaardvark.ResilientAardvark(SERIAL, backend='sim')
+    a.spi_slave_response = b'\x12'
+    a.enable_spi_slave()
+    adapter = _replug(adapter)
+    assert a.poll(0) == []
+    assert adapter.spi_slave_enabled
+    assert adapter.spi_master_transfer(b'\x00\x00') == b'\x12\x12'
+    a.close()
+
+def test_write_read_retried_as_whole(adapter):
+    a = pyaardvark.ResilientAardvark(SERIAL, backend='sim')
+    calls = []
+    def write(*args):
+        if not calls:
+            calls.append(1)
+            _replug(adapter).i2c_targets[0x50].memory[:2] = b'\x01\x02'
+        return orig(*args)
+    orig = a.i2c_master_write.__wrapped__
+    a.i2c_master_write = lambda *args: write(a, *args)
+    assert a.i2c_master_write_read(0x50, b'\x00', 2) == b'\x01\x02'
+    assert a.reconnects == 1
+    a.close()
+
+def test_give_up(adapter):
+    policy = pyaardvark.ReconnectPolicy(attempts=3, interval=0)
+    a = pyaardvark.ResilientAardvark(SERIAL, backend='sim', policy=policy)
+    sim.remove_adapter(adapter)
+    with pytest.raises(pyaardvark.AardvarkError):
+        a.i2c_bitrate = 400
+    assert a.reconnects == 0
+
+    # the adapter is reopened on the next call once it is back
+    sim.add_adapter(serial_number=SERIAL)
+    a.i2c_bitrate = 400
+    assert a.reconnects == 1
+    a.close()
+
+def test_other_errors_not_retried(adapter):
+    a = pyaardvark.ResilientAardvark(SERIAL, backend='sim')
+    with pytest.raises(pyaardvark.I2CNackError):
+        a.i2c_master_write(0x50, b'\x00')
+    assert a.reconnects == 0
+    a.close()
+
+def test_cache_config_always_enabled(adapter):
+    a = pyaardvark.ResilientAardvark(SERIAL, backend='sim')
+    assert a.cache_config
+    with pytest.raises(ValueError):
+        a.cache_config = False
+    a.close()
+
+def test_unknown_serial(adapter):
+    with pytest.raises(IOError):
+        pyaardvark.ResilientAardvark('1000-000002', backend='sim')
@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+
+import array
+import mmap
+import threading
+import time
+
+import pyaardvark
+from pyaardvark import sim
+from pyaardvark.constants import *
+import pytest
+
+
+@pytest.fixture
+def adapter():
+    sim.reset()
+    adapter = sim.add_adapter(serial_number='1234-567890')
+    yield adapter
+    sim.reset()
+
+@pytest.fixture
+def a(adapter):
+    with pyaardvark.open(backend='sim') as a:
+        yield a
+
+def test_api_version():
+    assert pyaardvark.api_version(backend='sim') == '6.00'
+
+def test_find_devices(adapter):
+    sim.add_adapter(serial_number='1111-222222')
+    devs = pyaardvark.find_devices(backend='sim')
+    assert devs == [
+        dict(port=0, serial_number='1234-567890', in_use=False),
+        dict(port=1, serial_number='1111-222222', in_use=False),
+    ]
+
+def test_open_serial_number(adapter):
+    sim.add_adapter(serial_number='1111-222222')
+    with pyaardvark.open(serial_number='1111-222222', backend='sim') as a:
+        assert a.unique_id_str() == '1111-222222'
+        devs = pyaardvark.find_devices(backend='sim')
+        assert devs[1]['in_use']
+
+def test_open_twice(a):
+    with pytest.raises(IOError):
+        pyaardvark.open(backend='sim')
+
+def test_open_backend_object(adapter):
+    with pyaardvark.open(backend=sim) as a:
+        assert a.unique_id() == 1234567890
+
+def test_configuration(a):
+    a.enable_i2c = False
+    assert not a.enable_i2c
+    assert a.enable_spi
+    a.i2c_bitrate = 400
+    assert a.i2c_bitrate == 400
+    a.i2c_bus_timeout = 1000
+    assert a.i2c_bus_timeout == 450
+    a.i2c_pullups = True
+    assert a.i2c_pullups == I2C_PULLUP_BOTH
+
+def test_i2c_not_enabled(a):
+    a.enable_i2c = False
+    with pytest.raises(IOError):
+        a.i2c_master_write(0x50, b'\x00')
+
+def test_i2c_sla_nack(a):
+    with pytest.raises(IOError) as e:
+        a.i2c_master_read(0x50, 1)
+    assert e.value.errno == I2C_STATUS_SLA_NACK
+
+def test_i2c_register_file(adapter, a):
+    adapter.attach_i2c(0x20, sim.I2CRegisterFile(data=range(256)))
+    assert a.i2c_master_write_read(0x20, b'\x10', 3) == b'\x10\x11\x12'
+    a.i2c_master_write(0x20, b'\x10\xaa\xbb')
+    assert a.i2c_master_write_read(0x20, b'\x0f', 4) == b'\x0f\xaa\xbb\x12'
+
+def test_i2c_eeprom_page_wrap(adapter, a):
+    eeprom = adapter.attach_i2c(0x50, sim.I2CEeprom(size=256, page_size=8,
+            write_cycle_time=0))
+    a.i2c_master_write(0x50, b'\x06\x01\x02\x03')
+    assert eeprom.memory[:8] == b'\x03\xff\xff\xff\xff\xff\x01\x02'
+
+def test_i2c_eeprom_ack_polling(adapter, a):
+    adapter.attach_i2c(0x50, sim.I2CEeprom(write_cycle_time=10))
+    a.i2c_master_write(0x50, b'\x00\x01')
+    with pytest.raises(IOError) as e:
+        a.i2c_master_write(0x50, b'\x00')
+    assert e.value.errno == I2C_STATUS_SLA_NACK
+
+def test_i2c_stop(adapter, a):
+    adapter.attach_i2c(0x50, sim.I2CRegisterFile())
+    a.i2c_master_write(0x50, b'\x00', I2C_NO_STOP)
+    assert a.i2c_stop(ignore_errors=False) == 0
+    with pytest.raises(IOError):
+        a.i2c_stop(ignore_errors=False)
+
+def test_spi_flash(adapter, a):
+    flash = adapter.attach_spi(sim.SPIFlash(size=65536,
+            page_program_time=0, sector_erase_time=0))
+    assert a.spi_write(b'\x9f\x00\x00\x00') == b'\xff\xef\x40\x14'
+    a.spi_write(b'\x06')
+    a.spi_write(b'\x02\x00\x01\x00\x12\x34')
+    assert flash.memory[0x100:0x102] == b'\x12\x34'
+    assert a.spi_write(b'\x03\x00\x01\x00\x00\x00')[4:] == b'\x12\x34'
+    a.spi_write(b'\x06')
+    a.spi_write(b'\x20\x00\x00\x00')
+    assert a.spi_write(b'\x0b\x00\x01\x00\x00\x00')[5:] == b'\xff'
+
+def test_spi_flash_needs_write_enable(adapter, a):
+    flash = adapter.attach_spi(sim.SPIFlash(size=65536))
+    a.spi_write(b'\x02\x00\x00\x00\x00')
+    assert flash.memory[0] == 0xff
+
+def test_i2c_slave(adapter, a):
+    a.enable_i2c_slave(0x40)
+    assert a.poll(0) == []
+    assert adapter.i2c_master_transmit(0x40, b'\x01\x02')
+    assert a.poll(0) == [POLL_I2C_READ]
+    assert a.i2c_slave_read() == (0x40, b'\x01\x02')
+
+    a.i2c_slave_response = b'\xaa\xbb'
+    assert adapter.i2c_master_receive(0x40, 3) == b'\xaa\xbb\xaa'
+    assert a.poll(0) == [POLL_I2C_WRITE]
+    assert a.i2c_slave_last_transmit_size == 3
+
+def test_remove_adapter(adapter, a):
+    sim.remove_adapter(adapter)
+    with pytest.raises(IOError):
+        a.i2c_bitrate = 100
+
+def test_timing_i2c(adapter, a):
+    adapter.usb_latency = 0.001
+    adapter.attach_i2c(0x50, sim.I2CRegisterFile())
+    a.i2c_bitrate = 100
+    adapter.reset_timing()
+    a.i2c_master_write(0x50, bytes(10))
+    # start + address + 10 data bytes + stop
+    assert adapter.bus_time == pytest.approx(101 / 100000.0)
+    assert adapter.round_trips == 1
+    assert adapter.usb_time == pytest.approx(0.001)
+    assert adapter.elapsed() >= adapter.bus_time + adapter.usb_time
+
+    a.i2c_bitrate = 400
+    adapter.reset_timing()
+    a.i2c_master_write(0x50, bytes(10))
+    assert adapter.bus_time == pytest.approx(101 / 400000.0)
+
+def test_timing_clock_stretch(adapter, a):
+    target = adapter.attach_i2c(0x50, sim.I2CRegisterFile())
+    target.clock_stretch = 0.001
+    adapter.reset_timing()
+    a.i2c_master_read(0x50, 4)
+    assert adapter.bus_time == pytest.approx(47 / 100000.0 + 0.004)
+
+def test_timing_spi(adapter, a):
+    a.spi_bitrate = 1000
+    adapter.reset_timing()
+    a.spi_write(bytes(100))
+    assert adapter.bus_time == pytest.approx(900 / 1000000.0)
+
+def test_timing_realtime(adapter, a):
+    adapter.realtime = True
+    adapter.usb_latency = 0.01
+    adapter.reset_timing()
+    start = time.monotonic()
+    _ = a.i2c_bitrate
+    assert time.monotonic() - start >= 0.01
+
+def test_read_into_buffers(adapter, a):
+    adapter.attach_i2c(0x20, sim.I2CRegisterFile(data=range(256)))
+    buf = bytearray(8)
+    assert a.i2c_master_write_read_into(0x20, b'\x04', memoryview(buf)[2:6]) == 4
+    assert buf == b'\x00\x00\x04\x05\x06\x07\x00\x00'
+
+    mm = mmap.mmap(-1, 16)
+    assert a.i2c_master_write_read_into(0x20, b'\x10', mm) == 16
+    assert mm[:] == bytes(range(16, 32))
+
+    a.i2c_master_write(0x20, array.array('B', b'\x00\x42'))
+    assert a.i2c_master_write_read(0x20, b'\x00', 1) == b'\x42'
+
+def test_i2c_write_read_round_trips(adapter, a):
+    adapter.attach_i2c(0x50, sim.I2CRegisterFile(data=range(256)))
+    adapter.reset_timing()
+    assert a.i2c_master_write_read(0x50, b'\x10', 2) == b'\x10\x11'
+    assert adapter.round_trips == 2
+    adapter.reset_timing()
+    assert a.i2c_master_write_read_ext(0x50, b'\x10', 2).data == b'\x10\x11'
+    assert adapter.round_trips == 1
+
+def test_gpio(adapter, a):
+    # both interfaces enabled, no pins available
+    assert a.gpio_get() == 0
+    a.enable_i2c = False
+    a.enable_spi = False
+    a.gpio_pullups = GPIO_SDA
+    assert a.gpio_get() == GPIO_SDA
+    a.gpio_direction = GPIO_SS | GPIO_SCL
+    a.gpio_set(GPIO_SS | GPIO_MOSI)
+    assert adapter.gpio_state() == GPIO_SDA | GPIO_SS
+    a.gpio_set(GPIO_SCL, mask=GPIO_SCL)
+    assert adapter.gpio_state() == GPIO_SDA | GPIO_SS | GPIO_SCL
+    adapter.drive_gpio(GPIO_MISO, GPIO_MISO | GPIO_SDA)
+    assert a.gpio_get() == GPIO_MISO | GPIO_SS | GPIO_SCL
+    adapter.release_gpio()
+    assert a.gpio_get() == GPIO_SDA | GPIO_SS | GPIO_SCL
+    assert a.gpio_direction == GPIO_SS | GPIO_SCL
+    assert a.gpio_pullups == GPIO_SDA
+
+def test_gpio_i2c_pins(adapter, a):
+    a.enable_spi = False
+    adapter.drive_gpio(GPIO_ALL)
+    assert a.gpio_get() == GPIO_ALL & ~(GPIO_SCL | GPIO_SDA)
+
+def test_gpio_wait_change(adapter, a):
+    a.enable_spi = False
+    a.gpio_direction = GPIO_SS
+    assert a.gpio_wait_change(0) is None
+    # outputs are no input changes
+    a.gpio_set(GPIO_SS)
+    assert a.gpio_wait_change(0) is None
+
+    timer = threading.Timer(0.02, adapter.drive_gpio, (GPIO_MISO,))
+    timer.start()
+    start = time.monotonic()
+    assert a.gpio_wait_change(1000) == GPIO_MISO | GPIO_SS
+    assert time.monotonic() - start < 0.5
+    timer.join()
+    assert a.gpio_wait_change(0) is None
+
+def test_spi_slave(adapter, a):
+    a.enable_spi_slave()
+    a.spi_slave_response = b'\xa5\x5a'
+    assert adapter.spi_master_transfer(b'\x01\x02\x03') == b'\xa5\x5a\xa5'
+    assert a.poll(0) == [POLL_SPI]
+    assert a.spi_slave_read() == b'\x01\x02\x03'
+    with pytest.raises(pyaardvark.SPIError) as e:
+        a.spi_slave_read()
+    assert e.value.errno == ERR_SPI_SLAVE_TIMEOUT
+
+    adapter.spi_master_transfer(b'\x01\x02\x03')
+    adapter.spi_master_transfer(b'\x04')
+    buf = bytearray(2)
+    # the excess bytes are dropped
+    with pytest.raises(pyaardvark.SPIError) as e:
+        a.spi_slave_read_into(buf)
+    assert e.value.errno == ERR_SPI_DROPPED_EXCESS_BYTES
+    assert a.spi_slave_read_into(buf) == 1
+    assert buf[:1] == b'\x04'
+    a.disable_spi_slave()
+    assert adapter.spi_master_transfer(b'\x01') == b'\xff'
+
+def test_spi_slave_frames(adapter, a):
+    a.enable_spi_slave()
+    frames = [bytes([i % 256]) * (i % 7 + 1) for i in range(500)]
+
+    def master():
+        for frame in frames:
+            adapter.spi_master_transfer(frame)
+    thread = threading.Thread(target=master)
+    thread.start()
+
+    received = []
+    buffers = set()
+    for frame in a.spi_slave_frames(timeout=200):
+        buffers.add(id(frame.obj))
+        received.append(bytes(frame))
+    thread.join()
+    assert received == frames
+    assert len(buffers) == 1
+
+def test_spi_slave_frames_too_large(adapter, a):
+    a.enable_spi_slave()
+    adapter.spi_master_transfer(b'\x01\x02')
+    adapter.spi_master_transfer(b'\x01\x02\x03')
+    frames = a.spi_slave_frames(timeout=0, buffer_size=2)
+    assert bytes(next(frames)) == b'\x01\x02'
+    with pytest.raises(pyaardvark.SPIError) as e:
+        next(frames)
+    assert e.value.errno == ERR_SPI_DROPPED_EXCESS_BYTES
+
+def test_spi_slave_receive(adapter, a):
+    a.enable_spi_slave()
+    adapter.spi_master_transfer(b'\x01')
+    adapter.spi_master_transfer(b'\x02')
+
+    def callback(frame):
+        return bytes(frame) * 2
+    assert a.spi_slave_receive(callback, timeout=0) == 2
+    assert bytes(adapter.spi_slave_response) == b'\x02\x02'
+
+def test_spi_slave_frames_stop_on_i2c_event(adapter, a):
+    a.enable_i2c_slave(0x42)
+    a.enable_spi_slave()
+    adapter.spi_master_transfer(b'\x01')
+    adapter.i2c_master_transmit(0x42, b'\x02')
+    assert [bytes(f) for f in a.spi_slave_frames()] == [b'\x01']
+    assert a.i2c_slave_read() == (0x42, b'\x02')
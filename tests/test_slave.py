@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+import time
+
+import pyaardvark
+from pyaardvark import sim
+from pyaardvark.slave import (I2CSlaveHandler, I2CSlaveServer,
+        RegisterFileHandler)
+import pytest
+
+
+@pytest.fixture
+def adapter():
+    sim.reset()
+    adapter = sim.add_adapter()
+    yield adapter
+    sim.reset()
+
+@pytest.fixture
+def a(adapter):
+    a = pyaardvark.open(backend='sim')
+    yield a
+    a.close()
+
+def _wait_for(predicate, timeout=1.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+def test_register_file(adapter, a):
+    regs = RegisterFileHandler(size=256, data=range(256))
+    with I2CSlaveServer(a, 0x42, regs, poll_interval=5) as server:
+        # pre-armed with the data at pointer 0
+        assert adapter.i2c_master_receive(0x42, 2) == b'\x00\x01'
+        _wait_for(lambda: server.reads == 1)
+        # the pointer advanced
+        assert adapter.i2c_master_receive(0x42, 2) == b'\x02\x03'
+        _wait_for(lambda: server.reads == 2)
+
+        assert adapter.i2c_master_transmit(0x42, b'\x10\xaa\xbb')
+        _wait_for(lambda: server.writes == 1)
+        assert regs.memory[0x10:0x12] == b'\xaa\xbb'
+        assert adapter.i2c_master_receive(0x42, 1) == b'\x12'
+        _wait_for(lambda: server.reads == 3)
+
+        assert adapter.i2c_master_transmit(0x42, b'\x10')
+        _wait_for(lambda: server.writes == 2)
+        assert adapter.i2c_master_receive(0x42, 3) == b'\xaa\xbb\x12'
+    assert not server.running
+    assert adapter.i2c_slave_address is None
+
+def test_register_file_wraps(adapter, a):
+    regs = RegisterFileHandler(size=16, data=range(16), response_size=4)
+    with I2CSlaveServer(a, 0x42, regs, poll_interval=5) as server:
+        assert adapter.i2c_master_transmit(0x42, b'\x0e')
+        _wait_for(lambda: server.writes == 1)
+        assert adapter.i2c_master_receive(0x42, 4) == b'\x0e\x0f\x00\x01'
+
+def test_store_rearms_response(adapter, a):
+    regs = RegisterFileHandler(size=256)
+    with I2CSlaveServer(a, 0x42, regs, poll_interval=5):
+        regs.store(0x00, b'\x55\x66')
+        _wait_for(lambda: adapter.i2c_slave_response[:2] == b'\x55\x66')
+        assert adapter.i2c_master_receive(0x42, 2) == b'\x55\x66'
+    assert regs.load(0x00, 2) == b'\x55\x66'
+
+def test_custom_handler(adapter, a):
+    class Echo(I2CSlaveHandler):
+        def __init__(self):
+            self.received = []
+        def response(self):
+            return b'\x00'
+        def write(self, address, data):
+            self.received.append((address, bytes(data)))
+            return data[::-1]
+
+    echo = Echo()
+    with I2CSlaveServer(a, 0x42, echo, poll_interval=5) as server:
+        assert adapter.i2c_master_receive(0x42, 1) == b'\x00'
+        assert adapter.i2c_master_transmit(0x42, b'\x01\x02\x03')
+        _wait_for(lambda: server.writes == 1)
+        assert adapter.i2c_master_receive(0x42, 3) == b'\x03\x02\x01'
+    assert echo.received == [(0x42, b'\x01\x02\x03')]
+
+def test_handler_error(adapter, a):
+    class Broken(I2CSlaveHandler):
+        def write(self, address, data):
+            raise ValueError('broken')
+
+    server = I2CSlaveServer(a, 0x42, Broken(), poll_interval=5)
+    server.start()
+    adapter.i2c_master_transmit(0x42, b'\x00')
+    _wait_for(lambda: not server.running)
+    with pytest.raises(ValueError):
+        server.stop()
+    assert adapter.i2c_slave_address is None
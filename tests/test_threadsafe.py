@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+import threading
+
+from mock import patch
+import pyaardvark
+from pyaardvark import sim
+from pyaardvark.constants import *
+
+
+@patch('pyaardvark.aardvark.api', autospec=True)
+def test_calls_hold_lock(api):
+    api.py_aa_open_ext.return_value = (1, (0,) * 6)
+    a = pyaardvark.open(thread_safe=True)
+    assert isinstance(a, pyaardvark.ThreadSafeAardvark)
+
+    def is_owned(*args):
+        assert a.bus_lock()._is_owned()
+        return 100
+    api.py_aa_i2c_bitrate.side_effect = is_owned
+    api.py_aa_spi_master_ss_polarity.side_effect = is_owned
+    a.i2c_bitrate = 100
+    assert a.i2c_bitrate == 100
+    a.spi_ss_polarity(SPI_SS_ACTIVE_LOW)
+    assert not a.bus_lock()._is_owned()
+
+def test_bus_lock():
+    sim.reset()
+    adapter = sim.add_adapter()
+    adapter.attach_i2c(0x20, sim.I2CRegisterFile(data=range(256)))
+    errors = list()
+
+    with pyaardvark.open(backend='sim', thread_safe=True) as a:
+        def worker(offset):
+            try:
+                for _ in range(200):
+                    with a.bus_lock():
+                        a.i2c_master_write(0x20, bytes([offset]))
+                        data = a.i2c_master_read(0x20, 1)
+                    assert data == bytes([offset])
+                    assert a.i2c_master_write_read(0x20, bytes([offset]),
+                            1) == bytes([offset])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(i,))
+                for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    sim.reset()
+    assert errors == []
+
+def test_spi_slave_frames_concurrent(monkeypatch):
+    sim.reset()
+    adapter = sim.add_adapter()
+    adapter.attach_i2c(0x20, sim.I2CRegisterFile(data=range(256)))
+    frames = [bytes([i]) * (i % 5 + 1) for i in range(100)]
+    received = list()
+    errors = list()
+
+    with pyaardvark.open(backend='sim', thread_safe=True) as a:
+        spi_slave_read = sim.py_aa_spi_slave_read
+        def locked_read(*args):
+            assert a.bus_lock()._is_owned()
+            return spi_slave_read(*args)
+        monkeypatch.setattr(sim, 'py_aa_spi_slave_read', locked_read)
+        a.enable_spi_slave()
+
+        def receiver():
+            try:
+                for frame in a.spi_slave_frames():
+                    received.append(bytes(frame))
+                    if len(received) == len(frames):
+                        break
+            except Exception as e:
+                errors.append(e)
+
+        def transfers():
+            try:
+                for i in range(100):
+                    assert a.i2c_master_write_read(0x20, bytes([i]),
+                            1) == bytes([i])
+                    if i % 10 == 0:
+                        adapter.spi_master_transfer(frames[i // 10])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=receiver),
+                threading.Thread(target=transfers)]
+        for t in threads:
+            t.start()
+        # the receiver waits for frames and must not block the transfers
+        threads[1].join(5)
+        assert not threads[1].is_alive()
+        for frame in frames[10:]:
+            adapter.spi_master_transfer(frame)
+        threads[0].join(5)
+        assert not threads[0].is_alive()
+
+    sim.reset()
+    assert errors == []
+    assert received == frames